@@ -0,0 +1,26 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+from abugida.core import (DELTA, CHEVRON, ARCH, LOOP, HOOK, BAR,
+                          SHAPE_NAMES, SHAPES, CON, VOW, IXDICT, VOICES,
+                          GLYPHS, BOUNDARY, Phrase, syl_phrase,
+                          word_phrase, line_phrase,
+                          syl, word, line, Prosody, random_prosody,
+                          iter_prosody,
+                          random_consonants, random_voice, Session,
+                          Translator, translator,
+                          translate, swap, swap_text)
@@ -0,0 +1,173 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Glyph atlas rendering for the display window. Requires PyQt5.
+
+There are only 24 syllabics, so each font and size is rasterized once
+into an atlas pixmap. A phrase is then laid out on a fixed advance per
+glyph, wrapped at spaces, and painted with a single
+``drawPixmapFragments`` call instead of being shaped and laid out as
+text on every update.
+"""
+
+import math
+
+from PyQt5.QtCore import QPointF, QRectF, Qt
+from PyQt5.QtGui import QFontMetricsF, QPainter, QPalette, QPixmap
+from PyQt5.QtWidgets import QWidget
+
+from abugida.core import SHAPES
+
+SYLLABICS = ''.join(''.join(shape) for shape in SHAPES)
+
+
+class GlyphAtlas:
+    """The syllabics of one font and colour, pre-rendered side by side."""
+
+    def __init__(self, font, color, dpr=1.0, chars=SYLLABICS):
+        metrics = QFontMetricsF(font)
+        self.font = font
+        self.advance = math.ceil(max(metrics.horizontalAdvance(c)
+                                     for c in chars))
+        self.space = metrics.horizontalAdvance(' ')  # includes wordSpacing
+        self.height = math.ceil(metrics.height())
+        self.pixmap = QPixmap(math.ceil(self.advance * len(chars) * dpr),
+                              math.ceil(self.height * dpr))
+        self.pixmap.setDevicePixelRatio(dpr)
+        self.pixmap.fill(Qt.transparent)
+        self.rects = {}
+        painter = QPainter(self.pixmap)
+        painter.setFont(font)
+        painter.setPen(color)
+        for i, c in enumerate(chars):
+            x = i * self.advance
+            # centre each glyph in its cell
+            painter.drawText(
+                QPointF(x + (self.advance - metrics.horizontalAdvance(c)) / 2,
+                        metrics.ascent()), c)
+            self.rects[c] = QRectF(x * dpr, 0, self.advance * dpr,
+                                   self.height * dpr)
+        painter.end()
+
+    def layout(self, text, width):
+        """Return the lines of `text` as lists of words, wrapped to
+        `width` pixels; a word too long for a line is split.
+        """
+        per_line = max(1, int(width // self.advance))
+        lines = []
+        line, used = [], 0.0
+        for word in text.split():
+            while len(word) > per_line:
+                if line:
+                    lines.append(line)
+                    line, used = [], 0.0
+                lines.append([word[:per_line]])
+                word = word[per_line:]
+            w = len(word) * self.advance
+            if line and used + self.space + w > width:
+                lines.append(line)
+                line, used = [], 0.0
+            if line:
+                used += self.space
+            line.append(word)
+            used += w
+        if line:
+            lines.append(line)
+        return lines
+
+    def fragments(self, text, width, height):
+        """Return pixmap fragments drawing `text` centred in a
+        `width` x `height` area, plus (point, char) for anything not in
+        the atlas.
+        """
+        lines = self.layout(text, width)
+        frags = []
+        missing = []
+        y = (height - len(lines) * self.height) / 2 + self.height / 2
+        half = self.advance / 2
+        for words in lines:
+            line_width = (sum(len(w) for w in words) * self.advance +
+                          (len(words) - 1) * self.space)
+            x = (width - line_width) / 2
+            for word in words:
+                for c in word:
+                    rect = self.rects.get(c)
+                    if rect is None:
+                        missing.append((QPointF(x, y), c))
+                    else:
+                        frags.append(QPainter.PixmapFragment.create(
+                            QPointF(x + half, y), rect))
+                    x += self.advance
+                x += self.space
+            y += self.height
+        return frags, missing
+
+
+_atlases = {}
+
+
+def atlas(font, color, dpr=1.0):
+    """Return the cached GlyphAtlas for `font`, `color` and pixel ratio."""
+    key = (font.key(), font.wordSpacing(), color.rgba(), dpr)
+    if key not in _atlases:
+        _atlases[key] = GlyphAtlas(font, color, dpr)
+    return _atlases[key]
+
+
+class GlyphLabel(QWidget):
+    """Drop-in for the display's centred, word-wrapped QLabel."""
+
+    def __init__(self, text='', parent=None):
+        super().__init__(parent)
+        self._text = text
+        self._frags = None
+
+    def text(self):
+        return self._text
+
+    def setText(self, text):
+        self._text = text
+        self._frags = None
+        self.update()
+
+    def atlas(self):
+        return atlas(self.font(), self.palette().color(QPalette.WindowText),
+                     self.devicePixelRatioF())
+
+    def resizeEvent(self, event):
+        self._frags = None
+        super().resizeEvent(event)
+
+    def changeEvent(self, event):
+        self._frags = None  # font, palette or screen may have changed
+        super().changeEvent(event)
+
+    def paintEvent(self, event):
+        glyphs = self.atlas()
+        if self._frags is None:
+            self._frags = glyphs.fragments(self._text, self.width(),
+                                           self.height())
+        frags, missing = self._frags
+        painter = QPainter(self)
+        painter.drawPixmapFragments(frags, glyphs.pixmap)
+        if missing:
+            painter.setFont(glyphs.font)
+            for point, c in missing:
+                painter.drawText(
+                    QRectF(point.x(), point.y() - glyphs.height / 2,
+                           glyphs.advance, glyphs.height),
+                    Qt.AlignCenter, c)
+        painter.end()
@@ -0,0 +1,528 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Benchmark suite for the headless core: ``python -m abugida.bench``.
+
+Each case reports throughput and per-call latency percentiles. Results
+can be saved as JSON and compared against an earlier run, failing when
+any case slows down by more than a threshold. Broadcast cases send
+phrases to subscribers over loopback, and display cases (which need
+PyQt5) time one offscreen frame of the display window, through QLabel
+and through the glyph atlas. Speech cases put a stub
+``espeak-ng`` (and a stub synthesis worker) on PATH, so they time process
+spawn and dispatch overhead rather than actual synthesis; the chorus
+case mixes parts from an in-process stub synthesizer.
+"""
+
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+from abugida import broadcast, core, index, models, speech
+from abugida.chorus import Chorus
+
+STUB_ESPEAK = '''#!/bin/sh
+exit 0
+'''
+
+STUB_WORKER = '''import json, sys
+print(json.dumps({"event": "ready"}), flush=True)
+for line in sys.stdin:
+    req = json.loads(line)
+    if "id" not in req:
+        continue  # a cancel: nothing is ever left to stop
+    print(json.dumps({"id": req["id"], "event": "start"}), flush=True)
+    print(json.dumps({"id": req["id"], "event": "done"}), flush=True)
+'''
+
+CONSONANTS = ('p', 't', 'k', 'm', 'n', 'l')
+VOICE = speech.Voice('m3', 50, 175, 10, 50)
+SEED = 0  # inputs and draws are seeded so runs are comparable
+FONT = Path(__file__).parent.parent/'fonts'/'FreeSans.ttf'
+DISPLAY_SIZE = (1084, 566)  # the display window inside its margins
+CHORUS = 4  # voices per speech.chorus phrase
+
+
+def sample_lines(n=256):
+    session = core.Session(SEED, ('sample',))
+    return [session.line() for _ in range(n)]
+
+
+def sample_phrases(n=256):
+    return [core.Phrase.from_text(cas) for cas in sample_lines(n)]
+
+
+class Stubs:
+    """Temporary directory holding the stub synthesizers."""
+
+    def __init__(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix='abugida-bench-')
+        path = Path(self._tmp.name)
+        self.espeak = path/speech.ESPEAK
+        self.espeak.write_text(STUB_ESPEAK)
+        self.espeak.chmod(0o755)
+        self.worker = path/'worker.py'
+        self.worker.write_text(STUB_WORKER)
+        self._path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self._tmp.name + os.pathsep + self._path
+
+    def close(self):
+        os.environ['PATH'] = self._path
+        self._tmp.cleanup()
+
+
+CASES = {}
+
+
+def case(name, kind='core', items=1):
+    """Register a case. The decorated function takes the Stubs and
+    returns the callable to time, plus an optional cleanup callable.
+    `items` is how many operations one call performs.
+    """
+    def register(setup):
+        CASES[name] = (setup, kind, items)
+        return setup
+    return register
+
+
+@case('gen.syl')
+def _syl(stubs):
+    return core.Session(SEED).syl, None
+
+
+@case('gen.word')
+def _word(stubs):
+    return core.Session(SEED).word, None
+
+
+@case('gen.line')
+def _line(stubs):
+    return core.Session(SEED).line, None
+
+
+@case('gen.line.phrase')
+def _line_phrase(stubs):
+    session = core.Session(SEED)
+    return lambda: session.phrase('line'), None
+
+
+MARKOV = {
+    'model': 'markov', 'order': 2,
+    'vowels': {'a': 3, 'e': 2, 'i': 2, 'o': 1},
+    'transitions': {'delta-a': {'chevron-i': 3, 'arch-o': 1},
+                    'chevron-i': {'delta-a': 2, 'arch-e': 1},
+                    'delta-a chevron-i': {'arch-a': 1}},
+}
+
+
+@case('gen.line.markov')
+def _line_markov(stubs):
+    model = models.model_from_config(MARKOV)
+    session = core.Session(SEED)
+    return lambda: session.generate('line', False, model), None
+
+
+@case('walk.line')
+def _walk_line(stubs):
+    return index.Walk('line', seed=SEED).__next__, None
+
+
+@case('bulk.line', items=1000)
+def _bulk_line(stubs):
+    try:
+        from abugida import bulk
+    except ImportError:
+        return None, None
+    rng = bulk.np.random.default_rng(SEED)
+    return lambda: bulk.generate(1000, 'line', rng=rng), None
+
+
+@case('stats.text', items=1000)
+def _stats_text(stubs):
+    try:
+        from abugida import stats
+    except ImportError:
+        return None, None
+    buf = ''.join(line + '\n' for line in sample_lines(1000)).encode()
+    return lambda: stats.count_tokens(stats.text_tokens(buf)), None
+
+
+@case('stats.binary', items=1000)
+def _stats_binary(stubs):
+    try:
+        from abugida import binlog, stats
+    except ImportError:
+        return None, None
+    entries = [binlog.encode_entry(cas, 'line', timestamp=0)
+               for cas in sample_lines(1000)]
+    starts = itertools.accumulate((len(e) for e in entries[:-1]),
+                                  initial=0)
+    offsets = b''.join(binlog.OFFSET.pack(n) for n in starts)
+    data = b''.join(entries)
+    return (lambda: stats.count_tokens(stats.binary_tokens(offsets, data)),
+            None)
+
+
+@case('prosody.line')
+def _prosody(stubs):
+    session = core.Session(SEED)
+    lines = itertools.cycle([core.translate(cas, CONSONANTS)[1]
+                             for cas in sample_lines()])
+    return lambda: session.random_prosody(next(lines)), None
+
+
+@case('prosody.phrase')
+def _prosody_phrase(stubs):
+    session = core.Session(SEED)
+    tr = core.translator(CONSONANTS)
+    phrases = itertools.cycle(sample_phrases())
+    return lambda: session.phrase_prosody(next(phrases), tr), None
+
+
+@case('prosody.batch', items=1000)
+def _prosody_batch(stubs):
+    session = core.Session(SEED)
+    lines = [core.translate(cas, CONSONANTS)[1] for cas in sample_lines()]
+    lines = (lines * (1000 // len(lines) + 1))[:1000]
+    return lambda: core.PROSODY.apply_many(lines, session.rng), None
+
+
+@case('translate.line')
+def _translate(stubs):
+    lines = itertools.cycle(sample_lines())
+    return lambda: core.translate(next(lines), CONSONANTS), None
+
+
+@case('translate.phrase')
+def _translate_phrase(stubs):
+    tr = core.translator(CONSONANTS)
+    phrases = itertools.cycle(sample_phrases())
+    return lambda: tr.translate(next(phrases)), None
+
+
+@case('swap.line')
+def _swap(stubs):
+    lines = itertools.cycle(sample_lines())
+    return lambda: core.swap(next(lines)), None
+
+
+@case('swap.phrase')
+def _swap_phrase(stubs):
+    phrases = itertools.cycle(sample_phrases())
+    return lambda: next(phrases).swapped(), None
+
+
+@case('speech.subprocess', kind='speech')
+def _speech_subprocess(stubs):
+    backend = speech.SubprocessSpeech(str(stubs.espeak))
+    return lambda: backend.speak(VOICE, "'pa:ti"), backend.close
+
+
+@case('speech.worker', kind='speech')
+def _speech_worker(stubs):
+    backend = speech.SpeechWorker([sys.executable, str(stubs.worker)])
+    backend.start()
+    return lambda: backend.speak(VOICE, "'pa:ti"), backend.close
+
+
+def _stub_wav(frames, rate=22050):
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(range(256)) * (frames * 2 // 256))
+    return out.getvalue()
+
+
+@case('speech.chorus', kind='speech', items=CHORUS)
+def _speech_chorus(stubs):
+    # 3 s parts of slightly different lengths from an in-process stub,
+    # so this times dispatch and mixing, per voice
+    wavs = {}
+
+    def synthesize(voice, text):
+        if voice not in wavs:
+            wavs[voice] = _stub_wav(3 * 22050 - 1000 * len(wavs))
+        return wavs[voice]
+    chorus = Chorus(CHORUS, synthesize=synthesize, rng=random.Random(SEED))
+    return lambda: chorus.synthesize(VOICE, "'pa:ti"), chorus.close
+
+
+_app = None  # the QApplication for display cases, kept alive
+
+
+def _display(glyph_atlas):
+    global _app
+    try:
+        from PyQt5.QtCore import Qt
+        from PyQt5.QtGui import QFont, QFontDatabase, QImage
+        from PyQt5.QtWidgets import QApplication, QLabel
+        from abugida.atlas import GlyphLabel
+    except ImportError:
+        return None, None
+    if QApplication.instance() is None:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        _app = QApplication([])
+    font = QFont()
+    font_id = QFontDatabase.addApplicationFont(str(FONT))
+    if font_id >= 0:
+        font = QFont(QFontDatabase.applicationFontFamilies(font_id)[0])
+    font.setPointSize(84)
+    font.setWordSpacing(30)
+    if glyph_atlas:
+        label = GlyphLabel()
+    else:
+        label = QLabel()
+        label.setAlignment(Qt.AlignCenter)
+        label.setWordWrap(True)
+    label.setFont(font)
+    label.resize(*DISPLAY_SIZE)
+    image = QImage(*DISPLAY_SIZE, QImage.Format_ARGB32_Premultiplied)
+    lines = itertools.cycle(sample_lines())
+
+    def fn():
+        label.setText(next(lines))
+        label.render(image)
+    return fn, label.deleteLater
+
+
+@case('display.label', kind='display')
+def _display_label(stubs):
+    return _display(False)
+
+
+@case('display.atlas', kind='display')
+def _display_atlas(stubs):
+    return _display(True)
+
+
+def _tcp_subscribers(publisher, n):
+    server = publisher.senders[0]
+    url = 'tcp://127.0.0.1:{}'.format(server.address[1])
+    subs = [broadcast.Subscriber(url, timeout=5) for _ in range(n)]
+    while len(server.clients) < n:
+        time.sleep(0.001)
+    return subs
+
+
+def _closing(*objs):
+    def close():
+        for obj in objs:
+            obj.close()
+    return close
+
+
+@case('broadcast.udp', kind='net')
+def _broadcast_udp(stubs):
+    sub = broadcast.Subscriber('udp://127.0.0.1:0', timeout=5)
+    pub = broadcast.Publisher(['udp://127.0.0.1:{}'.format(sub.address[1])])
+
+    def fn():
+        pub.publish("\u1403\u1431", 'pati')
+        sub.recv()
+    return fn, _closing(pub, sub)
+
+
+@case('broadcast.tcp', kind='net')
+def _broadcast_tcp(stubs):
+    pub = broadcast.Publisher(['tcp://127.0.0.1:0'])
+    sub, = _tcp_subscribers(pub, 1)
+
+    def fn():
+        pub.publish("\u1403\u1431", 'pati')
+        sub.recv()
+    return fn, _closing(pub, sub)
+
+
+@case('broadcast.fanout', kind='net', items=8)
+def _broadcast_fanout(stubs):
+    pub = broadcast.Publisher(['tcp://127.0.0.1:0'])
+    subs = _tcp_subscribers(pub, 8)
+
+    def fn():
+        pub.publish("\u1403\u1431", 'pati')
+        for sub in subs:
+            sub.recv()
+    return fn, _closing(pub, *subs)
+
+
+@case('broadcast.burst', kind='net', items=100)
+def _broadcast_burst(stubs):
+    pub = broadcast.Publisher(['tcp://127.0.0.1:0'])
+    sub, = _tcp_subscribers(pub, 1)
+
+    def fn():
+        for _ in range(100):
+            pub.publish("\u1403\u1431", 'pati')
+        for _ in range(100):
+            sub.recv()
+    return fn, _closing(pub, sub)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(q * len(sorted_values)))]
+
+
+def measure(fn, calls, items=1, warmup=10):
+    for _ in range(min(warmup, calls)):
+        fn()
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter_ns()
+        fn()
+        latencies.append(time.perf_counter_ns() - start)
+    latencies.sort()
+    total = sum(latencies) / 1e9
+    return {
+        'calls': calls,
+        'items': items,
+        'ops_per_sec': calls * items / total if total else float('inf'),
+        'mean_us': total / calls * 1e6,
+        'p50_us': percentile(latencies, 0.50) / 1e3,
+        'p90_us': percentile(latencies, 0.90) / 1e3,
+        'p99_us': percentile(latencies, 0.99) / 1e3,
+    }
+
+
+def run(names=None, calls=20000, speech_calls=50, display_calls=500,
+        repeat=3):
+    """Run the named cases, keeping each one's fastest of `repeat` runs
+    to damp noise from other load on the machine.
+    """
+    names = names or list(CASES)
+    stubs = Stubs()
+    results = {}
+    try:
+        for name in names:
+            setup, kind, items = CASES[name]
+            fn, cleanup = setup(stubs)
+            if fn is None:
+                continue  # optional dependency missing
+            try:
+                n = {'speech': speech_calls,
+                     'display': display_calls}.get(kind, calls)
+                runs = [measure(fn, max(1, n // items), items)
+                        for _ in range(repeat)]
+                results[name] = max(runs, key=lambda r: r['ops_per_sec'])
+            finally:
+                if cleanup:
+                    cleanup()
+    finally:
+        stubs.close()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return (name, old, new, change) for every case whose throughput
+    fell by more than `threshold` (a fraction) against `baseline`.
+    """
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = new['ops_per_sec'] / old['ops_per_sec'] - 1
+        if change < -threshold:
+            regressions.append((name, old['ops_per_sec'],
+                                new['ops_per_sec'], change))
+    return regressions
+
+
+def report(results, out=sys.stdout):
+    out.write('{:<20}{:>14}{:>11}{:>11}{:>11}\n'.format(
+        'case', 'ops/s', 'p50 us', 'p90 us', 'p99 us'))
+    for name, r in results.items():
+        out.write('{:<20}{:>14,.0f}{:>11.1f}{:>11.1f}{:>11.1f}\n'.format(
+            name, r['ops_per_sec'], r['p50_us'], r['p90_us'], r['p99_us']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m abugida.bench',
+        description='Benchmark generation, translation, prosody, '
+                    'broadcast, display and speech dispatch.')
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help='cases to run (default: all)')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list cases and exit')
+    parser.add_argument('-n', '--calls', type=int, default=20000,
+                        help='operations per core case (default: 20000)')
+    parser.add_argument('--speech-calls', type=int, default=50,
+                        help='calls per speech case (default: 50)')
+    parser.add_argument('--display-calls', type=int, default=500,
+                        help='frames per display case (default: 500)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case, the fastest is kept '
+                             '(default: 3)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed throughput drop against --compare, '
+                             'as a fraction (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (_, kind, _) in CASES.items():
+            print('{:<20}{}'.format(name, kind))
+        return 0
+    unknown = [c for c in args.cases if c not in CASES]
+    if unknown:
+        parser.error('unknown case(s): {}'.format(', '.join(unknown)))
+
+    results = run(args.cases, args.calls, args.speech_calls,
+                  args.display_calls, args.repeat)
+    report(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': datetime.datetime.now().astimezone()
+                .isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print('REGRESSION {}: {:,.0f} -> {:,.0f} ops/s ({:+.1%})'
+                  .format(name, old, new, change), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
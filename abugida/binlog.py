@@ -0,0 +1,330 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Compact binary phrase logs.
+
+A log is a data file plus an index file next to it (``path + '.idx'``).
+The data file starts with an 8 byte header (``b'ABGL'``, version, 3 zero
+bytes) followed by entries::
+
+    int64   timestamp, microseconds since the epoch
+    uint8   mode: 0 syl, 1 word, 2 line, 255 unknown
+    uint8   flags: bit 0 set for reflectionals
+    6*uint8 consonant per shape (SHAPE_NAMES order), as an index into
+            CON, 255 if unset
+    uint16  number of tokens
+    ...     tokens packed two per byte, high nibble first: 0-11 is
+            shape * 4 + vowel within the rotational or reflectional
+            group, 15 a word boundary
+
+All integers are little-endian. The index holds one uint64 data file
+offset per entry, so any entry can be found without scanning.
+"""
+
+import bisect
+import collections
+import datetime
+import mmap
+import os
+import struct
+import time
+
+from abugida.core import BOUNDARY as PHRASE_BOUNDARY
+from abugida.core import CON, GROUP, REFLECTIONALS, ROTATIONALS, Phrase
+
+MAGIC = b'ABGL'
+VERSION = 1
+FILE_HEADER = MAGIC + bytes([VERSION, 0, 0, 0])
+ENTRY = struct.Struct('<qBB6sH')
+OFFSET = struct.Struct('<Q')
+
+MODES = ('syl', 'word', 'line')
+CONSONANTS = list(CON)
+UNSET = 255
+BOUNDARY = 15
+MAX_TOKENS = 0xFFFF  # the token count is a uint16
+
+Entry = collections.namedtuple(
+    'Entry', 'time mode reflectionals consonants cas')
+
+# Phrase code -> token: the code within its group, BOUNDARY for spaces
+_TOKENS = bytes.maketrans(bytes(range(2 * GROUP)) + bytes([PHRASE_BOUNDARY]),
+                          bytes(c % GROUP for c in range(2 * GROUP)) +
+                          bytes([BOUNDARY]))
+_ROTATIONAL_CODES = bytes(range(GROUP))
+_REFLECTIONAL_CODES = bytes(range(GROUP, 2 * GROUP))
+
+
+def _decode_table(chars):
+    tokens = list(chars) + ['?'] * (BOUNDARY - len(chars)) + [' ']
+    return [tokens[b >> 4] + tokens[b & 15] for b in range(256)]
+
+
+# packed byte -> two characters, per group
+_DECODE = {False: _decode_table(ROTATIONALS),
+           True: _decode_table(REFLECTIONALS)}
+
+
+def index_path(path):
+    return str(path) + '.idx'
+
+
+def encode_entry(cas, mode=None, consonants=None, timestamp=None):
+    """Encode syllabic text or a Phrase as one log entry."""
+    if timestamp is None:
+        timestamp = time.time()
+    phrase = cas if isinstance(cas, Phrase) else Phrase.from_text(cas)
+    codes = phrase.codes
+    reflectionals = phrase.reflectionals
+    # the flag covers the whole entry, so one group only
+    if codes.translate(None, _ROTATIONAL_CODES if reflectionals
+                       else _REFLECTIONAL_CODES) != codes:
+        raise ValueError('phrase mixes rotationals and reflectionals')
+    if len(codes) > MAX_TOKENS:
+        raise ValueError('phrase too long for a log entry: {} tokens, at '
+                         'most {}'.format(len(codes), MAX_TOKENS))
+    tokens = codes.translate(_TOKENS)
+    if len(tokens) % 2:
+        tokens += bytes([BOUNDARY])
+    packed = bytes([hi << 4 | lo for hi, lo in zip(tokens[::2],
+                                                   tokens[1::2])])
+
+    mode_id = MODES.index(mode) if mode in MODES else UNSET
+    cons = bytes([CONSONANTS.index(c) if c in CON else UNSET
+                  for c in (consonants or ())]).ljust(6, bytes([UNSET]))
+    return ENTRY.pack(int(timestamp * 1_000_000), mode_id,
+                      1 if reflectionals else 0, cons, len(codes)) + packed
+
+
+def decode_entry(buf, offset=0):
+    """Return (Entry, offset of the next entry)."""
+    usecs, mode_id, flags, cons, n = ENTRY.unpack_from(buf, offset)
+    start = offset + ENTRY.size
+    end = start + (n + 1) // 2
+    table = _DECODE[bool(flags & 1)]
+    cas = ''.join([table[b] for b in buf[start:end]])[:n]
+    entry = Entry(
+        time=usecs / 1_000_000,
+        mode=MODES[mode_id] if mode_id < len(MODES) else None,
+        reflectionals=bool(flags & 1),
+        consonants=tuple(CONSONANTS[c] if c < len(CONSONANTS) else ''
+                         for c in cons),
+        cas=cas)
+    return entry, end
+
+
+class BinaryLogWriter:
+    """Appends entries to a binary log and its index.
+
+    An existing log is reconciled first: a missing or stale index is
+    completed from the data, as the reader would, and a torn final
+    entry is cut off, so new entries are indexed at the right offsets.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            self._reconcile()
+        elif os.path.exists(index_path(self.path)):
+            os.truncate(index_path(self.path), 0)
+        self._data = open(self.path, 'ab')
+        if self._data.tell() == 0:
+            self._data.write(FILE_HEADER)
+        self._index = open(index_path(self.path), 'ab')
+
+    def _reconcile(self):
+        with BinaryLogReader(self.path) as log:
+            n = len(log)
+            indexed = log._n_indexed
+            extra = list(log._extra)
+            end = len(FILE_HEADER)
+            if n:
+                end = decode_entry(log._data, log._offset(n - 1))[1]
+        if os.path.getsize(self.path) > end:
+            os.truncate(self.path, end)
+        with open(index_path(self.path), 'ab') as index:
+            index.truncate(indexed * OFFSET.size)
+            index.write(struct.pack('<{}Q'.format(len(extra)), *extra))
+
+    def write(self, cas, mode=None, consonants=None, timestamp=None):
+        # encode first: a phrase that can't be logged leaves no index entry
+        entry = encode_entry(cas, mode, consonants, timestamp)
+        self._index.write(OFFSET.pack(self._data.tell()))
+        self._data.write(entry)
+
+    def tell(self):
+        return self._data.tell()
+
+    def sync(self, fsync=True):
+        # data first, so the index never points past the end of the data
+        self._data.flush()
+        if fsync:
+            os.fsync(self._data.fileno())
+        self._index.flush()
+        if fsync:
+            os.fsync(self._index.fileno())
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class BinaryLogReader:
+    """Memory-mapped random access to a binary log.
+
+    Entries are read on demand, so archives much larger than RAM can be
+    opened. A missing or stale index is completed by scanning the data.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._data_file = open(self.path, 'rb')
+        size = os.fstat(self._data_file.fileno()).st_size
+        if size < len(FILE_HEADER):
+            raise ValueError('{}: not an abugida binary log'.format(path))
+        self._data = mmap.mmap(self._data_file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise ValueError('{}: not an abugida binary log'.format(path))
+        if self._data[len(MAGIC)] != VERSION:
+            raise ValueError('{}: unsupported version {}'.format(
+                path, self._data[len(MAGIC)]))
+        self._index = None
+        self._extra = []  # offsets found by scanning past the index
+        self._load_index(size)
+
+    def _load_index(self, size):
+        n_indexed = 0
+        try:
+            self._index_file = open(index_path(self.path), 'rb')
+        except FileNotFoundError:
+            self._index_file = None
+        else:
+            idx_size = os.fstat(self._index_file.fileno()).st_size
+            n_indexed = idx_size // OFFSET.size
+            if n_indexed:
+                self._index = mmap.mmap(self._index_file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+        self._n_indexed = n_indexed
+
+        # trust the index only up to the last entry that fits the data
+        while self._n_indexed:
+            last = self._offset(self._n_indexed - 1)
+            if (last + ENTRY.size <= size and
+                    decode_entry(self._data, last)[1] <= size):
+                break
+            self._n_indexed -= 1
+
+        if self._n_indexed:
+            pos = decode_entry(self._data, self._offset(
+                self._n_indexed - 1))[1]
+        else:
+            pos = len(FILE_HEADER)
+        while pos + ENTRY.size <= size:
+            end = decode_entry(self._data, pos)[1]
+            if end > size:
+                break  # torn final write
+            self._extra.append(pos)
+            pos = end
+
+    def _offset(self, n):
+        if n < self._n_indexed:
+            return OFFSET.unpack_from(self._index, n * OFFSET.size)[0]
+        return self._extra[n - self._n_indexed]
+
+    def __len__(self):
+        return self._n_indexed + len(self._extra)
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError('entry index out of range')
+        return decode_entry(self._data, self._offset(n))[0]
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def time(self, n):
+        return ENTRY.unpack_from(self._data, self._offset(n))[0] / 1_000_000
+
+    def find_time(self, t):
+        """Index of the first entry logged at or after `t`."""
+        if isinstance(t, datetime.datetime):
+            t = t.timestamp()
+        return bisect.bisect_left(_Times(self), t)
+
+    def between(self, start=None, end=None):
+        """Iterate entries with start <= time < end (datetimes or epoch
+        seconds). Entries are assumed to be in time order, as written.
+        """
+        first = 0 if start is None else self.find_time(start)
+        last = len(self) if end is None else self.find_time(end)
+        for n in range(first, last):
+            yield self[n]
+
+    def iter_text(self, start=0, stop=None):
+        for n in range(start, len(self) if stop is None else stop):
+            yield self[n].cas
+
+    def raw(self, start=0, stop=None):
+        """Undecoded entries start..stop, for bulk readers.
+
+        Returns (offsets, data): the entry offsets as packed uint64s, in
+        the index file layout, and the data bytes from the first entry to
+        the end of the last.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return b'', b''
+        indexed = min(stop, self._n_indexed)
+        offsets = b''
+        if start < indexed:
+            offsets = self._index[start * OFFSET.size:indexed * OFFSET.size]
+        extra = self._extra[max(start - self._n_indexed, 0):
+                            max(stop - self._n_indexed, 0)]
+        offsets += struct.pack('<{}Q'.format(len(extra)), *extra)
+        first = self._offset(start)
+        end = decode_entry(self._data, self._offset(stop - 1))[1]
+        return offsets, self._data[first:end]
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+        if self._index_file is not None:
+            self._index_file.close()
+        self._data.close()
+        self._data_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Times:
+    # sequence view of entry times for bisect
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, n):
+        return self.reader.time(n)
@@ -0,0 +1,279 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Fan-out of displayed phrases to remote display clients.
+
+Every phrase shown by the control station is published as a Message
+(sequence number, time, action, syllabics, IPA) encoded as one line of
+UTF-8 JSON. Two transports are supported, chosen by URL:
+
+``udp://239.255.42.99:5007``
+    One datagram per message. A multicast group reaches any number of
+    listeners on the LAN at once; a unicast or broadcast address works
+    too. Lost datagrams show up as gaps in the sequence numbers.
+``tcp://0.0.0.0:5008``
+    The publisher listens and each subscriber connects. Messages are
+    newline-delimited, and a new subscriber is sent the current phrase
+    straight away. A subscriber that falls too far behind to take a
+    message without blocking is disconnected, so one stalled tablet
+    cannot hold up the others.
+"""
+
+import collections
+import ipaddress
+import json
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+
+DEFAULT_PORT = 5007
+MULTICAST_TTL = 1
+MAX_DATAGRAM = 65507
+
+Message = collections.namedtuple('Message', 'seq time action cas ipa')
+
+
+def encode(message):
+    return (json.dumps(message._asdict(), ensure_ascii=False) + '\n') \
+        .encode('utf-8')
+
+
+def decode(data):
+    return Message(**json.loads(data))
+
+
+def parse_url(url):
+    """Return (scheme, host, port) for a udp:// or tcp:// URL."""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('udp', 'tcp'):
+        raise ValueError('unsupported URL {!r}, use udp://host:port or '
+                         'tcp://host:port'.format(url))
+    port = DEFAULT_PORT if parts.port is None else parts.port
+    return parts.scheme, parts.hostname or '', port
+
+
+def is_multicast(host):
+    try:
+        return ipaddress.ip_address(host).is_multicast
+    except ValueError:
+        return False
+
+
+class UdpSender:
+    def __init__(self, host, port, ttl=MULTICAST_TTL):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if is_multicast(host):
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+                                 ttl)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP,
+                                 1)
+        else:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def send(self, data):
+        try:
+            self.sock.sendto(data, self.address)
+        except OSError:
+            pass  # datagrams are best effort; the sequence shows the gap
+
+    def close(self):
+        self.sock.close()
+
+
+class TcpServer:
+    """Accepts subscribers and writes every message to each of them."""
+
+    def __init__(self, host, port):
+        self.sock = socket.create_server((host, port))
+        self.address = self.sock.getsockname()
+        self.clients = []
+        self.last = None
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # closed
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.setblocking(False)
+            with self.lock:
+                if self.last is None or self._write(conn, self.last):
+                    self.clients.append(conn)
+
+    def _write(self, conn, data):
+        try:
+            if conn.send(data) == len(data):
+                return True
+        except OSError:
+            pass
+        conn.close()
+        return False
+
+    def send(self, data):
+        with self.lock:
+            self.last = data
+            self.clients = [c for c in self.clients if self._write(c, data)]
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # wakes the accept thread
+        except OSError:
+            pass
+        self.sock.close()
+        self._thread.join()
+        with self.lock:
+            for conn in self.clients:
+                conn.close()
+            self.clients.clear()
+
+
+def open_sender(url):
+    scheme, host, port = parse_url(url)
+    if scheme == 'udp':
+        return UdpSender(host or '127.0.0.1', port)
+    return TcpServer(host, port)
+
+
+class Publisher:
+    """Numbers phrases and sends each one on every transport.
+
+    ``publish()`` never blocks on a subscriber, so it is safe to call
+    from the GUI thread.
+    """
+
+    def __init__(self, urls):
+        self.senders = [open_sender(url) for url in urls]
+        self.seq = 0
+
+    def publish(self, cas, ipa, action='generate'):
+        self.seq += 1
+        data = encode(Message(self.seq, time.time(), action, cas, ipa))
+        for sender in self.senders:
+            sender.send(data)
+        return self.seq
+
+    def close(self):
+        for sender in self.senders:
+            sender.close()
+
+
+class Subscriber:
+    """Receives Messages from a publisher URL.
+
+    Iterating yields messages until the connection is closed; with a
+    `timeout`, ``recv()`` raises socket.timeout when nothing arrives.
+    Anything that does not decode as a Message is counted in `dropped`
+    and skipped.
+    """
+
+    def __init__(self, url, timeout=None):
+        self.scheme, host, port = parse_url(url)
+        if self.scheme == 'udp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                # several clients on one machine can share a group
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT,
+                                     1)
+            if is_multicast(host):
+                self.sock.bind(('', port))
+                group = struct.pack('4s4s', socket.inet_aton(host),
+                                    socket.inet_aton('0.0.0.0'))
+                self.sock.setsockopt(socket.IPPROTO_IP,
+                                     socket.IP_ADD_MEMBERSHIP, group)
+            else:
+                self.sock.bind((host, port))
+            self.file = None
+        else:
+            self.sock = socket.create_connection((host or '127.0.0.1', port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.file = self.sock.makefile('rb')
+        self.sock.settimeout(timeout)
+        self.address = self.sock.getsockname()
+        self.dropped = 0
+
+    def recv(self):
+        """Return the next Message, or None if the publisher went away."""
+        while True:
+            if self.file is None:
+                data = self.sock.recv(MAX_DATAGRAM)
+            else:
+                data = self.file.readline()
+                if not data:
+                    return None
+            try:
+                return decode(data)
+            except (ValueError, TypeError):
+                self.dropped += 1  # stray or truncated datagram
+
+    def __iter__(self):
+        while True:
+            message = self.recv()
+            if message is None:
+                return
+            yield message
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Stats:
+    """Counts received, missed and undecodable messages and the one-way
+    latency of the last `window` messages.
+
+    Latency compares the publisher's clock with ours, so it is only
+    meaningful on the same machine or with synchronised clocks.
+    """
+
+    def __init__(self, window=10000):
+        self.received = 0
+        self.missed = 0
+        self.dropped = 0
+        self.last_seq = None
+        self.latencies = collections.deque(maxlen=window)
+
+    def add(self, message, now=None):
+        now = time.time() if now is None else now
+        if self.last_seq is not None and message.seq > self.last_seq + 1:
+            self.missed += message.seq - self.last_seq - 1
+        self.last_seq = message.seq
+        self.received += 1
+        self.latencies.append(now - message.time)
+
+    def summary(self):
+        lat = sorted(self.latencies)
+        if not lat:
+            return 'no messages'
+        return ('{} received, {} missed, {} dropped, latency p50 {:.2f} '
+                'ms, p99 {:.2f} ms'.format(
+                    self.received, self.missed, self.dropped,
+                    lat[len(lat) // 2] * 1000,
+                    lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000))
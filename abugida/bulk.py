@@ -0,0 +1,162 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Vectorized bulk phrase generation. Requires NumPy.
+
+Draws the same distributions as ``core.syl``/``word``/``line`` for many
+phrases at once: 1 word of 1 syllable, 1 word of 2-6 syllables, or 2-5
+words of 2-6 syllables, with shape and vowel uniform per syllable.
+With a ``models.Model`` the lengths and syllables follow that model
+instead, sampled from its alias tables for all words at once.
+"""
+
+import numpy as np
+
+from abugida.core import GLYPHS, GROUP, Session
+from abugida.models import UNIFORM
+
+# code -> code point of its glyph, for rendering whole batches at once
+CODEPOINTS = np.array([ord(c) for c in GLYPHS], dtype='<u4')
+
+WORD_LEN = (2, 6)
+LINE_LEN = (2, 5)
+
+
+class PhraseBatch:
+    """Integer-coded phrases: one shape/vowel pair per syllable.
+
+    ``word_lengths`` gives syllables per word and ``phrase_lengths`` words
+    per phrase, both in generation order.
+    """
+
+    def __init__(self, shape, vowel, word_lengths, phrase_lengths):
+        self.shape = shape
+        self.vowel = vowel
+        self.word_lengths = word_lengths
+        self.phrase_lengths = phrase_lengths
+
+    def __len__(self):
+        return len(self.phrase_lengths)
+
+    @property
+    def codes(self):
+        return self.shape * 4 + self.vowel
+
+
+def _rng(rng):
+    # a NumPy Generator, a core.Session, or a seed for default_rng
+    if isinstance(rng, np.random.Generator):
+        return rng
+    if isinstance(rng, Session):
+        return np.random.default_rng(rng.entropy)
+    return np.random.default_rng(rng)
+
+
+def _draw(table, size, rng):
+    # vectorized AliasTable.sample
+    prob = np.asarray(table.prob)
+    alias = np.asarray(table.alias)
+    u = rng.random(size) * len(prob)
+    i = np.minimum(u.astype(np.int64), len(prob) - 1)
+    return np.asarray(table.values)[np.where(u - i < prob[i], i, alias[i])]
+
+
+def _model_codes(model, word_lengths, rng):
+    # step through syllable positions, drawing for every word that is
+    # long enough from the alias table of its current context
+    levels = [(np.array([t.prob for t in level]),
+               np.array([t.alias for t in level]))
+              for level in model.tables]
+    span = GROUP ** model.order
+    starts = np.cumsum(word_lengths) - word_lengths
+    codes = np.empty(int(word_lengths.sum()), dtype=np.uint8)
+    ctx = np.zeros(len(word_lengths), dtype=np.int64)
+    for j in range(int(word_lengths.max(initial=0))):
+        active = np.flatnonzero(word_lengths > j)
+        prob, alias = levels[min(j, model.order)]
+        c = ctx[active]
+        u = rng.random(len(active)) * GROUP
+        i = np.minimum(u.astype(np.int64), GROUP - 1)
+        code = np.where(u - i < prob[c, i], i, alias[c, i])
+        codes[starts[active] + j] = code
+        ctx[active] = (c * GROUP + code) % span
+    return codes
+
+
+def generate_codes(n, mode='line', rng=None, model=None):
+    rng = _rng(rng)
+    if model is not None and model is not UNIFORM:
+        return _generate_model_codes(n, mode, rng, model)
+    if mode == 'syl':
+        phrase_lengths = np.ones(n, dtype=np.int64)
+        word_lengths = np.ones(n, dtype=np.int64)
+    elif mode == 'word':
+        phrase_lengths = np.ones(n, dtype=np.int64)
+        word_lengths = rng.integers(WORD_LEN[0], WORD_LEN[1] + 1, size=n)
+    elif mode == 'line':
+        phrase_lengths = rng.integers(LINE_LEN[0], LINE_LEN[1] + 1, size=n)
+        word_lengths = rng.integers(WORD_LEN[0], WORD_LEN[1] + 1,
+                                    size=int(phrase_lengths.sum()))
+    else:
+        raise ValueError('unknown mode {!r}'.format(mode))
+
+    n_syl = int(word_lengths.sum())
+    shape = rng.integers(0, 3, size=n_syl, dtype=np.uint8)
+    vowel = rng.integers(0, 4, size=n_syl, dtype=np.uint8)
+    return PhraseBatch(shape, vowel, word_lengths, phrase_lengths)
+
+
+def _generate_model_codes(n, mode, rng, model):
+    ones = np.ones(n, dtype=np.int64)
+    if mode == 'syl':
+        phrase_lengths, word_lengths = ones, ones
+    elif mode == 'word':
+        phrase_lengths = ones
+        word_lengths = _draw(model.word_lengths, n, rng)
+    elif mode == 'line':
+        phrase_lengths = _draw(model.line_lengths, n, rng)
+        word_lengths = _draw(model.word_lengths, int(phrase_lengths.sum()),
+                             rng)
+    else:
+        raise ValueError('unknown mode {!r}'.format(mode))
+    codes = _model_codes(model, word_lengths, rng)
+    return PhraseBatch(codes // 4, codes % 4, word_lengths, phrase_lengths)
+
+
+def render_text(batch, reflectionals=False):
+    """Render every phrase in `batch` as one newline-terminated string."""
+    n_syl = len(batch.shape)
+    n_words = len(batch.word_lengths)
+    # each word is followed by one separator: a space, or a newline
+    # after the last word of a phrase
+    buf = np.empty(n_syl + n_words, dtype='<u4')
+    word_ends = np.cumsum(batch.word_lengths)
+    word_id = np.repeat(np.arange(n_words), batch.word_lengths)
+    offset = GROUP if reflectionals else 0
+    buf[np.arange(n_syl) + word_id] = CODEPOINTS[batch.codes + offset]
+    sep = np.full(n_words, ord(' '), dtype='<u4')
+    sep[np.cumsum(batch.phrase_lengths) - 1] = ord('\n')
+    buf[word_ends + np.arange(n_words)] = sep
+    return buf.tobytes().decode('utf-32-le')
+
+
+def render(batch, reflectionals=False):
+    return render_text(batch, reflectionals).split('\n')[:-1]
+
+
+def generate(n, mode='line', reflectionals=False, rng=None, model=None):
+    return render(generate_codes(n, mode, rng, model), reflectionals)
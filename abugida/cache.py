@@ -0,0 +1,145 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Two-level LRU cache of rendered speech audio."""
+
+import collections
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+
+def default_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home()/'.cache'
+    return Path(base)/'abugida'/'speech'
+
+
+def cache_key(voice, text):
+    """Key for one (voice, pitch, speed, gap, amplitude, text) render."""
+    return tuple(voice) + (text,)
+
+
+class AudioCache:
+    """WAV data by cache key: a bounded in-memory LRU in front of a
+    directory of files, each level evicting least recently used entries
+    once its byte limit is exceeded.
+    """
+
+    def __init__(self, directory=None, memory_limit=32 << 20,
+                 disk_limit=512 << 20):
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.directory = Path(directory) if directory else default_dir()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.counters = collections.Counter(
+            memory_hits=0, disk_hits=0, misses=0,
+            memory_evictions=0, disk_evictions=0)
+
+        # files carry their recency in mtime across runs
+        self._disk = collections.OrderedDict()
+        self._disk_size = 0
+        files = sorted(self.directory.glob('*.wav'),
+                       key=lambda p: p.stat().st_mtime)
+        for p in files:
+            size = p.stat().st_size
+            self._disk[p.name] = size
+            self._disk_size += size
+        with self._lock:
+            self._evict_disk()
+
+    def _filename(self, key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.wav'
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return data
+
+            name = self._filename(key)
+            if name in self._disk:
+                path = self.directory/name
+                try:
+                    data = path.read_bytes()
+                    os.utime(path)
+                except OSError:
+                    self._drop_file(name)
+                else:
+                    self._disk.move_to_end(name)
+                    self.counters['disk_hits'] += 1
+                    self._put_memory(key, data)
+                    return data
+
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key, data):
+        with self._lock:
+            self._put_memory(key, data)
+            name = self._filename(key)
+            tmp = self.directory/(name + '.tmp')
+            try:
+                tmp.write_bytes(data)
+                os.replace(tmp, self.directory/name)
+            except OSError:
+                return
+            self._disk_size += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            self._evict_disk()
+
+    def _put_memory(self, key, data):
+        self._memory_size += len(data) - len(self._memory.pop(key, b''))
+        self._memory[key] = data
+        while self._memory_size > self.memory_limit and len(self._memory) > 1:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+            self.counters['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_limit and self._disk:
+            name = next(iter(self._disk))
+            self._drop_file(name)
+            self.counters['disk_evictions'] += 1
+
+    def _drop_file(self, name):
+        self._disk_size -= self._disk.pop(name)
+        try:
+            (self.directory/name).unlink()
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters,
+                        memory_entries=len(self._memory),
+                        memory_bytes=self._memory_size,
+                        disk_entries=len(self._disk),
+                        disk_bytes=self._disk_size)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            for name in list(self._disk):
+                self._drop_file(name)
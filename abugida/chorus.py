@@ -0,0 +1,152 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Polyphonic speech: one phrase in several voices, mixed to one WAV.
+
+A Chorus renders each part with ``espeak-ng --stdout`` on its own
+thread pool, whose size is a hard cap on synthesizer processes however
+many phrases are spoken at once, and mixes the parts sample by sample
+into a single stream for one player. Parts that run longer than the
+others play out alone. The sum is scaled down only if it would clip.
+"""
+
+import array
+import concurrent.futures
+import functools
+import io
+import itertools
+import os
+import random
+import sys
+
+from abugida import speech
+from abugida.core import VOICES
+from abugida.render import WavSink, parse_wav
+
+MAX_SAMPLE = 32767
+
+
+def _samples(pcm):
+    samples = array.array('h')
+    samples.frombytes(pcm)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+
+def _mix_python(pcms):
+    sums = list(map(sum, itertools.zip_longest(
+        *(_samples(pcm) for pcm in pcms), fillvalue=0)))
+    peak = max(map(abs, sums), default=0)
+    if peak > MAX_SAMPLE:
+        gain = MAX_SAMPLE / peak
+        sums = [int(s * gain) for s in sums]
+    out = array.array('h', sums)
+    if sys.byteorder == 'big':
+        out.byteswap()
+    return out.tobytes()
+
+
+def _mix_numpy(np, pcms):
+    parts = [np.frombuffer(pcm, '<i2') for pcm in pcms]
+    acc = np.zeros(max(map(len, parts), default=0), np.int32)
+    for part in parts:
+        acc[:len(part)] += part
+    peak = int(np.abs(acc).max(initial=0))
+    if peak > MAX_SAMPLE:
+        acc = acc * (MAX_SAMPLE / peak)
+    return acc.astype('<i2').tobytes()
+
+
+@functools.lru_cache(maxsize=None)
+def _mixer():
+    # numpy is imported on the first mix rather than with the GUI, and
+    # is optional: without it the mix runs about 100 times slower
+    try:
+        import numpy
+    except ImportError:
+        return _mix_python
+    return functools.partial(_mix_numpy, numpy)
+
+
+def mix(wavs):
+    """Mix 16-bit WAV data of one format into a single WAV."""
+    fmt = None
+    pcms = []
+    for data in wavs:
+        part_fmt, pcm = parse_wav(data)
+        if fmt is None:
+            fmt = part_fmt
+        elif part_fmt != fmt:
+            raise ValueError('cannot mix {} with {}'.format(part_fmt, fmt))
+        pcms.append(pcm)
+    if fmt is None:
+        raise ValueError('nothing to mix')
+    if fmt.width != 2:
+        raise ValueError('only 16-bit WAV can be mixed')
+    out = io.BytesIO()
+    sink = WavSink(out, fmt)
+    sink.write(_mixer()(pcms))
+    sink.close()
+    return out.getvalue()
+
+
+class Chorus:
+    """Speaks in the given voice plus ``size - 1`` others.
+
+    The other parts take different voice variants, with pitch and speed
+    spread around the lead voice; ``reshuffle()`` draws a new set.
+    ``synthesize(voice, text)`` has the signature of speech.synthesize,
+    so a Chorus can stand in for it, e.g. in a Renderer or Lookahead.
+    """
+
+    def __init__(self, size=3, workers=None, synthesize=speech.synthesize,
+                 rng=random):
+        if size < 1:
+            raise ValueError('a chorus needs at least one voice')
+        self.size = size
+        self.workers = workers or min(size, os.cpu_count() or 1)
+        self._synthesize = synthesize
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix='chorus')
+        self.reshuffle(rng)
+
+    def reshuffle(self, rng=random):
+        # (variant, pitch offset, speed factor) for each extra part
+        variants = rng.sample(VOICES, self.size - 1)
+        self.parts = [(v, rng.randint(-30, 30), rng.uniform(0.8, 1.25))
+                      for v in variants]
+
+    def voices(self, voice):
+        """Return the Voice of every part, `voice` leading."""
+        return [voice] + [
+            voice._replace(voice=variant,
+                           pitch=min(99, max(0, voice.pitch + pitch)),
+                           speed=min(450, max(80, round(voice.speed *
+                                                        speed))))
+            for variant, pitch, speed in self.parts]
+
+    def synthesize(self, voice, text):
+        futures = [self._pool.submit(self._synthesize, v, text)
+                   for v in self.voices(voice)]
+        try:
+            return mix([future.result() for future in futures])
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
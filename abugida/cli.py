@@ -0,0 +1,642 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Headless command-line interface: ``python -m abugida``."""
+
+import argparse
+import datetime
+import functools
+import itertools
+import json
+import os
+import sys
+import time
+
+from abugida import render, speech, tempo
+from abugida.binlog import BinaryLogReader
+from abugida.broadcast import Stats, Subscriber
+from abugida.chorus import Chorus
+from abugida.core import (CON, GENERATORS, SHAPE_NAMES, Phrase, Session,
+                          swap_text, translator)
+from abugida.corpus import (ALL_COLUMNS, COLUMNS, ROWS_PER_WRITE, format_rows,
+                            generate_corpus, write_phrases)
+from abugida.index import PhraseSpace, Walk
+from abugida.models import load_model
+
+CHUNK_SIZE = 1 << 20  # characters per read when converting whole files
+
+
+def parse_consonants(s):
+    # 'random' is resolved later from the seeded session
+    if s == 'random':
+        return None
+    consonants = [c.strip() for c in s.split(',')]
+    if len(consonants) != len(SHAPE_NAMES):
+        raise argparse.ArgumentTypeError(
+            'expected {} comma-separated consonants ({}), got {}'
+            .format(len(SHAPE_NAMES), ', '.join(SHAPE_NAMES),
+                    len(consonants)))
+    for c in consonants:
+        if c not in CON:
+            raise argparse.ArgumentTypeError(
+                'unknown consonant {!r}, choose from: {}'
+                .format(c, ' '.join(CON)))
+    return consonants
+
+
+def parse_columns(s):
+    columns = [c.strip() for c in s.split(',')]
+    for c in columns:
+        if c not in ALL_COLUMNS:
+            raise argparse.ArgumentTypeError(
+                'unknown column {!r}, choose from: {}'
+                .format(c, ', '.join(ALL_COLUMNS)))
+    return columns
+
+
+def parse_model(path):
+    try:
+        return load_model(path)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def open_input(path):
+    if path is None or path == '-':
+        return sys.stdin
+    return open(path, encoding='utf-8')
+
+
+def open_output(path):
+    if path is None or path == '-':
+        return sys.stdout
+    return open(path, 'w', encoding='utf-8')
+
+
+def parse_stream(s):
+    return tuple(int(k) if k.isdigit() else k for k in s.split('/') if k)
+
+
+def cmd_generate(args):
+    session = Session(args.seed, args.stream)
+    consonants = args.consonants or session.random_consonants()
+    out = open_output(args.output)
+    try:
+        write_phrases(out, session, args.mode, args.count, consonants,
+                      args.reflectionals, args.columns, args.model)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def cmd_corpus(args):
+    start = time.perf_counter()
+    try:
+        manifest = generate_corpus(
+            args.directory, args.count, args.mode, args.shards, args.seed,
+            args.consonants, args.reflectionals, args.columns, args.workers,
+            args.model)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('abugida corpus: {}\n'.format(e))
+        return 1
+    elapsed = time.perf_counter() - start
+    sys.stderr.write('{:,} phrases in {} shards, {:.1f}s ({:,.0f}/s), '
+                     'seed {}\n'.format(manifest['count'],
+                                        len(manifest['shards']), elapsed,
+                                        manifest['count'] / elapsed,
+                                        manifest['seed']))
+    return 0
+
+
+def cmd_swap(args):
+    reflectionals = {'ref': True, 'rot': False, 'toggle': None}[args.to]
+    src = open_input(args.input)
+    out = open_output(args.output)
+    try:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(swap_text(chunk, reflectionals))
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def parse_time(s):
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(s).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected epoch seconds or an ISO date/time, got {!r}'
+            .format(s)) from None
+
+
+def cmd_dump(args):
+    out = open_output(args.output)
+    try:
+        with BinaryLogReader(args.input) as log:
+            if args.since is not None or args.until is not None:
+                entries = log.between(args.since, args.until)
+            else:
+                stop = len(log)
+                if args.count is not None:
+                    stop = min(stop, args.start + args.count)
+                entries = (log[n] for n in range(args.start, stop))
+            for entry in entries:
+                if args.details:
+                    out.write('{}\t{}\t{}\t{}\n'.format(
+                        datetime.datetime.fromtimestamp(entry.time)
+                        .isoformat(timespec='milliseconds'),
+                        entry.mode or '', ','.join(entry.consonants),
+                        entry.cas))
+                else:
+                    out.write(entry.cas + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def cmd_listen(args):
+    stats = Stats()
+    try:
+        while args.count is None or stats.received < args.count:
+            try:
+                sub = Subscriber(args.url)
+            except ConnectionRefusedError:
+                time.sleep(1)  # publisher not up yet, keep trying
+                continue
+            with sub:
+                try:
+                    for message in sub:
+                        stats.add(message)
+                        if args.ipa:
+                            print('{}\t{}'.format(message.cas, message.ipa),
+                                  flush=True)
+                        else:
+                            print(message.cas, flush=True)
+                        if stats.received == args.count:
+                            break
+                finally:
+                    stats.dropped += sub.dropped
+    except KeyboardInterrupt:
+        pass
+    if args.stats:
+        sys.stderr.write(stats.summary() + '\n')
+    return 0
+
+
+def cmd_walk(args):
+    state = None
+    if args.state and os.path.exists(args.state):
+        with open(args.state, encoding='utf-8') as f:
+            state = json.load(f)
+        if ((args.seed is not None and args.seed != state['seed']) or
+                args.mode != state['mode'] or
+                args.reflectionals != state['reflectionals']):
+            sys.stderr.write(
+                'abugida walk: {} holds a walk with seed {}, mode {}{}; '
+                'use the same options to resume it\n'.format(
+                    args.state, state['seed'], state['mode'],
+                    ' and reflectionals' if state['reflectionals'] else ''))
+            return 2
+        walk = Walk.from_state(state)
+    else:
+        walk = Walk(args.mode, args.reflectionals, args.seed, args.start)
+    session = Session(walk.seed, ('walk',))
+    consonants = args.consonants or session.random_consonants()
+    tr = translator(consonants)
+    prosody_rng = session.child('prosody').rng
+    out = open_output(args.output)
+    try:
+        remaining = args.count
+        while remaining > 0:
+            block = list(itertools.islice(walk, min(remaining,
+                                                    ROWS_PER_WRITE)))
+            if not block:
+                break
+            out.write(format_rows([Phrase.from_text(cas) for cas in block],
+                                  tr, args.columns, prosody_rng))
+            remaining -= len(block)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.state:
+        tmp = args.state + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(walk.state(), f, indent=2)
+            f.write('\n')
+        os.replace(tmp, args.state)
+    if not walk.remaining():
+        sys.stderr.write('walk complete: all {:,} phrases listed\n'
+                         .format(walk.space.size))
+    return 0
+
+
+def cmd_render(args):
+    if args.input is not None:
+        src = open_input(args.input)
+        entries = render.read_setlist(src)
+    elif args.count is not None:
+        src = None
+        entries = render.generate_setlist(args.count, args.mode, args.seed,
+                                          args.consonants,
+                                          args.reflectionals)
+    else:
+        sys.stderr.write('abugida render: give a set list or --count\n')
+        return 2
+    flac = args.output.lower().endswith('.flac')
+    out = None
+    if not flac:
+        out = (sys.stdout.buffer if args.output == '-'
+               else open(args.output, 'wb'))
+
+    def open_sink(fmt):
+        if flac:
+            return render.FlacSink(args.output, fmt)
+        return render.WavSink(out, fmt)
+
+    synthesize = functools.partial(speech.synthesize,
+                                   executable=args.espeak)
+    chorus = None
+    if args.chorus > 1:
+        chorus = Chorus(args.chorus, args.workers, synthesize,
+                        Session(args.seed, ('chorus',)).rng)
+        synthesize = chorus.synthesize
+    renderer = render.Renderer(open_sink, args.gap, args.workers, synthesize)
+    start = time.perf_counter()
+    try:
+        cues = renderer.render(entries)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('abugida render: {}\n'.format(e))
+        return 1
+    finally:
+        if src not in (None, sys.stdin):
+            src.close()
+        if out not in (None, sys.stdout.buffer):
+            out.close()
+        if chorus is not None:
+            chorus.close()
+    if not cues:
+        sys.stderr.write('abugida render: nothing to render\n')
+        return 1
+    if args.cues and args.cues.lower().endswith('.cue'):
+        sheets = render.cue_sheets(args.cues, cues)
+        for path, part in sheets:
+            with open(path, 'w', encoding='utf-8') as f:
+                render.write_cues(f, part, renderer.fmt.rate,
+                                  os.path.basename(args.output))
+        if len(sheets) > 1:
+            sys.stderr.write('{} phrases are more than a CUE sheet holds, '
+                             'wrote {} sheets: {}\n'.format(
+                                 len(cues), len(sheets),
+                                 ', '.join(path for path, _ in sheets)))
+    elif args.cues:
+        with open(args.cues, 'w', encoding='utf-8') as f:
+            render.write_labels(f, cues, renderer.fmt.rate)
+    sys.stderr.write('{} phrases, {:.1f}s of audio in {:.1f}s\n'.format(
+        len(cues), renderer.frames / renderer.fmt.rate,
+        time.perf_counter() - start))
+    return 0
+
+
+def cmd_tempo(args):
+    try:
+        pattern = tempo.parse_pattern(args.pattern, args.bpm, args.interval,
+                                      args.actions)
+    except ValueError as e:
+        sys.stderr.write('abugida tempo: {}\n'.format(e))
+        return 2
+    session = Session(args.seed)
+    consonants = args.consonants or session.random_consonants()
+    tr = translator(consonants)
+    backend = speech.open_backend() if args.speak else None
+    voice = speech.Voice(args.voice, 50, 175, 10, 50)
+    phrase = [None]
+
+    def on_beat(beat):
+        if 'g' in beat.actions or ('s' in beat.actions and
+                                   phrase[0] is None):
+            phrase[0] = session.phrase(args.mode, args.reflectionals,
+                                       args.model)
+            sys.stdout.write(phrase[0].text + '\n')
+            sys.stdout.flush()
+        if 's' in beat.actions and backend is not None:
+            # blocks until spoken, so long speech counts as an overrun
+            backend.speak(voice, session.phrase_prosody(phrase[0],
+                                                        tr)).wait()
+
+    scheduler = tempo.Scheduler(pattern, on_beat, args.policy)
+    try:
+        scheduler.run(args.count)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if backend is not None:
+            backend.close()
+        sys.stderr.write(scheduler.summary() + '\n')
+    return 0
+
+
+def cmd_index(args):
+    space = PhraseSpace.for_mode(args.mode, args.reflectionals)
+    for value in args.values:
+        try:
+            if value.isdigit():
+                print(space.unrank(int(value)))
+            else:
+                print(space.rank(value))
+        except (IndexError, ValueError) as e:
+            sys.stderr.write('abugida index: {}: {}\n'.format(value, e))
+            return 1
+    return 0
+
+
+def cmd_stats(args):
+    # stats needs numpy, which the other commands do without
+    try:
+        from abugida import stats
+    except ImportError as e:
+        sys.stderr.write('abugida stats: needs NumPy ({})\n'.format(e))
+        return 1
+    start = time.perf_counter()
+    try:
+        result = stats.analyze(args.logs, args.workers)
+    except (OSError, ValueError) as e:
+        sys.stderr.write('abugida stats: {}\n'.format(e))
+        return 1
+    elapsed = time.perf_counter() - start
+    out = open_output(args.output)
+    try:
+        if args.json:
+            json.dump(result.as_dict(), out, ensure_ascii=False, indent=1)
+            out.write('\n')
+        else:
+            out.write(result.report(args.top) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write('{:,} phrases in {} files, {:.1f}s ({:,.0f} MB/s)\n'
+                     .format(result.phrases, result.files, elapsed,
+                             result.bytes / 1e6 / elapsed))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='abugida',
+        description='Generate Abugida phrases without the GUI.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    # options shared by the commands that generate phrases
+    phrases = argparse.ArgumentParser(add_help=False)
+    phrases.add_argument('-m', '--mode', choices=list(GENERATORS),
+                         default='line', help='phrase size (default: line)')
+    phrases.add_argument('-r', '--reflectionals', action='store_true',
+                         help='use reflectional shapes instead of '
+                              'rotationals')
+    phrases.add_argument('-c', '--consonants', type=parse_consonants,
+                         default='random',
+                         help='comma-separated consonants for {} '
+                              '(default: random)'
+                              .format(', '.join(SHAPE_NAMES)))
+    phrases.add_argument('-s', '--seed', type=int, default=None,
+                         help='seed for a reproducible run '
+                              '(default: random)')
+    phrases.add_argument('--columns', type=parse_columns,
+                         default=list(COLUMNS),
+                         help='comma-separated output columns from {} '
+                              '(default: {})'.format(', '.join(ALL_COLUMNS),
+                                                     ','.join(COLUMNS)))
+    modelled = argparse.ArgumentParser(add_help=False)
+    modelled.add_argument('--model', type=parse_model, default=None,
+                          metavar='FILE',
+                          help='JSON generation model: uniform, weighted or '
+                               'markov (default: uniform)')
+
+    gen = sub.add_parser(
+        'generate', parents=[phrases, modelled],
+        help='stream phrases with IPA/X-SAMPA columns')
+    gen.add_argument('-n', '--count', type=int, default=1,
+                     help='number of phrases, negative for endless '
+                          '(default: 1)')
+    gen.add_argument('--stream', type=parse_stream, default=(),
+                     help='independent stream of the seed, as a '
+                          'slash-separated id path, e.g. 3 or shard/3')
+    gen.add_argument('-o', '--output', default=None,
+                     help='output file (default: stdout)')
+    gen.set_defaults(func=cmd_generate)
+
+    corp = sub.add_parser(
+        'corpus', parents=[phrases, modelled],
+        help='generate a large corpus in parallel shards')
+    corp.add_argument('directory', help='output directory')
+    corp.add_argument('-n', '--count', type=int, required=True,
+                      help='total number of phrases')
+    corp.add_argument('--shards', type=int, default=None,
+                      help='number of output files (default: CPU count)')
+    corp.add_argument('-j', '--workers', type=int, default=None,
+                      help='worker processes (default: one per shard)')
+    corp.set_defaults(func=cmd_corpus)
+
+    swp = sub.add_parser(
+        'swap', help='convert a log between rotationals and reflectionals')
+    swp.add_argument('input', nargs='?', default=None,
+                     help='input file (default: stdin)')
+    swp.add_argument('-t', '--to', choices=['ref', 'rot', 'toggle'],
+                     default='toggle',
+                     help='target shapes, or toggle every syllabic '
+                          '(default: toggle)')
+    swp.add_argument('-o', '--output', default=None,
+                     help='output file (default: stdout)')
+    swp.set_defaults(func=cmd_swap)
+
+    dump = sub.add_parser(
+        'dump', help='convert a binary phrase log (.abl) back to text')
+    dump.add_argument('input', help='binary log file')
+    dump.add_argument('--start', type=int, default=0,
+                      help='first entry number (default: 0)')
+    dump.add_argument('--count', type=int, default=None,
+                      help='number of entries (default: all)')
+    dump.add_argument('--since', type=parse_time, default=None,
+                      help='first time to include, epoch seconds or ISO')
+    dump.add_argument('--until', type=parse_time, default=None,
+                      help='time to stop before, epoch seconds or ISO')
+    dump.add_argument('-d', '--details', action='store_true',
+                      help='prefix time, mode and consonants to each phrase')
+    dump.add_argument('-o', '--output', default=None,
+                      help='output file (default: stdout)')
+    dump.set_defaults(func=cmd_dump)
+
+    walk = sub.add_parser(
+        'walk', parents=[phrases],
+        help='list every phrase once, in a seeded order that can be '
+             'resumed')
+    walk.add_argument('-n', '--count', type=int, required=True,
+                      help='number of phrases to write')
+    walk.add_argument('--state', metavar='FILE',
+                      help='continue from the position saved in FILE, if '
+                           'it exists, and save the new position there')
+    walk.add_argument('--start', type=int, default=0,
+                      help='position to start from without --state '
+                           '(default: 0)')
+    walk.add_argument('-o', '--output', default=None,
+                      help='output file (default: stdout)')
+    walk.set_defaults(func=cmd_walk)
+
+    ren = sub.add_parser(
+        'render', help='render a set of phrases to one WAV or FLAC file')
+    ren.add_argument('input', nargs='?', default=None,
+                     help='set list, one JSON object per line with text '
+                          '(X-SAMPA) and optional voice, pitch, speed, gap, '
+                          'amplitude, pause and cas')
+    ren.add_argument('-o', '--output', required=True,
+                     help='output .wav or .flac file, or - for WAV on '
+                          'stdout')
+    ren.add_argument('--cues', metavar='FILE',
+                     help='write phrase offsets: CUE sheets of up to 99 '
+                          'tracks if FILE ends in .cue, otherwise '
+                          'tab-separated')
+    ren.add_argument('-g', '--gap', type=float, default=1.0,
+                     help='seconds of silence between phrases '
+                          '(default: 1.0)')
+    ren.add_argument('-j', '--workers', type=int, default=None,
+                     help='parallel synthesizer processes '
+                          '(default: CPU count)')
+    ren.add_argument('--chorus', type=int, default=1, metavar='N',
+                     help='speak each phrase in N voices at once, led by '
+                          'its own (default: 1)')
+    ren.add_argument('--espeak', default=speech.ESPEAK,
+                     help='espeak-ng executable (default: espeak-ng)')
+    ren.add_argument('-n', '--count', type=int, default=None,
+                     help='without a set list, render this many random '
+                          'phrases with random voices')
+    ren.add_argument('-m', '--mode', choices=list(GENERATORS),
+                     default='line', help='phrase size (default: line)')
+    ren.add_argument('-r', '--reflectionals', action='store_true',
+                     help='use reflectional shapes instead of '
+                          'rotationals')
+    ren.add_argument('-c', '--consonants', type=parse_consonants,
+                     default='random',
+                     help='comma-separated consonants for {} '
+                          '(default: random)'
+                          .format(', '.join(SHAPE_NAMES)))
+    ren.add_argument('-s', '--seed', type=int, default=None,
+                     help='seed for the random set (default: random)')
+    ren.set_defaults(func=cmd_render)
+
+    tmp = sub.add_parser(
+        'tempo', parents=[modelled],
+        help='generate (and speak) phrases in time, at a tempo or rhythm')
+    tmp.add_argument('-b', '--bpm', type=float, default=None,
+                     help='beats per minute (default: 60)')
+    tmp.add_argument('-i', '--interval', type=float, default=None,
+                     help='seconds per beat, instead of --bpm')
+    tmp.add_argument('-p', '--pattern', default='1',
+                     help='rhythm as BEATS[:ACTIONS] steps, where actions '
+                          'are g (generate), s (speak) or - (rest), e.g. '
+                          '"1:gs 0.5:s 0.5:-" (default: 1)')
+    tmp.add_argument('-a', '--actions', default='g',
+                     help='actions for steps that give none (default: g)')
+    tmp.add_argument('--policy', choices=list(tempo.POLICIES),
+                     default='skip',
+                     help='when a beat is missed: skip to the next due, '
+                          'catchup on every missed beat, or shift the '
+                          'rhythm later (default: skip)')
+    tmp.add_argument('--speak', action='store_true',
+                     help='speak on s steps with espeak-ng')
+    tmp.add_argument('--voice', default='m3',
+                     help='espeak-ng voice variant for --speak '
+                          '(default: m3)')
+    tmp.add_argument('-n', '--count', type=int, default=None,
+                     help='stop after this many beats (default: until '
+                          'interrupted)')
+    tmp.add_argument('-m', '--mode', choices=list(GENERATORS),
+                     default='line', help='phrase size (default: line)')
+    tmp.add_argument('-r', '--reflectionals', action='store_true',
+                     help='use reflectional shapes instead of '
+                          'rotationals')
+    tmp.add_argument('-c', '--consonants', type=parse_consonants,
+                     default='random',
+                     help='comma-separated consonants for {} '
+                          '(default: random)'
+                          .format(', '.join(SHAPE_NAMES)))
+    tmp.add_argument('-s', '--seed', type=int, default=None,
+                     help='seed for a reproducible run (default: random)')
+    tmp.set_defaults(func=cmd_tempo)
+
+    idx = sub.add_parser(
+        'index', help='convert between phrases and their numbers')
+    idx.add_argument('values', nargs='+', metavar='VALUE',
+                     help='phrase numbers to look up, or phrases to '
+                          'number')
+    idx.add_argument('-m', '--mode', choices=list(GENERATORS),
+                     default='line', help='phrase size (default: line)')
+    idx.add_argument('-r', '--reflectionals', action='store_true',
+                     help='number reflectional phrases')
+    idx.set_defaults(func=cmd_index)
+
+    sta = sub.add_parser(
+        'stats', help='count syllables, shapes, vowels, lengths and '
+                      'bigrams in phrase logs')
+    sta.add_argument('logs', nargs='+', metavar='LOG',
+                     help='text logs, one phrase per line or TSV with the '
+                          'phrase first, or binary logs (.abl)')
+    sta.add_argument('-j', '--workers', type=int, default=None,
+                     help='worker processes (default: CPU count)')
+    sta.add_argument('--top', type=int, default=20,
+                     help='bigrams to list (default: 20)')
+    sta.add_argument('--json', action='store_true',
+                     help='write all counts as JSON')
+    sta.add_argument('-o', '--output', default=None,
+                     help='output file (default: stdout)')
+    sta.set_defaults(func=cmd_stats)
+
+    lis = sub.add_parser(
+        'listen', help='print phrases published by a running GUI')
+    lis.add_argument('url',
+                     help='udp://group:port or tcp://host:port, as given to '
+                          'the GUI with --publish')
+    lis.add_argument('--ipa', action='store_true',
+                     help='print the IPA after each phrase')
+    lis.add_argument('-n', '--count', type=int, default=None,
+                     help='exit after this many phrases')
+    lis.add_argument('--stats', action='store_true',
+                     help='report missed phrases and latency on exit')
+    lis.set_defaults(func=cmd_listen)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # downstream closed early, e.g. `python -m abugida generate | head`
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
@@ -0,0 +1,506 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Phrase generation and translation, independent of the GUI."""
+
+import functools
+import hashlib
+import random
+import re
+import secrets
+
+# ROTATIONALS: up, down, left, right
+DELTA = (u'\u1403', u'\u1405', u'\u1401', u'\u140A')
+CHEVRON = (u'\u1431', u'\u1433', u'\u142F', u'\u1438')
+ARCH = (u'\u144E', u'\u1450', u'\u144C', u'\u1455')
+# REFLECTIONALS: upper left, upper right, lower right, lower left
+LOOP = (u'\u146D', u'\u146B', u'\u146F', u'\u1472')
+HOOK = (u'\u148B', u'\u1489', u'\u148D', u'\u1490')
+BAR = (u'\u14A5', u'\u14A3', u'\u14A7', u'\u14AA')
+
+# shape order used wherever a consonant assignment is passed around
+SHAPE_NAMES = ('delta', 'chevron', 'arch', 'loop', 'hook', 'bar')
+SHAPES = (DELTA, CHEVRON, ARCH, LOOP, HOOK, BAR)
+
+# rotational <-> reflectional conversion, by position within each group
+ROTATIONALS = ''.join(DELTA + CHEVRON + ARCH)
+REFLECTIONALS = ''.join(LOOP + HOOK + BAR)
+ROT_TO_REF = str.maketrans(ROTATIONALS, REFLECTIONALS)
+REF_TO_ROT = str.maketrans(REFLECTIONALS, ROTATIONALS)
+SWAP_TABLE = str.maketrans(ROTATIONALS + REFLECTIONALS,
+                           REFLECTIONALS + ROTATIONALS)
+
+# IPA-XSAMPA DICTIONARIES
+LABIAL = {'p': 'p', 'b': 'b', 'f': 'f', 'v': 'v', }
+DENTAL = {'θ': 'T', 'ð': 'D', }
+ALVEOLAR = {'t': 't', 'd': 'd', 's': 's', 'z': 'z', }
+POSTALVEOLAR = {'tʃ': 'tS', 'dʒ': 'dZ', 'ʃ': 'S', 'ʒ': 'Z', }
+VELAR_GLOTTAL = {'k': 'k', 'g': 'g', 'h': 'h', }
+NASAL = {'m': 'm', 'n': 'n', }
+APPROXIMANT = {'l': 'l', 'r': 'r', 'j': 'j', 'w': 'w', }
+CON = (LABIAL | DENTAL | ALVEOLAR | POSTALVEOLAR |
+       VELAR_GLOTTAL | NASAL | APPROXIMANT)
+VOW = {'i': 'i', 'o': 'o', 'e': 'e', 'a': 'a', }
+IXDICT = CON | VOW
+
+VOICES = ["Andrea", "Annie", "Antonio", "Auntie", "Belinda", "Boris", "Denis",
+          "Diogo", "Ed", "Gene", "Gene2", "Henrique", "Hugo", "Iven", "Iven2",
+          "Iven3", "Jacky", "John", "Kaukovalta", "Mario", "Max", "Michael",
+          "Michel", "Miguel", "Mr_Serious", "Nguyen", "Pablo", "Pablo2",
+          "Paul", "Pedro", "Quincy", "RicishayMax", "RicishayMax2",
+          "RicishayMax3", "Rob", "Robert", "Robosoft3", "Robosoft4",
+          "Robosoft5", "Robosoft6", "Robosoft7", "Robosoft8", "Steph",
+          "Steph2", "Steph3", "Storm", "Tweaky", "Zac", "anika", "anikaRobot",
+          "fast_test", "f2", "f3", "f4", "f5", "female_whisper", "grandpa",
+          "klatt", "klatt2", "klatt3", "klatt4", "m2", "m3", "m4", "m5", "m6",
+          "m7", "norbert", "shelby", "travis", "victor", "whisper",
+          "m8", "f1", "croak", "m1", "grandma"]
+
+
+# PHRASE CODES: one byte per syllable, shape * 4 + vowel with shapes in
+# SHAPES order, so rotationals are 0-11 and reflectionals 12-23, and a
+# code is the syllabic's position in GLYPHS
+GLYPHS = ROTATIONALS + REFLECTIONALS
+BOUNDARY = 255  # between words
+GROUP = 12  # codes per rotational/reflectional group
+_INVALID = 254
+_ENCODE = dict.fromkeys(list(range(2 * GROUP)) + [BOUNDARY], _INVALID)
+_ENCODE.update({ord(c): code for code, c in enumerate(GLYPHS)})
+_ENCODE[ord(' ')] = BOUNDARY
+_DECODE = dict(enumerate(GLYPHS))
+_DECODE[BOUNDARY] = ' '
+_VALID = bytes(range(2 * GROUP)) + bytes([BOUNDARY])
+_ROT, _REF = bytes(range(GROUP)), bytes(range(GROUP, 2 * GROUP))
+_CODES_TO_REF = bytes.maketrans(_ROT, _REF)
+_CODES_TO_ROT = bytes.maketrans(_REF, _ROT)
+_SHAPE_OF = bytes.maketrans(_VALID, bytes(c // 4 for c in _VALID[:-1]) +
+                            bytes([BOUNDARY]))
+_VOWEL_OF = bytes.maketrans(_VALID, bytes(c % 4 for c in _VALID[:-1]) +
+                            bytes([BOUNDARY]))
+
+
+class Phrase:
+    """A phrase as syllable codes rather than syllabic text.
+
+    ``codes`` holds one byte per syllable, ``shape * 4 + vowel`` (shapes
+    in SHAPES order, vowels in VOW order), with BOUNDARY between words.
+    Swapping and translation are byte-table lookups on the codes, and
+    the syllabics are only rendered by ``text``.
+    """
+
+    __slots__ = ('codes',)
+
+    def __init__(self, codes=b''):
+        self.codes = bytes(codes)
+
+    @classmethod
+    def from_text(cls, cas):
+        try:
+            codes = cas.translate(_ENCODE).encode('latin-1')
+        except UnicodeEncodeError as e:
+            raise ValueError('cannot encode {!r}'.format(
+                e.object[e.start])) from None
+        if codes.translate(None, _VALID):
+            bad = codes.translate(None, _VALID)[0]
+            raise ValueError('cannot encode {!r}'.format(
+                cas[codes.index(bad)]))
+        return cls(codes)
+
+    @property
+    def text(self):
+        return _render(self.codes)
+
+    __str__ = text.fget
+
+    def __repr__(self):
+        return 'Phrase({!r})'.format(self.text)
+
+    def __eq__(self, other):
+        if isinstance(other, Phrase):
+            return self.codes == other.codes
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.codes)
+
+    def __bool__(self):
+        return bool(self.codes)
+
+    @property
+    def reflectionals(self):
+        """True if the first syllable is reflectional."""
+        first = self.codes.lstrip(bytes([BOUNDARY]))[:1]
+        return bool(first) and first[0] >= GROUP
+
+    def to(self, reflectionals):
+        return Phrase(self.codes.translate(
+            _CODES_TO_REF if reflectionals else _CODES_TO_ROT))
+
+    def swapped(self):
+        """The phrase in the other group, as decided by its first
+        syllable, like swap().
+        """
+        return self.to(not self.reflectionals)
+
+    def words(self):
+        if not self.codes:
+            return []
+        return self.codes.split(bytes([BOUNDARY]))
+
+    def word_lengths(self):
+        return [len(w) for w in self.words()]
+
+    def shapes(self):
+        """Shape index (SHAPES order) per syllable, BOUNDARY between
+        words."""
+        return self.codes.translate(_SHAPE_OF)
+
+    def vowels(self):
+        """Vowel index (VOW order) per syllable, BOUNDARY between
+        words."""
+        return self.codes.translate(_VOWEL_OF)
+
+
+_SHAPE_CHOICES = (0, 1, 2)
+_VOWEL_CHOICES = (0, 1, 2, 3)
+_SYL_CHOICES = tuple(range(GROUP))
+
+
+def _word_codes(out, base, rng):
+    # draws exactly as the original string generators did
+    choice = rng.choice
+    for _ in range(rng.randint(2, 6)):
+        out.append((base + choice(_SHAPE_CHOICES)) * 4 +
+                   choice(_VOWEL_CHOICES))
+    return out
+
+
+def _line_codes(base, rng):
+    out = bytearray()
+    for i in range(rng.randint(2, 5)):
+        if i:
+            out.append(BOUNDARY)
+        _word_codes(out, base, rng)
+    return out
+
+
+def _render(codes):
+    return codes.decode('latin-1').translate(_DECODE)
+
+
+def syl_phrase(reflectionals=False, rng=random):
+    return Phrase(bytes([rng.choice(_SYL_CHOICES) +
+                         (GROUP if reflectionals else 0)]))
+
+
+def word_phrase(reflectionals=False, rng=random):
+    return Phrase(_word_codes(bytearray(), 3 if reflectionals else 0, rng))
+
+
+def line_phrase(reflectionals=False, rng=random):
+    return Phrase(_line_codes(3 if reflectionals else 0, rng))
+
+
+def syl(reflectionals=False, rng=random):
+    return GLYPHS[rng.choice(_SYL_CHOICES) + (GROUP if reflectionals else 0)]
+
+
+def word(reflectionals=False, rng=random):
+    return _render(_word_codes(bytearray(), 3 if reflectionals else 0, rng))
+
+
+def line(reflectionals=False, rng=random):
+    return _render(_line_codes(3 if reflectionals else 0, rng))
+
+
+GENERATORS = {'syl': syl, 'word': word, 'line': line, }
+PHRASE_GENERATORS = {'syl': syl_phrase, 'word': word_phrase,
+                     'line': line_phrase, }
+
+
+class Prosody:
+    """Random vowel length and stress for X-SAMPA text.
+
+    Each word is cut into syllables by one precompiled pattern: a run of
+    anything up to and including a vowel, with trailing consonants left
+    as a syllable of their own. Length marks and stress are then added in
+    the same pass, drawing from `rng` exactly as the original
+    character-by-character version did, so a seeded stream gives the
+    same output either way.
+    """
+
+    def __init__(self, vowels=tuple(VOW.values())):
+        self.vowels = tuple(sorted(vowels, key=len, reverse=True))
+        alternatives = '|'.join(re.escape(v) for v in self.vowels)
+        self.pattern = re.compile('.*?(?:{})|.+'.format(alternatives))
+
+    def apply(self, s, rng=random):
+        return self._stresser(rng)(map(self.pattern.findall, s.split()))
+
+    def apply_phrase(self, phrase, tr, rng=random):
+        """Prosody for a Phrase read by Translator `tr`.
+
+        The syllables come straight from the codes instead of the
+        pattern, but every draw is the same, so this returns what
+        ``apply()`` returns for the phrase's X-SAMPA.
+        """
+        return self._stresser(rng)(tr.xsampa_syllables(phrase))
+
+    def _stresser(self, rng):
+        # everything looked up once, so a batch pays for it once
+        vowels = self.vowels
+        choice = rng.choice
+        sample = rng.sample
+        coin = _COIN
+        spans = [range(n) for n in range(4)]
+
+        def stress(words):
+            out_words = []
+            for syl in words:
+                for i, part in enumerate(syl):
+                    if part.endswith(vowels) and choice(coin):
+                        syl[i] = part + ':'  # random vowel lengthening
+                n = len(syl)
+                if n == 1:
+                    if choice(coin):
+                        syl[0] = "'" + syl[0]
+                elif n > 3:
+                    first, second = sample(range(n), k=2)
+                    syl[first] = "'" + syl[first]
+                    syl[second] = "," + syl[second]
+                else:
+                    i = choice(spans[n])
+                    syl[i] = "'" + syl[i]
+                out_words.append(''.join(syl))
+            return ' '.join(out_words)
+        return stress
+
+    def iter_apply(self, phrases, rng=random):
+        """Yield the prosody of each phrase in turn, drawing from `rng`."""
+        stress = self._stresser(rng)
+        findall = self.pattern.findall
+        for s in phrases:
+            yield stress(map(findall, s.split()))
+
+    def apply_many(self, phrases, rng=random):
+        """Prosody for a list of phrases, with the per-call setup done
+        once rather than per phrase.
+        """
+        stress = self._stresser(rng)
+        findall = self.pattern.findall
+        return [stress(map(findall, s.split())) for s in phrases]
+
+
+_COIN = (True, False)
+PROSODY = Prosody()
+
+
+def random_prosody(s, rng=random):
+    return PROSODY.apply(s, rng)
+
+
+def iter_prosody(phrases, rng=random):
+    """Lazily apply random prosody to many X-SAMPA phrases."""
+    return PROSODY.iter_apply(phrases, rng)
+
+
+def random_consonants(rng=random):
+    return rng.sample(list(CON), k=6)
+
+
+def random_voice(rng=random):
+    """Return a random (voice, pitch, speed, gap); amplitude is left alone."""
+    return (rng.choice(VOICES), rng.randint(0, 99), rng.randint(25, 250),
+            rng.randint(1, 40))
+
+
+class _Table(dict):
+    # anything that is not a syllabic reads as a space, as in the
+    # original per-character translation
+    def __missing__(self, key):
+        return ' '
+
+
+def _to_xsampa(ipa):
+    return ''.join([IXDICT[char] if char in IXDICT else ' ' for char in ipa])
+
+
+class Translator:
+    """Syllabics to IPA/X-SAMPA for one consonant assignment.
+
+    Each syllabic code point maps straight to its output through a
+    ``str.translate`` table, so a phrase is read in a single pass.
+    """
+
+    def __init__(self, consonants):
+        self.consonants = tuple(consonants)
+        self.ipa_table = _Table()
+        self.xsampa_table = _Table()
+        for shape, con in zip(SHAPES, self.consonants):
+            for char, vow in zip(shape, VOW):
+                self.ipa_table[ord(char)] = con + vow
+                self.xsampa_table[ord(char)] = _to_xsampa(con + vow)
+        # the same, keyed by Phrase code (read as latin-1 text)
+        self.code_ipa = _Table((code, self.ipa_table[ord(char)])
+                               for code, char in enumerate(GLYPHS))
+        self.code_xsampa = _Table((code, self.xsampa_table[ord(char)])
+                                  for code, char in enumerate(GLYPHS))
+        self.syllable_xsampa = [self.code_xsampa[code]
+                                for code in range(len(GLYPHS))]
+
+    def _tables(self, cas):
+        if isinstance(cas, Phrase):
+            return cas.codes.decode('latin-1'), self.code_ipa, \
+                self.code_xsampa
+        return cas, self.ipa_table, self.xsampa_table
+
+    def ipa(self, cas):
+        """IPA for syllabic text or a Phrase; likewise below."""
+        text, ipa_table, _ = self._tables(cas)
+        return text.translate(ipa_table)
+
+    def xsampa(self, cas):
+        text, _, xsampa_table = self._tables(cas)
+        return text.translate(xsampa_table)
+
+    def translate(self, cas):
+        text, ipa_table, xsampa_table = self._tables(cas)
+        return text.translate(ipa_table), text.translate(xsampa_table)
+
+    def translate_many(self, phrases):
+        tables = self._tables
+        out = []
+        for cas in phrases:
+            text, ipa_table, xsampa_table = tables(cas)
+            out.append((text.translate(ipa_table),
+                        text.translate(xsampa_table)))
+        return out
+
+    def xsampa_syllables(self, phrase):
+        """X-SAMPA syllables of a Phrase, as a list per word."""
+        syllables = self.syllable_xsampa
+        return [[syllables[code] for code in word]
+                for word in phrase.words()]
+
+
+@functools.lru_cache(maxsize=128)
+def _translator(consonants):
+    return Translator(consonants)
+
+
+def translator(consonants):
+    """Return the cached Translator for `consonants` in SHAPE_NAMES order."""
+    return _translator(tuple(consonants))
+
+
+def translate(cas, consonants):
+    """Return the (ipa, xsampa) reading of syllabics `cas`."""
+    return translator(consonants).translate(cas)
+
+
+def swap(cas):
+    """Swap a phrase between rotational and reflectional shapes.
+
+    The direction is taken from the first character. A Phrase is
+    swapped to a new Phrase.
+    """
+    if isinstance(cas, Phrase):
+        return cas.swapped()
+    if cas[:1] in ROTATIONALS:
+        return cas.translate(ROT_TO_REF)
+    return cas.translate(REF_TO_ROT)
+
+
+def swap_text(text, reflectionals=None):
+    """Convert all syllabics in `text`, e.g. a whole log, in one pass.
+
+    True converts to reflectionals, False to rotationals, and None
+    swaps every character to its counterpart.
+    """
+    if reflectionals is None:
+        return text.translate(SWAP_TABLE)
+    if reflectionals:
+        return text.translate(ROT_TO_REF)
+    return text.translate(REF_TO_ROT)
+
+
+def _derive_seed(seed, stream):
+    digest = hashlib.sha256(repr((seed, stream)).encode('utf-8')).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class Session:
+    """A seeded random stream for generation.
+
+    Every draw comes from this session's own ``random.Random``, seeded
+    from a hash of `seed` and the `stream` id path, so the same seed and
+    stream always replay the same phrases. Child streams from ``child()``
+    or ``spawn()`` are seeded independently of their parent and of each
+    other, and can be handed to separate threads or processes.
+    """
+
+    def __init__(self, seed=None, stream=()):
+        if seed is None:
+            seed = secrets.randbits(64)
+        self.seed = seed
+        self.stream = tuple(stream)
+        self.entropy = _derive_seed(seed, self.stream)
+        self.rng = random.Random(self.entropy)
+
+    def __repr__(self):
+        return 'Session(seed={!r}, stream={!r})'.format(self.seed,
+                                                        self.stream)
+
+    def child(self, key):
+        return Session(self.seed, self.stream + (key,))
+
+    def spawn(self, n):
+        return [self.child(i) for i in range(n)]
+
+    def syl(self, reflectionals=False):
+        return syl(reflectionals, self.rng)
+
+    def word(self, reflectionals=False):
+        return word(reflectionals, self.rng)
+
+    def line(self, reflectionals=False):
+        return line(reflectionals, self.rng)
+
+    def generate(self, mode, reflectionals=False, model=None):
+        if model is not None:
+            return model.generate(mode, reflectionals, self.rng)
+        return GENERATORS[mode](reflectionals, self.rng)
+
+    def phrase(self, mode, reflectionals=False, model=None):
+        """Like generate(), with the same draws, as a Phrase."""
+        if model is not None:
+            return model.phrase(mode, reflectionals, self.rng)
+        return PHRASE_GENERATORS[mode](reflectionals, self.rng)
+
+    def random_prosody(self, s):
+        return random_prosody(s, self.rng)
+
+    def phrase_prosody(self, phrase, tr):
+        return PROSODY.apply_phrase(phrase, tr, self.rng)
+
+    def iter_prosody(self, phrases):
+        return iter_prosody(phrases, self.rng)
+
+    def random_consonants(self):
+        return random_consonants(self.rng)
+
+    def random_voice(self):
+        return random_voice(self.rng)
@@ -0,0 +1,154 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Sharded corpus generation across a process pool."""
+
+import concurrent.futures
+import datetime
+import functools
+import itertools
+import json
+import os
+from pathlib import Path
+
+from abugida.core import (PHRASE_GENERATORS, PROSODY, SHAPE_NAMES, Session,
+                          translator)
+
+COLUMNS = ('cas', 'ipa', 'xsampa')
+ALL_COLUMNS = COLUMNS + ('stressed',)
+MANIFEST = 'manifest.json'
+ROWS_PER_WRITE = 4096
+
+
+def iter_phrases(session, mode, n, reflectionals=False, model=None):
+    """Yield `n` Phrases (endless if negative) from `session`."""
+    if model is None:
+        gen = PHRASE_GENERATORS[mode]
+    else:
+        gen = functools.partial(model.phrase, mode)
+    rng = session.rng
+    i = 0
+    while n < 0 or i < n:
+        yield gen(reflectionals, rng)
+        i += 1
+
+
+def format_rows(phrases, tr, columns, prosody_rng=None):
+    """Tab-separated rows for a block of Phrases."""
+    rows = {'cas': [phrase.text for phrase in phrases]}
+    rows['ipa'], rows['xsampa'] = zip(*tr.translate_many(phrases))
+    if 'stressed' in columns:
+        apply = PROSODY.apply_phrase
+        rows['stressed'] = [apply(phrase, tr, prosody_rng)
+                            for phrase in phrases]
+    return ''.join('\t'.join(row) + '\n'
+                   for row in zip(*(rows[c] for c in columns)))
+
+
+def write_phrases(out, session, mode, n, consonants, reflectionals=False,
+                  columns=COLUMNS, model=None):
+    """Stream `n` phrases as tab-separated rows, a block at a time.
+
+    The stressed column draws from the session's 'prosody' child stream,
+    so adding it leaves the phrases themselves unchanged.
+    """
+    tr = translator(consonants)
+    prosody_rng = session.child('prosody').rng
+    phrases = iter_phrases(session, mode, n, reflectionals, model)
+    written = 0
+    while True:
+        block = list(itertools.islice(phrases, ROWS_PER_WRITE))
+        if not block:
+            return written
+        out.write(format_rows(block, tr, columns, prosody_rng))
+        written += len(block)
+
+
+def shard_stream(i):
+    return ('shard', i)
+
+
+def shard_counts(count, shards):
+    base, extra = divmod(count, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def _write_shard(job):
+    (path, seed, stream, mode, n, consonants, reflectionals, columns,
+     model) = job
+    with open(path, 'w', encoding='utf-8', buffering=1 << 20) as out:
+        written = write_phrases(out, Session(seed, stream), mode, n,
+                                consonants, reflectionals, columns, model)
+    return written, os.path.getsize(path)
+
+
+def generate_corpus(directory, count, mode='line', shards=None, seed=None,
+                    consonants=None, reflectionals=False, columns=COLUMNS,
+                    workers=None, model=None):
+    """Write `count` phrases to `shards` TSV files in `directory`.
+
+    Shard i is generated from Session(seed, ('shard', i)), so every shard
+    can be regenerated on its own. All shards share one consonant
+    assignment. A manifest.json records the seed, streams, counts,
+    mapping and model config, and is returned as a dict. Raises
+    ValueError for a negative count or fewer than one shard or worker.
+    """
+    if count < 0:
+        raise ValueError('count must not be negative')
+    if shards is not None and shards < 1:
+        raise ValueError('shards must be at least 1')
+    if workers is not None and workers < 1:
+        raise ValueError('workers must be at least 1')
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    shards = shards or os.cpu_count() or 1
+    session = Session(seed)
+    if consonants is None:
+        consonants = session.random_consonants()
+    consonants = list(consonants)
+    width = max(4, len(str(shards - 1)))
+
+    jobs = []
+    for i, n in enumerate(shard_counts(count, shards)):
+        name = 'shard-{:0{}d}.tsv'.format(i, width)
+        jobs.append((str(directory/name), session.seed, shard_stream(i),
+                     mode, n, consonants, reflectionals, list(columns),
+                     model))
+
+    started = datetime.datetime.now().astimezone()
+    with concurrent.futures.ProcessPoolExecutor(workers or shards) as pool:
+        results = list(pool.map(_write_shard, jobs))
+
+    manifest = {
+        'created': started.isoformat(timespec='seconds'),
+        'seed': session.seed,
+        'mode': mode,
+        'model': model.config if model else {'model': 'uniform'},
+        'reflectionals': reflectionals,
+        'consonants': dict(zip(SHAPE_NAMES, consonants)),
+        'columns': list(columns),
+        'count': sum(n for n, _ in results),
+        'shards': [{'file': Path(job[0]).name,
+                    'stream': list(job[2]),
+                    'count': n,
+                    'bytes': size}
+                   for job, (n, size) in zip(jobs, results)],
+    }
+    with open(directory/MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    return manifest
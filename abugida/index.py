@@ -0,0 +1,231 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Random access to the phrase space, and walks through it without repeats.
+
+Every phrase the generators can produce has a number. A PhraseSpace
+orders phrases by word count, then by the lengths and codes of their
+words as mixed-radix digits, so ``rank()`` and ``unrank()`` take time
+proportional to the phrase length, with no tables. The line space holds
+about 3.7e32 phrases, well past what could be stored.
+
+A Permutation shuffles ``range(size)`` with a keyed Feistel network,
+cycle-walking values that fall outside the range, so position i of a
+walk maps to a phrase number in constant memory. A Walk is just a
+seed and a position, which makes it cheap to save and resume: over
+``size`` steps every phrase appears exactly once. Note that each phrase
+is equally likely here, so long words and lines dominate, unlike
+``generate()`` which picks each length equally often.
+"""
+
+import hashlib
+
+from abugida.core import GLYPHS, GROUP, Session
+
+CODES = {c: i % GROUP for i, c in enumerate(GLYPHS)}
+
+# (min, max) syllables per word and words per phrase for each mode
+SPACES = {
+    'syl': ((1, 1), (1, 1)),
+    'word': ((2, 6), (1, 1)),
+    'line': ((2, 6), (2, 5)),
+}
+
+
+def _offsets(lengths, base):
+    # first rank of each length class, and the class sizes
+    offsets = {}
+    total = 0
+    for n in range(lengths[0], lengths[1] + 1):
+        offsets[n] = (total, base ** n)
+        total += base ** n
+    return offsets, total
+
+
+class PhraseSpace:
+    """Numbers every phrase with words of `word_lengths` syllables and
+    `line_lengths` words, as (min, max) pairs.
+    """
+
+    def __init__(self, word_lengths=(2, 6), line_lengths=(2, 5),
+                 reflectionals=False):
+        self.word_lengths = tuple(word_lengths)
+        self.line_lengths = tuple(line_lengths)
+        self.reflectionals = reflectionals
+        self.glyphs = GLYPHS[GROUP:] if reflectionals else GLYPHS[:GROUP]
+        self.word_offsets, self.words = _offsets(word_lengths, GROUP)
+        self.line_offsets, self.size = _offsets(line_lengths, self.words)
+
+    @classmethod
+    def for_mode(cls, mode, reflectionals=False):
+        word_lengths, line_lengths = SPACES[mode]
+        return cls(word_lengths, line_lengths, reflectionals)
+
+    def rank_word(self, word):
+        if len(word) not in self.word_offsets:
+            raise ValueError('word {!r} has {} syllables, expected {} to {}'
+                             .format(word, len(word), *self.word_lengths))
+        value = 0
+        for c in word:
+            if c not in self.glyphs:
+                raise ValueError('{!r} is not a {} syllabic'.format(
+                    c, 'reflectional' if self.reflectionals
+                    else 'rotational'))
+            value = value * GROUP + CODES[c]
+        return self.word_offsets[len(word)][0] + value
+
+    def unrank_word(self, n):
+        for length, (offset, count) in self.word_offsets.items():
+            if n < offset + count:
+                break
+        else:
+            raise IndexError('word number out of range')
+        n -= offset
+        chars = [''] * length
+        for i in range(length - 1, -1, -1):
+            n, code = divmod(n, GROUP)
+            chars[i] = self.glyphs[code]
+        return ''.join(chars)
+
+    def rank(self, cas):
+        """Return the number of phrase `cas`."""
+        words = cas.split(' ')
+        if len(words) not in self.line_offsets:
+            raise ValueError('phrase has {} words, expected {} to {}'
+                             .format(len(words), *self.line_lengths))
+        value = 0
+        for word in words:
+            value = value * self.words + self.rank_word(word)
+        return self.line_offsets[len(words)][0] + value
+
+    def unrank(self, n):
+        """Return phrase number `n`."""
+        if n < 0:
+            raise IndexError('phrase number out of range')
+        for count, (offset, size) in self.line_offsets.items():
+            if n < offset + size:
+                break
+        else:
+            raise IndexError('phrase number out of range')
+        n -= offset
+        ranks = [0] * count
+        for i in range(count - 1, -1, -1):
+            n, ranks[i] = divmod(n, self.words)
+        return ' '.join(self.unrank_word(r) for r in ranks)
+
+    __getitem__ = unrank
+
+
+class Permutation:
+    """A keyed pseudorandom permutation of ``range(size)``.
+
+    A balanced Feistel network over the smallest even number of bits
+    that covers `size`, with keyed BLAKE2b as the round function, gives
+    a permutation of that power of two; results of `size` or more are
+    fed back in until one falls inside the range, which takes fewer
+    than four rounds on average.
+    """
+
+    def __init__(self, size, key, rounds=8):
+        if size < 1:
+            raise ValueError('size must be positive')
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.nbytes = (self.half + 7) // 8
+        self.key = key[:64]
+        self.rounds = rounds
+
+    def _f(self, r, x):
+        h = hashlib.blake2b(x.to_bytes(self.nbytes, 'big') + bytes((r,)),
+                            key=self.key, digest_size=self.nbytes)
+        return int.from_bytes(h.digest(), 'big') & self.mask
+
+    def _encrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for r in range(self.rounds):
+            left, right = right, left ^ self._f(r, right)
+        return (left << self.half) | right
+
+    def _decrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for r in reversed(range(self.rounds)):
+            left, right = right ^ self._f(r, left), left
+        return (left << self.half) | right
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError('permutation index out of range')
+        x = self._encrypt(i)
+        while x >= self.size:
+            x = self._encrypt(x)
+        return x
+
+    def index(self, x):
+        """Return the position i at which ``self[i] == x``."""
+        if not 0 <= x < self.size:
+            raise ValueError('value out of range')
+        i = self._decrypt(x)
+        while i >= self.size:
+            i = self._decrypt(i)
+        return i
+
+
+class Walk:
+    """Visits every phrase of a mode once, in a seeded random order.
+
+    The state is just (seed, mode, reflectionals, position), see
+    ``state()``; a Walk rebuilt from it continues where it stopped.
+    """
+
+    def __init__(self, mode='line', reflectionals=False, seed=None,
+                 position=0):
+        session = Session(seed, ('walk', mode, bool(reflectionals)))
+        self.seed = session.seed
+        self.mode = mode
+        self.reflectionals = bool(reflectionals)
+        self.space = PhraseSpace.for_mode(mode, reflectionals)
+        self.permutation = Permutation(self.space.size,
+                                       session.entropy.to_bytes(32, 'big'))
+        self.position = position
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state['mode'], state['reflectionals'], state['seed'],
+                   state['position'])
+
+    def state(self):
+        return {'seed': self.seed, 'mode': self.mode,
+                'reflectionals': self.reflectionals,
+                'position': self.position, 'size': self.space.size}
+
+    def remaining(self):
+        return self.space.size - self.position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= self.space.size:
+            raise StopIteration
+        cas = self.space.unrank(self.permutation[self.position])
+        self.position += 1
+        return cas
+
+    def position_of(self, cas):
+        """Return the step at which this walk visits `cas`."""
+        return self.permutation.index(self.space.rank(cas))
@@ -0,0 +1,199 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Background phrase log writer."""
+
+import atexit
+import os
+import queue
+import threading
+import time
+
+from abugida.binlog import BinaryLogWriter, index_path
+
+SYNC_POLICIES = ('none', 'interval', 'every')
+
+_STOP = object()
+
+
+class PhraseLogger:
+    """Appends phrases to a log from a worker thread.
+
+    The log is plain text, one phrase per line, or with ``binary=True``
+    a compact binary log (see abugida.binlog) that also records the time,
+    mode and consonant assignment of every phrase.
+
+    Lines are taken from a bounded queue and written in batches. `sync`
+    decides when they are flushed and fsynced: 'none' leaves it to the
+    OS until close, 'interval' every `sync_interval` seconds and 'every'
+    after every `sync_every` lines. With `max_bytes`, the log rotates
+    like logging.handlers.RotatingFileHandler, keeping `backup_count`
+    old files as path.1, path.2, ...
+
+    A failed write (e.g. a full disk or a failed rotation) is kept in
+    `error` and raised by the next ``write()`` or by ``close()``; the
+    file is reopened if needed and logging goes on. A phrase a binary
+    log can't encode is reported the same way and left out.
+    """
+
+    def __init__(self, path, sync='interval', sync_interval=1.0,
+                 sync_every=100, max_bytes=0, backup_count=5,
+                 max_queue=10000, batch_size=256, binary=False):
+        if sync not in SYNC_POLICIES:
+            raise ValueError('sync must be one of {}'.format(SYNC_POLICIES))
+        self.path = str(path)
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self.sync_every = sync_every
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.binary = binary
+        self.error = None
+
+        self._queue = queue.Queue(max_queue)
+        self._file = self._open()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open(self):
+        if self.binary:
+            return BinaryLogWriter(self.path)
+        return open(self.path, 'a', encoding='utf-8')
+
+    def write(self, cas, mode=None, consonants=None):
+        """Queue one phrase (text or a Phrase), blocking only while the
+        queue is full.
+
+        `mode` and `consonants` are only kept by binary logs, which
+        encode a Phrase straight from its codes.
+        """
+        if self._closed:
+            raise ValueError('write to closed PhraseLogger')
+        self._raise_error()
+        self._queue.put((time.time(), cas, mode, consonants))
+
+    def _raise_error(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        stop = False
+        while not stop:
+            timeout = None
+            if self.sync == 'interval' and self._unsynced:
+                timeout = max(0, self._last_sync + self.sync_interval -
+                              time.monotonic())
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                batch = batch[:batch.index(_STOP)]
+                stop = True
+            try:
+                self._write(batch)
+                if stop:
+                    self._sync()
+            # anything else would end the thread and block write() for good
+            except Exception as e:
+                self._fail(e)
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError as e:
+                self._fail(e)
+
+    def _fail(self, error):
+        # keep the first error until it has been raised
+        if self.error is None:
+            self.error = error
+
+    def _write(self, records):
+        if self._file is None:
+            self._file = self._open()
+        if self.binary:
+            for timestamp, cas, mode, consonants in records:
+                try:
+                    self._file.write(cas, mode, consonants, timestamp)
+                except ValueError as e:
+                    self._fail(e)
+        elif records:
+            self._file.write(''.join(str(r[1]) + '\n' for r in records))
+        self._unsynced += len(records)
+        if self.sync == 'every' and self._unsynced >= self.sync_every:
+            self._sync()
+        elif (self.sync == 'interval' and self._unsynced and
+                time.monotonic() - self._last_sync >= self.sync_interval):
+            self._sync()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _sync(self):
+        if self.binary:
+            self._file.sync(self.sync != 'none')
+        else:
+            self._file.flush()
+            if self.sync != 'none':
+                os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _rotate(self):
+        self._sync()
+        # reopened by the next write if anything below fails
+        file, self._file = self._file, None
+        file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = '{}.{}'.format(self.path, i)
+                if os.path.exists(src):
+                    self._move(src, '{}.{}'.format(self.path, i + 1))
+            self._move(self.path, self.path + '.1')
+        else:
+            self._move(self.path, None)
+        self._file = self._open()
+
+    def _move(self, src, dst):
+        pairs = [(src, dst)]
+        if self.binary:
+            pairs.append((index_path(src), dst and index_path(dst)))
+        for src, dst in pairs:
+            if dst is None:
+                os.remove(src)
+            else:
+                os.replace(src, dst)
+
+    def close(self):
+        """Write out everything queued so far and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._raise_error()
@@ -0,0 +1,129 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Background pre-generation and pre-synthesis of upcoming phrases."""
+
+import collections
+import threading
+
+from abugida.core import Session, translator
+
+Prepared = collections.namedtuple(
+    'Prepared', 'phrase ipa xsampa stressed voice audio')
+
+
+class Lookahead:
+    """Keeps the next `depth` phrases generated, translated,
+    prosody-assigned and, given `synthesize(voice, text)`, rendered.
+
+    Everything queued is discarded whenever ``configure()`` is called
+    with a different mode, rotational/reflectional switch, consonant
+    assignment or voice.
+
+    Phrase n handed out by ``next()`` is drawn from its own stream,
+    ``session.child(n)``, whichever thread prepares it. What comes out
+    depends only on the seed and the configuration at each ``next()``,
+    not on how far the background thread has got, so seeded runs
+    replay exactly.
+    """
+
+    def __init__(self, depth=3, synthesize=None, session=None, model=None):
+        self.depth = depth
+        self.model = model
+        self.synthesize = synthesize
+        self.session = session or Session()
+        self.counters = collections.Counter(hits=0, misses=0,
+                                            invalidations=0)
+        self._queue = collections.deque()
+        self._config = None
+        self._generation = 0
+        self._next = 0  # number of the next phrase handed out
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def configure(self, mode, reflectionals, consonants, voice):
+        config = (mode, bool(reflectionals), tuple(consonants), voice)
+        with self._cond:
+            if config == self._config:
+                return
+            self._config = config
+            self._generation += 1
+            if self._queue:
+                self.counters['invalidations'] += 1
+                self._queue.clear()
+            self._cond.notify_all()
+
+    def prepare(self, config, n, render=True):
+        mode, reflectionals, consonants, voice = config
+        session = self.session.child(n)
+        phrase = session.phrase(mode, reflectionals, self.model)
+        tr = translator(consonants)
+        ipa, xsampa = tr.translate(phrase)
+        stressed = session.phrase_prosody(phrase, tr)
+        audio = None
+        if render and self.synthesize is not None:
+            try:
+                audio = self.synthesize(voice, stressed)
+            except OSError:
+                pass
+        return Prepared(phrase, ipa, xsampa, stressed, voice, audio)
+
+    def next(self):
+        """Return the next phrase, preparing it on the spot if the queue
+        has not caught up yet.
+        """
+        with self._cond:
+            if self._config is None:
+                raise RuntimeError('Lookahead.configure() was not called')
+            config = self._config
+            n = self._next
+            self._next += 1
+            if self._queue:
+                self.counters['hits'] += 1
+                self._cond.notify_all()
+                return self._queue.popleft()
+            self.counters['misses'] += 1
+        # rendering now would only delay the phrase; speech falls back to
+        # the normal path when there is no audio
+        return self.prepare(config, n, render=False)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (
+                        self._config is None or
+                        len(self._queue) >= self.depth):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                config, generation = self._config, self._generation
+                n = self._next + len(self._queue)
+            item = self.prepare(config, n)
+            with self._cond:
+                # a miss may have taken phrase n meanwhile
+                if (generation == self._generation and
+                        n == self._next + len(self._queue) and
+                        len(self._queue) < self.depth):
+                    self._queue.append(item)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
@@ -0,0 +1,218 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Latency instrumentation from keypress to display and sound.
+
+A Trace is started when an action begins (e.g. the G shortcut) and
+marked with a monotonic timestamp at each stage. When it is finished,
+the time from the start to every stage goes into a rolling histogram
+named ``action.stage``. Histograms can be written as JSON or served as
+text on a local port.
+"""
+
+import bisect
+import collections
+import http.server
+import json
+import os
+import threading
+import time
+
+# histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, float('inf'))
+
+
+class Trace:
+    __slots__ = ('action', 'start', 'stages')
+
+    def __init__(self, action, start=None):
+        self.action = action
+        self.start = time.monotonic() if start is None else start
+        self.stages = []
+
+    def mark(self, stage, t=None):
+        self.stages.append((stage, time.monotonic() if t is None else t))
+
+
+class Histogram:
+    """Bucketed counts since start, plus percentiles over the last
+    `window` samples.
+    """
+
+    def __init__(self, window=1000):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'last': self.recent[-1] if self.recent else None,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': {str(le): n for le, n in zip(BUCKETS, self.counts)},
+        }
+
+
+class Metrics:
+    def __init__(self, window=1000):
+        self.window = window
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def begin(self, action):
+        return Trace(action)
+
+    def finish(self, trace):
+        with self._lock:
+            for stage, t in trace.stages:
+                name = '{}.{}'.format(trace.action, stage)
+                hist = self.histograms.get(name)
+                if hist is None:
+                    hist = self.histograms[name] = Histogram(self.window)
+                hist.add(t - trace.start)
+
+    def observe(self, name, value):
+        """Add one value, in seconds, to the histogram `name`."""
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram(self.window)
+            hist.add(value)
+
+    def get(self, name):
+        return self.histograms.get(name)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: h.summary()
+                    for name, h in sorted(self.histograms.items())}
+
+    def write_json(self, path):
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+            f.write('\n')
+        os.replace(tmp, path)
+
+    def to_text(self):
+        """Prometheus-style exposition of every histogram."""
+        lines = ['# TYPE abugida_latency_seconds histogram']
+        for name, s in self.snapshot().items():
+            cumulative = 0
+            for le, n in s['buckets'].items():
+                cumulative += n
+                le = '+Inf' if le == 'inf' else le
+                lines.append('abugida_latency_seconds_bucket'
+                             '{{stage="{}",le="{}"}} {}'
+                             .format(name, le, cumulative))
+            lines.append('abugida_latency_seconds_sum{{stage="{}"}} {}'
+                         .format(name, s['sum']))
+            lines.append('abugida_latency_seconds_count{{stage="{}"}} {}'
+                         .format(name, s['count']))
+            for q in ('p50', 'p95', 'p99'):
+                if s[q] is not None:
+                    lines.append('abugida_latency_seconds_window'
+                                 '{{stage="{}",quantile="0.{}"}} {}'
+                                 .format(name, q[1:], s[q]))
+        return '\n'.join(lines) + '\n'
+
+
+class PhaseTimer:
+    """Wall time of consecutive phases, e.g. of application startup.
+
+    ``mark(name)`` ends the phase that began at the previous mark (or at
+    `start`). Work running alongside on other threads is recorded with
+    ``background(name, seconds)`` and reported separately.
+    """
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.last = self.start
+        self.phases = []
+        self.background_phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def background(self, name, seconds):
+        self.background_phases.append((name, seconds))
+
+    def report(self):
+        lines = ['{:<28}{:>9.1f} ms'.format(name, seconds * 1000)
+                 for name, seconds in self.phases]
+        lines.append('{:<28}{:>9.1f} ms'.format(
+            'total', (self.last - self.start) * 1000))
+        for name, seconds in self.background_phases:
+            lines.append('{:<28}{:>9.1f} ms'.format(
+                name + ' (background)', seconds * 1000))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves ``/metrics`` (text) and ``/metrics.json`` on localhost."""
+
+    def __init__(self, metrics, port=0, host='127.0.0.1'):
+        self.metrics = metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path == '/metrics':
+                    body = metrics.to_text().encode('utf-8')
+                    ctype = 'text/plain; version=0.0.4'
+                elif handler.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot()).encode('utf-8')
+                    ctype = 'application/json'
+                else:
+                    handler.send_error(404)
+                    return
+                handler.send_response(200)
+                handler.send_header('Content-Type', ctype)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
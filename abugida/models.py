@@ -0,0 +1,318 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Pluggable phrase generation models, loaded from JSON config files.
+
+A model decides word and line lengths and which syllable comes next.
+Syllables are named by shape and vowel, e.g. ``delta-i`` or ``arch-a``;
+the reflectional shapes share the codes of their rotational
+counterparts (loop = delta, hook = chevron, bar = arch), so one model
+serves both groups. Three kinds are supported::
+
+    {"model": "uniform"}
+
+    {"model": "weighted",
+     "shapes": {"delta": 3, "chevron": 1, "arch": 1},
+     "vowels": {"a": 4, "i": 2},
+     "word_lengths": {"2": 1, "3": 3, "4": 1},
+     "line_lengths": {"3": 1}}
+
+    {"model": "markov", "order": 1,
+     "transitions": {"delta-a": {"chevron-i": 3, "arch-o": 1},
+                     "chevron-i": {"delta-a": 1}}}
+
+``syllables`` gives joint weights instead of ``shapes`` x ``vowels``.
+Lengths default to the uniform 2-6 syllables per word and 2-5 words per
+line. A Markov chain starts each word from the weighted (or uniform)
+distribution and then follows the longest context with ``transitions``
+of its own, backing off to shorter ones. Every distribution is turned
+into an alias table when the model is loaded, so each draw takes O(1)
+time whatever the model's size. The uniform model with default lengths
+is the built-in generator and draws exactly as ``core`` does.
+"""
+
+import json
+import math
+
+from abugida.core import (BOUNDARY, GENERATORS, GROUP, PHRASE_GENERATORS,
+                          SHAPE_NAMES, VOW, Phrase)
+
+VOWELS = tuple(VOW)
+WORD_LENGTHS = {n: 1 for n in range(2, 7)}
+LINE_LENGTHS = {n: 1 for n in range(2, 6)}
+MAX_ORDER = 3
+
+
+class AliasTable:
+    """Walker/Vose alias table: O(1) draws from a discrete distribution.
+
+    ``values[i]`` is returned with probability proportional to
+    ``weights[i]``. One uniform draw picks a column and decides between
+    the column and its alias.
+    """
+
+    __slots__ = ('values', 'prob', 'alias')
+
+    def __init__(self, weights, values=None):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0 or min(weights) < 0:
+            raise ValueError('weights must be non-negative with a '
+                             'positive sum')
+        self.values = list(range(n)) if values is None else list(values)
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        # leftovers are 1 up to rounding
+
+    def __len__(self):
+        return len(self.values)
+
+    def sample(self, rng):
+        u = rng.random() * len(self.prob)
+        i = min(int(u), len(self.prob) - 1)
+        if u - i < self.prob[i]:
+            return self.values[i]
+        return self.values[self.alias[i]]
+
+
+class UniformModel:
+    """The built-in generator: uniform syllables and lengths."""
+
+    name = 'uniform'
+    config = {'model': 'uniform'}
+
+    def generate(self, mode, reflectionals, rng):
+        return GENERATORS[mode](reflectionals, rng)
+
+    def phrase(self, mode, reflectionals, rng):
+        return PHRASE_GENERATORS[mode](reflectionals, rng)
+
+
+UNIFORM = UniformModel()
+
+
+class Model:
+    """Syllables from an order-`order` Markov chain over the 12 codes.
+
+    ``tables[l]`` holds one AliasTable per context of `l` syllables
+    (``12 ** l`` of them, indexed by the codes read as base-12 digits);
+    order 0 is a plain weighted model. Contexts do not cross words.
+    """
+
+    def __init__(self, tables, word_lengths, line_lengths, name='model',
+                 config=None):
+        self.tables = tables
+        self.order = len(tables) - 1
+        self.word_lengths = word_lengths
+        self.line_lengths = line_lengths
+        self.name = name
+        self.config = config
+
+    def codes(self, n, rng):
+        """Return the codes of one word of `n` syllables."""
+        tables = self.tables
+        order = self.order
+        span = GROUP ** order
+        ctx = 0
+        out = []
+        for j in range(n):
+            code = tables[min(j, order)][ctx].sample(rng)
+            out.append(code)
+            ctx = (ctx * GROUP + code) % span
+        return out
+
+    def phrase(self, mode, reflectionals, rng):
+        if mode not in GENERATORS:
+            raise ValueError('unknown mode {!r}'.format(mode))
+        offset = GROUP if reflectionals else 0
+        if mode == 'syl':
+            return Phrase([self.codes(1, rng)[0] + offset])
+        n = self.line_lengths.sample(rng) if mode == 'line' else 1
+        out = bytearray()
+        for i in range(n):
+            if i:
+                out.append(BOUNDARY)
+            out.extend([c + offset for c in
+                        self.codes(self.word_lengths.sample(rng), rng)])
+        return Phrase(out)
+
+    def generate(self, mode, reflectionals, rng):
+        return self.phrase(mode, reflectionals, rng).text
+
+
+def parse_syllable(name):
+    """Return the code for a name like 'delta-i' (or 'loop-i')."""
+    try:
+        shape, vowel = name.strip().split('-')
+        return (SHAPE_NAMES.index(shape) % 3) * 4 + VOWELS.index(vowel)
+    except ValueError:
+        raise ValueError(
+            'bad syllable {!r}: expected shape-vowel, e.g. delta-i, with '
+            'shape in {} and vowel in {}'.format(
+                name, ', '.join(SHAPE_NAMES), ', '.join(VOWELS))) from None
+
+
+def _table(spec, what):
+    # config sections are JSON objects
+    if not isinstance(spec, dict):
+        raise ValueError('{} must be an object of weights, not {!r}'.format(
+            what, spec))
+    return spec
+
+
+def _weight(w, what, key):
+    if (isinstance(w, bool) or not isinstance(w, (int, float)) or
+            not math.isfinite(w)):
+        raise ValueError('{} weight for {!r} must be a number, not '
+                         '{!r}'.format(what, key, w))
+    return float(w)
+
+
+def _weights(spec, names, what):
+    # a {name: weight} dict over `names`; missing names weigh 0
+    weights = [0.0] * len(names)
+    for key, w in _table(spec, what + 's').items():
+        if key not in names:
+            raise ValueError('unknown {} {!r}, choose from: {}'.format(
+                what, key, ', '.join(names)))
+        weights[names.index(key)] = _weight(w, what, key)
+    return weights
+
+
+def _length_table(spec, default, what):
+    if spec is None:
+        spec = default
+    else:
+        lengths = {}
+        for key, w in _table(spec, what).items():
+            try:
+                n = int(key)
+            except ValueError:
+                raise ValueError('{} key {!r} must be a whole number'.format(
+                    what, key)) from None
+            lengths[n] = _weight(w, what, key)
+        spec = lengths
+    if any(n < 1 for n in spec):
+        raise ValueError('{} must be at least 1'.format(what))
+    lengths = sorted(spec)
+    return AliasTable([float(spec[n]) for n in lengths], lengths)
+
+
+def _syllable_weights(config):
+    if 'syllables' in config:
+        weights = [0.0] * GROUP
+        for name, w in _table(config['syllables'], 'syllables').items():
+            weights[parse_syllable(name)] += _weight(w, 'syllable', name)
+        return weights
+    shapes = [1.0] * 3
+    vowels = [1.0] * 4
+    if 'shapes' in config:
+        # reflectional names weigh the same shape as their counterparts
+        full = _weights(config['shapes'], list(SHAPE_NAMES), 'shape')
+        shapes = [full[i] + full[i + 3] for i in range(3)]
+    if 'vowels' in config:
+        vowels = _weights(config['vowels'], list(VOWELS), 'vowel')
+    return [s * v for s in shapes for v in vowels]
+
+
+def _context(key):
+    return tuple(parse_syllable(name) for name in key.split())
+
+
+def model_from_config(config):
+    """Build a model from a parsed config dict.
+
+    Raises ValueError, naming the offending key, for anything that is
+    not a valid model.
+    """
+    if not isinstance(config, dict):
+        raise ValueError('a model config must be a JSON object, not '
+                         '{!r}'.format(config))
+    kind = config.get('model', 'uniform')
+    if kind not in ('uniform', 'weighted', 'markov'):
+        raise ValueError('unknown model {!r}, choose from: uniform, '
+                         'weighted, markov'.format(kind))
+    name = config.get('name', kind)
+    if (kind == 'uniform' and 'word_lengths' not in config and
+            'line_lengths' not in config):
+        return UNIFORM
+    word_lengths = _length_table(config.get('word_lengths'), WORD_LENGTHS,
+                                 'word_lengths')
+    line_lengths = _length_table(config.get('line_lengths'), LINE_LENGTHS,
+                                 'line_lengths')
+    if kind == 'uniform':
+        start = AliasTable([1.0] * GROUP)
+    else:
+        start = AliasTable(_syllable_weights(config))
+    tables = [[start]]
+
+    if kind == 'markov':
+        order = config.get('order', 1)
+        if (isinstance(order, bool) or not isinstance(order, int) or
+                not 1 <= order <= MAX_ORDER):
+            raise ValueError('order must be from 1 to {}'.format(MAX_ORDER))
+        rows = {}
+        transitions = _table(config.get('transitions', {}), 'transitions')
+        for key, spec in transitions.items():
+            ctx = _context(key)
+            if not 1 <= len(ctx) <= order:
+                raise ValueError('transition context {!r} must have 1 to '
+                                 '{} syllables'.format(key, order))
+            what = 'transitions from {!r}'.format(key)
+            weights = [0.0] * GROUP
+            for name, w in _table(spec, what).items():
+                weights[parse_syllable(name)] += _weight(w, what, name)
+            try:
+                rows[ctx] = AliasTable(weights)
+            except ValueError:
+                raise ValueError('transitions from {!r} have no positive '
+                                 'weight'.format(key)) from None
+        for length in range(1, order + 1):
+            level = []
+            for index in range(GROUP ** length):
+                ctx = tuple((index // GROUP ** p) % GROUP
+                            for p in reversed(range(length)))
+                # back off to the longest suffix with transitions
+                for k in range(length):
+                    if ctx[k:] in rows:
+                        level.append(rows[ctx[k:]])
+                        break
+                else:
+                    level.append(start)
+            tables.append(level)
+    return Model(tables, word_lengths, line_lengths, name, config)
+
+
+def load_model(path):
+    """Load a model from a JSON config file."""
+    with open(path, encoding='utf-8') as f:
+        try:
+            config = json.load(f)
+        except ValueError as e:
+            raise ValueError('{}: {}'.format(path, e)) from None
+    try:
+        return model_from_config(config)
+    except ValueError as e:
+        raise ValueError('{}: {}'.format(path, e)) from None
@@ -0,0 +1,310 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Offline rendering of a whole performance to one audio file.
+
+Each entry of a set list (one JSON object per line, see read_setlist)
+is synthesized with ``espeak-ng --stdout`` on a thread pool. Results are
+taken back in order through a bounded window, so memory holds only a
+few phrases at a time, and their samples are streamed straight into a
+single WAV file, or into FLAC through the ``flac`` encoder, with
+silence between phrases. No temporary files are written. The start
+and length of every phrase are kept in samples for the cue sheet.
+"""
+
+import collections
+import concurrent.futures
+import json
+import os
+import struct
+import subprocess
+
+from abugida import speech
+from abugida.core import Session, translator
+
+DEFAULT_VOICE = speech.Voice('m3', 50, 175, 10, 50)
+FLAC = 'flac'
+SILENCE_CHUNK = 1 << 16  # bytes of silence per write
+MAX_TRACKS = 99  # CUE track numbers have two digits
+
+Entry = collections.namedtuple('Entry', 'text voice pause cas')
+Entry.__new__.__defaults__ = (DEFAULT_VOICE, None, '')
+
+Cue = collections.namedtuple('Cue', 'number start frames text voice cas')
+
+WavFormat = collections.namedtuple('WavFormat', 'rate channels width')
+
+
+def read_setlist(f):
+    """Yield an Entry for each JSON line of `f`.
+
+    ``text`` is the X-SAMPA to speak (with any stress and length marks).
+    ``voice``, ``pitch``, ``speed``, ``gap`` and ``amplitude`` default to
+    DEFAULT_VOICE, ``pause`` overrides the silence after the phrase in
+    seconds, and ``cas`` is carried through to the cue sheet.
+    """
+    for lineno, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            voice = DEFAULT_VOICE._replace(
+                **{k: obj[k] for k in DEFAULT_VOICE._fields if k in obj})
+            yield Entry(obj['text'], voice, obj.get('pause'),
+                        obj.get('cas', ''))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError('set list line {}: {!r}'.format(lineno, e)) \
+                from None
+
+
+def generate_setlist(n, mode='line', seed=None, consonants=None,
+                     reflectionals=False):
+    """Yield `n` random entries, each with its own random voice."""
+    session = Session(seed, ('setlist',))
+    phrases = session.child('phrases')
+    prosody = session.child('prosody')
+    voices = session.child('voice')
+    if consonants is None:
+        consonants = session.random_consonants()
+    tr = translator(consonants)
+    for _ in range(n):
+        phrase = phrases.phrase(mode, reflectionals)
+        voice = speech.Voice(*voices.random_voice(), DEFAULT_VOICE.amplitude)
+        yield Entry(prosody.phrase_prosody(phrase, tr), voice, None,
+                    phrase.text)
+
+
+def parse_wav(data):
+    """Return (WavFormat, PCM memoryview) of WAV `data`.
+
+    The data chunk runs to the end of the input when its declared size
+    is missing or too large, as in the streaming header espeak-ng writes
+    to a pipe.
+    """
+    view = memoryview(data)
+    if bytes(view[:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        raise ValueError('not WAV data')
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        size, = struct.unpack_from('<I', view, pos + 4)
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            tag, channels, rate, _, _, bits = struct.unpack_from(
+                '<HHIIHH', view, body)
+            if tag != 1:
+                raise ValueError('unsupported WAV encoding {}'.format(tag))
+            fmt = WavFormat(rate, channels, bits // 8)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('WAV data before format')
+            end = min(body + size, len(view))
+            frame = fmt.channels * fmt.width
+            end -= (end - body) % frame
+            return fmt, view[body:end]
+        pos = body + size + (size & 1)
+    raise ValueError('WAV data chunk missing')
+
+
+class WavSink:
+    """Streams PCM into a WAV file.
+
+    The header is written up front with unknown sizes and rewritten on
+    close when the output can seek; a pipe keeps the 0xFFFFFFFF sizes
+    that streaming readers accept.
+    """
+
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        self.bytes = 0
+        self.f.write(self._header(0xFFFFFFFF))
+
+    def _header(self, data_size):
+        fmt = self.fmt
+        riff_size = min(0xFFFFFFFF, data_size + 36)
+        return struct.pack(
+            '<4sI4s4sIHHIIHH4sI', b'RIFF', riff_size, b'WAVE', b'fmt ', 16,
+            1, fmt.channels, fmt.rate,
+            fmt.rate * fmt.channels * fmt.width, fmt.channels * fmt.width,
+            fmt.width * 8, b'data', data_size)
+
+    def write(self, pcm):
+        self.f.write(pcm)
+        self.bytes += len(pcm)
+
+    def close(self):
+        if self.f.seekable() and self.bytes + 36 <= 0xFFFFFFFF:
+            end = self.f.tell()
+            self.f.seek(0)
+            self.f.write(self._header(self.bytes))
+            self.f.seek(end)
+        self.f.flush()
+
+
+class FlacSink:
+    """Streams PCM through the ``flac`` encoder into `path`."""
+
+    def __init__(self, path, fmt, executable=FLAC):
+        self.bytes = 0
+        self.proc = subprocess.Popen(
+            [executable, '--silent', '--force', '--force-raw-format',
+             '--endian=little', '--sign=signed',
+             '--channels={}'.format(fmt.channels),
+             '--bps={}'.format(fmt.width * 8),
+             '--sample-rate={}'.format(fmt.rate), '-o', path, '-'],
+            stdin=subprocess.PIPE)
+
+    def write(self, pcm):
+        self.proc.stdin.write(pcm)
+        self.bytes += len(pcm)
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise OSError('flac exited with {}'.format(self.proc.returncode))
+
+
+class Renderer:
+    """Synthesizes entries in parallel and writes them out in order.
+
+    `synthesize(voice, text)` returns WAV data; `open_sink(fmt)` is
+    called with the format of the first phrase and returns an object
+    with ``write(pcm)`` and ``close()``.
+    """
+
+    def __init__(self, open_sink, gap=1.0, workers=None,
+                 synthesize=speech.synthesize, window=None):
+        self.open_sink = open_sink
+        self.gap = gap
+        self.workers = workers or os.cpu_count() or 1
+        self.window = window or 2 * self.workers
+        self.synthesize = synthesize
+        self.sink = None
+        self.fmt = None
+        self.frames = 0
+        self.cues = []
+
+    def _silence(self, seconds):
+        fmt = self.fmt
+        frames = round(seconds * fmt.rate)
+        remaining = frames * fmt.channels * fmt.width
+        zeros = bytes(min(remaining, SILENCE_CHUNK))
+        while remaining:
+            chunk = zeros[:remaining]
+            self.sink.write(chunk)
+            remaining -= len(chunk)
+        self.frames += frames
+
+    def _append(self, entry, data, pause):
+        fmt, pcm = parse_wav(data)
+        if self.sink is None:
+            self.fmt = fmt
+            self.sink = self.open_sink(fmt)
+        elif fmt != self.fmt:
+            raise ValueError('phrase {} is {}, expected {}'.format(
+                len(self.cues) + 1, fmt, self.fmt))
+        if pause:
+            self._silence(pause)
+        frames = len(pcm) // (fmt.channels * fmt.width)
+        self.cues.append(Cue(len(self.cues) + 1, self.frames, frames,
+                             entry.text, entry.voice, entry.cas))
+        self.sink.write(pcm)
+        self.frames += frames
+
+    def render(self, entries):
+        """Render `entries` and return the list of Cues."""
+        pending = collections.deque()
+        pause = 0
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            try:
+                for entry in entries:
+                    pending.append((entry, pool.submit(
+                        self.synthesize, entry.voice, entry.text)))
+                    if len(pending) >= self.window:
+                        pause = self._take(pending, pause)
+                while pending:
+                    pause = self._take(pending, pause)
+            except BaseException:
+                for _, future in pending:
+                    future.cancel()
+                raise
+            finally:
+                if self.sink is not None:
+                    self.sink.close()
+        return self.cues
+
+    def _take(self, pending, pause):
+        entry, future = pending.popleft()
+        self._append(entry, future.result(), pause)
+        return self.gap if entry.pause is None else entry.pause
+
+
+def _timestamp(frames, rate):
+    # CUE sheets count in 1/75 s frames
+    total = frames * 75 // rate
+    return '{:02d}:{:02d}:{:02d}'.format(
+        total // 4500, total // 75 % 60, total % 75)
+
+
+def cue_sheets(path, cues):
+    """Split `cues` into CUE sheets of at most MAX_TRACKS tracks.
+
+    Returns (path, cues) pairs: `path` itself for the first sheet, then
+    ``name-2.cue``, ``name-3.cue`` and so on. Every sheet refers to the
+    whole audio file.
+    """
+    root, ext = os.path.splitext(path)
+    return [(path if i == 0 else '{}-{}{}'.format(root, i + 1, ext),
+             cues[start:start + MAX_TRACKS])
+            for i, start in enumerate(range(0, len(cues), MAX_TRACKS))]
+
+
+def write_cues(f, cues, rate, audio_name):
+    """Write a CUE sheet of at most MAX_TRACKS cues (see cue_sheets).
+
+    Tracks are numbered from 1 within the sheet and the phrase number
+    is kept in a REM line, as is the exact start sample of each phrase,
+    since CUE times resolve only to 1/75 s.
+    """
+    if len(cues) > MAX_TRACKS:
+        raise ValueError('a CUE sheet holds at most {} tracks, not '
+                         '{}'.format(MAX_TRACKS, len(cues)))
+    ext = os.path.splitext(audio_name)[1].lower()
+    kind = 'FLAC' if ext == '.flac' else 'WAVE'
+    f.write('FILE "{}" {}\n'.format(audio_name, kind))
+    for track, cue in enumerate(cues, 1):
+        f.write('  TRACK {:02d} AUDIO\n'.format(track))
+        title = cue.cas or cue.text
+        f.write('    TITLE "{}"\n'.format(title.replace('"', "'")))
+        f.write('    REM PHRASE {}\n'.format(cue.number))
+        f.write('    REM XSAMPA "{}"\n'.format(cue.text.replace('"', "'")))
+        f.write('    REM VOICE "{} {} {} {} {}"\n'.format(*cue.voice))
+        f.write('    REM SAMPLE_START {}\n'.format(cue.start))
+        f.write('    REM SAMPLE_LENGTH {}\n'.format(cue.frames))
+        f.write('    INDEX 01 {}\n'.format(_timestamp(cue.start, rate)))
+
+
+def write_labels(f, cues, rate):
+    """Write tab-separated cues: number, start and length in samples,
+    start in seconds, voice and phrase.
+    """
+    f.write('track\tstart\tframes\tseconds\tvoice\tcas\txsampa\n')
+    for cue in cues:
+        f.write('{}\t{}\t{}\t{:.6f}\t{}\t{}\t{}\n'.format(
+            cue.number, cue.start, cue.frames, cue.start / rate,
+            ','.join(str(v) for v in cue.voice), cue.cas, cue.text))
@@ -0,0 +1,761 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Speech synthesis backends for espeak-ng.
+
+The preferred backend is a long-lived worker process
+(``python -m abugida.speech``) that loads libespeak-ng once through
+ctypes and keeps it warm between phrases. The GUI talks to it over a
+pipe, one JSON object per line::
+
+    -> {"id": 1, "voice": "m3", "pitch": 50, "speed": 175, "gap": 10,
+        "amplitude": 50, "text": "'pa: ,ti"}
+    <- {"id": 1, "event": "start"}      # first audio handed to the device
+    <- {"id": 1, "event": "done"}       # or "error" with a "message"
+
+and the worker announces ``{"event": "ready"}`` once the engine is loaded.
+``{"event": "cancel"}`` stops the phrase being spoken, and any sent
+before the cancel that have not started, each of which answers
+``{"id": ..., "event": "cancelled"}`` instead of "done". A request with
+``"render": true`` is not played: it is answered with the WAV data,
+base64-encoded, as ``{"id": 1, "event": "done", "wav": "..."}``, and is
+not affected by cancels.
+Any executable that speaks this protocol can stand in for the worker,
+e.g. a stub synthesizer in tests. Without libespeak-ng, speech falls
+back to one ``espeak-ng`` process per phrase.
+"""
+
+import array
+import base64
+import collections
+import ctypes
+import ctypes.util
+import io
+import itertools
+import json
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import wave
+
+from abugida.cache import cache_key
+
+ESPEAK = 'espeak-ng'
+WORKER = (sys.executable, '-m', 'abugida.speech')
+PLAYER = ('aplay', '-q', '-')  # plays WAV data from stdin
+
+Voice = collections.namedtuple('Voice', 'voice pitch speed gap amplitude')
+
+
+def phonemes(xsampa):
+    # espeak-ng reads [[...]] as phoneme mnemonics rather than text
+    return '[[' + xsampa + ']]'
+
+
+def espeak_args(voice, text, executable=ESPEAK, stdout=False):
+    args = [executable,
+            '-ven+{}'.format(voice.voice),
+            '-p', str(voice.pitch),
+            '-s', str(voice.speed),
+            '-g', str(voice.gap),
+            '-a', str(voice.amplitude),
+            phonemes(text)]
+    if stdout:
+        args.insert(1, '--stdout')
+    return args
+
+
+def synthesize(voice, text, executable=ESPEAK):
+    """Render a phrase to WAV data instead of playing it."""
+    proc = subprocess.run(espeak_args(voice, text, executable, stdout=True),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0 or not proc.stdout:
+        raise OSError('{} failed: {}'.format(
+            executable, proc.stderr.decode(errors='replace').strip()))
+    return proc.stdout
+
+
+def player_available(player=PLAYER):
+    """Whether WAV data can be played, i.e. `player` is on PATH."""
+    return bool(player) and shutil.which(player[0]) is not None
+
+
+def play_wav(data, player=PLAYER, timing=None, track=None):
+    proc = subprocess.Popen(player, stdin=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL)
+    if track is not None:
+        track(proc)
+    if timing is not None:
+        timing.first_sound = time.monotonic()
+    proc.communicate(data)
+    if proc.returncode != 0:
+        raise OSError('{} exited with {}'.format(player[0], proc.returncode))
+
+
+def stream_wav(args, player=PLAYER, timing=None, track=None):
+    """Run a synthesizer writing WAV to stdout and play it as it comes.
+
+    Playback starts with the first chunk rather than after the whole
+    phrase. Returns the complete WAV data, or None if synthesis failed
+    or was cut short.
+    """
+    synth = subprocess.Popen(args, stdout=subprocess.PIPE)
+    try:
+        proc = subprocess.Popen(player, stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL)
+    except OSError:
+        synth.kill()
+        synth.wait()
+        raise
+    if track is not None:
+        track(synth, proc)
+    chunks = []
+    try:
+        while True:
+            chunk = synth.stdout.read1(1 << 16)
+            if not chunk:
+                break
+            if timing is not None and timing.first_sound is None:
+                timing.first_sound = time.monotonic()
+            chunks.append(chunk)
+            proc.stdin.write(chunk)
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    finally:
+        synth.stdout.close()
+        synth.wait()
+        proc.wait()
+    if synth.returncode != 0 or not chunks:
+        return None
+    return b''.join(chunks)
+
+
+class SpeechTiming:
+    """Monotonic timestamps for one utterance."""
+
+    def __init__(self):
+        self.requested = time.monotonic()
+        self.started = None
+        self.first_sound = None
+        self.finished = None
+        self.error = None
+        self.cancelled = False
+        self._done = threading.Event()
+
+    @property
+    def ttfs(self):
+        """Time to first sound in seconds, if the backend can observe it."""
+        if self.first_sound is None:
+            return None
+        return self.first_sound - self.requested
+
+    def finish(self, error=None):
+        self.finished = time.monotonic()
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Mark the utterance as cut short or never played."""
+        self.cancelled = True
+        if not self._done.is_set():
+            self.finish('cancelled')
+
+
+class _Backend:
+    def __init__(self, player=PLAYER):
+        self.player = player
+        self.ttfs = collections.deque(maxlen=100)
+        self._current = ()  # the processes speaking right now, if any
+        self._cancelled = False
+        self._current_lock = threading.Lock()
+
+    def _track(self, *procs):
+        with self._current_lock:
+            self._current = procs
+            if self._cancelled:
+                for proc in procs:
+                    proc.kill()
+
+    def _untrack(self):
+        with self._current_lock:
+            self._current = ()
+
+    def cancel(self):
+        """Stop the utterance in progress, killing its processes.
+
+        An utterance that has not started its process yet is stopped as
+        soon as it does, until ``reset()``.
+        """
+        with self._current_lock:
+            self._cancelled = True
+            for proc in self._current:
+                if proc.poll() is None:
+                    proc.kill()
+
+    def reset(self):
+        """Let the next utterance play after a ``cancel()``."""
+        with self._current_lock:
+            self._cancelled = False
+
+    def _record(self, timing):
+        if timing.ttfs is not None:
+            self.ttfs.append(timing.ttfs)
+
+    def ttfs_summary(self):
+        """Return (last, mean) time to first sound in seconds, or None."""
+        if not self.ttfs:
+            return None
+        return self.ttfs[-1], sum(self.ttfs) / len(self.ttfs)
+
+    def play(self, data, timing=None):
+        """Play already rendered WAV data, timed by `timing` if given."""
+        if timing is None:
+            timing = SpeechTiming()
+            timing.started = time.monotonic()
+        try:
+            play_wav(data, self.player, timing, self._track)
+        except OSError as e:
+            timing.finish(str(e))
+        else:
+            timing.finish()
+        finally:
+            self._untrack()
+        self._record(timing)
+        return timing
+
+    def close(self):
+        pass
+
+
+class SubprocessSpeech(_Backend):
+    """One espeak-ng process per phrase. Slow to start, but always there.
+
+    With a player on PATH the audio is piped through it, so the time to
+    first sound is observed as for the other backends; otherwise
+    espeak-ng plays it directly and the time is not known.
+    """
+
+    name = 'subprocess'
+
+    def __init__(self, executable=ESPEAK, player=PLAYER):
+        super().__init__(player)
+        self.executable = executable
+        self.piped = player_available(player)
+
+    def speak(self, voice, text):
+        timing = SpeechTiming()
+        timing.started = time.monotonic()
+        try:
+            if self.piped:
+                stream_wav(espeak_args(voice, text, self.executable,
+                                       stdout=True),
+                           self.player, timing, self._track)
+            else:
+                proc = subprocess.Popen(espeak_args(voice, text,
+                                                    self.executable))
+                self._track(proc)
+                proc.wait()
+        except OSError as e:
+            timing.finish(str(e))
+        else:
+            timing.finish()
+        finally:
+            self._untrack()
+        self._record(timing)
+        return timing
+
+    def synthesize(self, voice, text):
+        return synthesize(voice, text, self.executable)
+
+
+class SpeechWorker(_Backend):
+    """Client for a persistent synthesis worker process.
+
+    A phrase that takes longer than `speak_timeout` seconds means the
+    worker is stuck: it is killed, and later phrases are spoken by
+    `fallback` (a SubprocessSpeech) if there is one. ``cancel()`` asks
+    the worker to stop and only kills it if the phrases it cut short are
+    not answered within `cancel_timeout` seconds.
+
+    ``synthesize()`` renders in the same warm worker, so a phrase can be
+    cached or prepared ahead without starting espeak-ng.
+    """
+
+    name = 'worker'
+
+    def __init__(self, command=WORKER, timeout=10, player=PLAYER,
+                 speak_timeout=30, fallback=None, cancel_timeout=1):
+        super().__init__(player)
+        self.command = list(command)
+        self.timeout = timeout
+        self.speak_timeout = speak_timeout
+        self.cancel_timeout = cancel_timeout
+        self.fallback = fallback
+        self.failed = False
+        self._proc = None
+        self._pending = {}
+        self._renders = set()  # ids of pending render requests
+        self._audio = {}  # base64 WAV data by render request id
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        proc = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, text=True,
+                                encoding='utf-8', bufsize=1)
+        ready = proc.stdout.readline()
+        try:
+            if json.loads(ready).get('event') != 'ready':
+                raise ValueError(ready)
+        except ValueError:
+            proc.kill()
+            proc.wait()
+            raise OSError('speech worker did not start: {!r}'.format(ready))
+        self._proc = proc
+        threading.Thread(target=self._read, args=(proc,),
+                         daemon=True).start()
+
+    def _read(self, proc):
+        for line in proc.stdout:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                timing = self._pending.get(msg.get('id'))
+                if timing is None:
+                    continue
+                event = msg.get('event')
+                if event == 'start':
+                    timing.first_sound = time.monotonic()
+                elif event in ('done', 'error', 'cancelled'):
+                    del self._pending[msg['id']]
+                    self._renders.discard(msg['id'])
+                    if 'wav' in msg:
+                        self._audio[msg['id']] = msg['wav']
+            if event == 'done':
+                timing.finish()
+            elif event == 'cancelled':
+                timing.cancel()
+            elif event == 'error':
+                timing.finish(msg.get('message', 'synthesis failed'))
+
+        # worker exited: fail whatever it still owed us
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._renders.clear()
+        for timing in pending:
+            timing.finish('speech worker exited')
+
+    def speak(self, voice, text):
+        if self.failed and self.fallback is not None:
+            timing = self.fallback.speak(voice, text)
+        else:
+            timing = self._request(voice, text)[0]
+        self._record(timing)
+        return timing
+
+    def synthesize(self, voice, text):
+        """Render a phrase to WAV data in the worker, without playing it."""
+        if self.failed and self.fallback is not None:
+            return self.fallback.synthesize(voice, text)
+        timing, req_id = self._request(voice, text, render=True)
+        with self._lock:
+            data = self._audio.pop(req_id, None)
+        if timing.error is not None:
+            raise OSError(timing.error)
+        if not data:
+            raise OSError('speech worker sent no audio')
+        return base64.b64decode(data)
+
+    def _request(self, voice, text, render=False):
+        # returns (timing, request id), once the worker has answered
+        timing = SpeechTiming()
+        with self._lock:
+            if self._cancelled and not render:
+                timing.cancel()
+                return timing, None
+            try:
+                self._start()
+            except OSError as e:
+                timing.finish(str(e))
+                return timing, None
+            req_id = next(self._ids)
+            self._pending[req_id] = timing
+            request = dict(voice._asdict(), id=req_id, text=text)
+            if render:
+                request['render'] = True
+                self._renders.add(req_id)
+            timing.started = time.monotonic()
+            try:
+                self._proc.stdin.write(json.dumps(request) + '\n')
+                self._proc.stdin.flush()
+            except OSError as e:
+                del self._pending[req_id]
+                self._renders.discard(req_id)
+                timing.finish(str(e))
+                return timing, None
+        if not timing.wait(self.speak_timeout):
+            self._hung(req_id, timing)
+        return timing, req_id
+
+    def _hung(self, req_id, timing):
+        with self._lock:
+            self._pending.pop(req_id, None)
+            self._renders.discard(req_id)
+            proc, self._proc = self._proc, None
+            self.failed = True
+        if proc is not None:
+            proc.kill()
+            proc.wait()
+        timing.finish('speech worker did not answer in {}s'.format(
+            self.speak_timeout))
+
+    def cancel(self):
+        # never blocks: the worker is told to stop, and a timer kills it
+        # if it does not answer for what it was speaking
+        with self._lock:
+            super().cancel()
+            proc = self._proc
+            ids = [i for i in self._pending if i not in self._renders]
+            if proc is not None and ids:
+                try:
+                    proc.stdin.write(json.dumps({'event': 'cancel'}) + '\n')
+                    proc.stdin.flush()
+                except OSError:
+                    pass  # gone already; the reader fails what is pending
+                else:
+                    timer = threading.Timer(self.cancel_timeout,
+                                            self._cancel_expired,
+                                            args=(proc, ids))
+                    timer.daemon = True
+                    timer.start()
+        if self.fallback is not None:
+            self.fallback.cancel()
+
+    def _cancel_expired(self, proc, ids):
+        with self._lock:
+            if self._proc is not proc or \
+                    not any(i in self._pending for i in ids):
+                return
+            self._proc = None
+        # stuck mid-phrase; the next phrase starts a new worker
+        proc.kill()
+        proc.wait()
+
+    def reset(self):
+        super().reset()
+        if self.fallback is not None:
+            self.fallback.reset()
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+
+
+class CachedSpeech(_Backend):
+    """Plays rendered audio from an AudioCache on a hit.
+
+    On a miss the phrase is rendered once by `inner` (in the warm worker
+    when there is one), stored and then played. A failed render is
+    reported in the timing and neither stored nor played.
+    """
+
+    name = 'cached'
+
+    def __init__(self, inner, cache, player=PLAYER):
+        super().__init__(player)
+        self.inner = inner
+        self.cache = cache
+
+    def synthesize(self, voice, text):
+        """WAV data for a phrase, from the cache or rendered and stored."""
+        key = cache_key(voice, text)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.inner.synthesize(voice, text)
+            self.cache.put(key, data)
+        return data
+
+    def speak(self, voice, text):
+        timing = SpeechTiming()
+        timing.started = time.monotonic()
+        try:
+            data = self.synthesize(voice, text)
+        except OSError as e:
+            if self._cancelled:
+                timing.cancel()
+            else:
+                timing.finish(str(e))
+            self._record(timing)
+            return timing
+        if self._cancelled:
+            timing.cancel()  # interrupted while rendering
+            return timing
+        return self.play(data, timing)
+
+    def cancel(self):
+        super().cancel()
+        self.inner.cancel()
+
+    def reset(self):
+        super().reset()
+        self.inner.reset()
+
+    def close(self):
+        self.inner.close()
+
+
+# libespeak-ng ================================================
+AUDIO_OUTPUT_SYNCH_PLAYBACK = 3
+ENOUTPUT_MODE_SYNCHRONOUS, ENOUTPUT_MODE_SPEAK_AUDIO = 0x0001, 0x0002
+POS_CHARACTER = 1
+espeakRATE, espeakVOLUME, espeakPITCH, espeakWORDGAP = 1, 2, 3, 7
+espeakCHARS_AUTO, espeakPHONEMES, espeakENDPAUSE = 0, 0x100, 0x1000
+
+SYNTH_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int,
+                                  ctypes.POINTER(ctypes.c_short),
+                                  ctypes.c_int,
+                                  ctypes.c_void_p)
+
+
+def find_library():
+    return ctypes.util.find_library('espeak-ng')
+
+
+class EspeakLibrary:
+    """libespeak-ng loaded through ctypes, playing synchronously or
+    rendering to WAV data.
+    """
+
+    def __init__(self, path=None):
+        path = path or find_library()
+        if not path:
+            raise OSError('libespeak-ng not found')
+        self.lib = ctypes.CDLL(path)
+        self.rate = self.lib.espeak_Initialize(AUDIO_OUTPUT_SYNCH_PLAYBACK,
+                                               0, None, 0)
+        if self.rate < 0:
+            raise OSError('espeak_Initialize failed')
+        self._callback = SYNTH_CALLBACK(self._on_synth)
+        self.lib.espeak_SetSynthCallback(self._callback)
+        self._voice = None
+        self._on_first_sound = None
+        self._samples = None  # chunks of rendered audio, when rendering
+        self.aborted = False
+
+    def _on_synth(self, wav, n_samples, events):
+        if self.aborted:
+            return 1  # stop synthesis
+        if self._samples is not None and wav and n_samples > 0:
+            self._samples.append(ctypes.string_at(wav, n_samples * 2))
+        if self._on_first_sound is not None:
+            on_first_sound, self._on_first_sound = self._on_first_sound, None
+            on_first_sound()
+        return 0
+
+    def arm(self):
+        """Let the next ``speak()`` play; call before each phrase."""
+        self.aborted = False
+
+    def cancel(self):
+        """Stop the phrase being spoken, from any thread."""
+        self.aborted = True
+        self.lib.espeak_Cancel()
+
+    def speak(self, voice, text, on_first_sound=None):
+        self._on_first_sound = on_first_sound
+        self._synth(voice, text)
+        if self._on_first_sound is not None:
+            # nothing was reported while playing, e.g. empty input
+            self._on_first_sound = None
+            on_first_sound()
+
+    def render(self, voice, text):
+        """Return a phrase as WAV data instead of playing it."""
+        self._samples = []
+        self._output(ENOUTPUT_MODE_SYNCHRONOUS)
+        try:
+            self._synth(voice, text)
+        finally:
+            chunks, self._samples = self._samples, None
+            self._output(ENOUTPUT_MODE_SYNCHRONOUS |
+                         ENOUTPUT_MODE_SPEAK_AUDIO)
+        pcm = array.array('h', b''.join(chunks))
+        if sys.byteorder == 'big':
+            pcm.byteswap()
+        out = io.BytesIO()
+        with wave.open(out, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.rate)
+            f.writeframes(pcm.tobytes())
+        return out.getvalue()
+
+    def _output(self, mode):
+        err = self.lib.espeak_ng_InitializeOutput(mode, 0, None)
+        if err != 0:
+            raise OSError('espeak_ng_InitializeOutput failed ({})'.format(
+                err))
+
+    def _synth(self, voice, text):
+        if voice.voice != self._voice:
+            name = 'en+{}'.format(voice.voice).encode()
+            if self.lib.espeak_SetVoiceByName(name) != 0:
+                raise ValueError('unknown voice {!r}'.format(voice.voice))
+            self._voice = voice.voice
+        self.lib.espeak_SetParameter(espeakRATE, voice.speed, 0)
+        self.lib.espeak_SetParameter(espeakPITCH, voice.pitch, 0)
+        self.lib.espeak_SetParameter(espeakWORDGAP, voice.gap, 0)
+        self.lib.espeak_SetParameter(espeakVOLUME, voice.amplitude, 0)
+
+        data = phonemes(text).encode('utf-8')
+        err = self.lib.espeak_Synth(
+            data, len(data) + 1, 0, POS_CHARACTER, 0,
+            espeakCHARS_AUTO | espeakPHONEMES | espeakENDPAUSE, None, None)
+        if err != 0:
+            raise OSError('espeak_Synth failed ({})'.format(err))
+        self.lib.espeak_Synchronize()
+
+
+def library_available():
+    return find_library() is not None
+
+
+def open_backend(command=None, executable=ESPEAK, cache=None,
+                 player=PLAYER):
+    """Return the best available speech backend.
+
+    `command` overrides the worker command line, e.g. with a stub. With
+    an AudioCache `cache` and a working `player`, repeated phrases are
+    played from cached audio.
+    """
+    if command is None and not library_available():
+        backend = SubprocessSpeech(executable, player)
+    else:
+        backend = SpeechWorker(command or WORKER, player=player,
+                               fallback=SubprocessSpeech(executable, player))
+        try:
+            backend.start()
+        except OSError:
+            backend = SubprocessSpeech(executable, player)
+    if cache is not None and player_available(player):
+        backend = CachedSpeech(backend, cache, player)
+    return backend
+
+
+def worker_main(stdin=sys.stdin, stdout=sys.stdout):
+    send_lock = threading.Lock()
+
+    def send(**msg):
+        with send_lock:
+            stdout.write(json.dumps(msg) + '\n')
+            stdout.flush()
+
+    try:
+        engine = EspeakLibrary()
+    except OSError as e:
+        sys.stderr.write('abugida.speech: {}\n'.format(e))
+        return 1
+
+    # requests are read on a thread so a cancel arrives mid-phrase; each
+    # is tagged with the number of cancels before it, and one read before
+    # the latest cancel is not spoken
+    requests = queue.Queue()
+    lock = threading.Lock()
+    cancels = 0
+    rendering = False
+
+    def read():
+        nonlocal cancels
+        for line in stdin:
+            try:
+                cancel = json.loads(line).get('event') == 'cancel'
+            except (ValueError, AttributeError):
+                cancel = False  # answered as an error below
+            if cancel:
+                with lock:
+                    cancels += 1
+                    if not rendering:
+                        engine.cancel()
+            else:
+                requests.put((cancels, line))
+        requests.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    send(event='ready')
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        generation, line = item
+        req = {}
+        try:
+            req = json.loads(line)
+            voice = Voice(*(req[f] for f in Voice._fields))
+            render = bool(req.get('render'))
+            with lock:
+                cancelled = not render and generation != cancels
+                if not cancelled:
+                    engine.arm()
+                    rendering = render
+            if render:
+                wav = base64.b64encode(engine.render(voice, req['text']))
+            elif not cancelled:
+                engine.speak(voice, req['text'],
+                             on_first_sound=lambda: send(id=req['id'],
+                                                         event='start'))
+                cancelled = engine.aborted
+        except (ValueError, KeyError, TypeError, AttributeError,
+                OSError) as e:
+            send(id=req.get('id') if isinstance(req, dict) else None,
+                 event='error', message=str(e))
+        else:
+            if render:
+                send(id=req['id'], event='done', wav=wav.decode('ascii'))
+            else:
+                send(id=req['id'],
+                     event='cancelled' if cancelled else 'done')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(worker_main())
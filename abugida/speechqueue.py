@@ -0,0 +1,175 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""A managed queue in front of a speech backend.
+
+Phrases are spoken one at a time by a single thread, so presses never
+pile up as competing synthesizer processes. What happens to a new
+phrase while another is still speaking depends on the policy:
+
+``interrupt``
+    cut the current phrase short (its process is killed) and drop any
+    waiting, so the new phrase is heard at once
+``coalesce``
+    let the current phrase finish, then speak only the latest request
+``drop-oldest``
+    keep up to `depth` phrases waiting, dropping the oldest beyond that
+
+Dropped and interrupted phrases are reported to their callback with a
+cancelled SpeechTiming. Time spent waiting is recorded in the
+``speech.queue_wait`` histogram of `metrics`.
+"""
+
+import collections
+import threading
+import time
+
+from abugida.metrics import Metrics
+from abugida.speech import SpeechTiming
+
+POLICIES = ('interrupt', 'coalesce', 'drop-oldest')
+
+Utterance = collections.namedtuple(
+    'Utterance', 'voice text audio synthesize on_done submitted')
+
+
+class SpeechQueue:
+    """Speaks submitted phrases on `backend`, one at a time."""
+
+    def __init__(self, backend, policy='interrupt', depth=4, metrics=None):
+        if policy not in POLICIES:
+            raise ValueError('unknown policy {!r}, choose from: {}'.format(
+                policy, ', '.join(POLICIES)))
+        if depth < 1:
+            raise ValueError('depth must be at least 1')
+        self.backend = backend
+        self.policy = policy
+        self.depth = depth
+        self.metrics = metrics or Metrics()
+        self.counters = collections.Counter(submitted=0, spoken=0,
+                                            dropped=0, interrupted=0)
+        self._pending = collections.deque()
+        self._current = None
+        self._interrupted = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, voice, text, audio=None, synthesize=None,
+               on_done=None):
+        """Queue a phrase and return at once.
+
+        `audio` is already rendered WAV data to play instead; failing
+        that, `synthesize(voice, text)` renders it first (e.g. a
+        Chorus). `on_done(timing)` is called from the queue's thread, or
+        from this call for phrases it drops.
+        """
+        item = Utterance(voice, text, audio, synthesize, on_done,
+                         time.monotonic())
+        with self._cond:
+            if self._closed:
+                raise ValueError('speech queue is closed')
+            self.counters['submitted'] += 1
+            if self.policy == 'drop-oldest':
+                dropped = []
+                while len(self._pending) >= self.depth:
+                    dropped.append(self._pending.popleft())
+            else:
+                dropped = list(self._pending)
+                self._pending.clear()
+            if self.policy == 'interrupt' and self._current is not None:
+                self._interrupted = True
+                # under the lock, so this cannot reach the next phrase
+                self.backend.cancel()
+            self.counters['dropped'] += len(dropped)
+            self._pending.append(item)
+            self._cond.notify()
+        for old in dropped:
+            self._cancelled(old)
+
+    def _cancelled(self, item, timing=None):
+        if timing is None:
+            timing = SpeechTiming()
+        timing.cancel()
+        if item.on_done:
+            item.on_done(timing)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                item = self._current = self._pending.popleft()
+                self._interrupted = False
+                self.backend.reset()
+            self.metrics.observe('speech.queue_wait',
+                                 time.monotonic() - item.submitted)
+            timing = self._speak(item)
+            with self._cond:
+                interrupted = self._interrupted
+                self._current = None
+                self.counters['interrupted' if interrupted
+                              else 'spoken'] += 1
+            if interrupted:
+                self._cancelled(item, timing)
+            elif item.on_done:
+                item.on_done(timing)
+
+    def _speak(self, item):
+        audio = item.audio
+        if not audio and item.synthesize:
+            try:
+                audio = item.synthesize(item.voice, item.text)
+            except (OSError, ValueError) as e:
+                timing = SpeechTiming()
+                timing.finish(str(e))
+                return timing
+            with self._cond:
+                if self._interrupted:
+                    return SpeechTiming()
+        if audio:
+            return self.backend.play(audio)
+        return self.backend.speak(item.voice, item.text)
+
+    def waiting(self):
+        with self._cond:
+            return len(self._pending)
+
+    def summary(self):
+        msg = ('{spoken} spoken, {interrupted} interrupted, {dropped} '
+               'dropped'.format(**self.counters))
+        hist = self.metrics.get('speech.queue_wait')
+        if hist and hist.count:
+            msg += ', waited p50 {:.0f} ms, p95 {:.0f} ms'.format(
+                hist.percentile(0.5) * 1000, hist.percentile(0.95) * 1000)
+        return msg
+
+    def close(self):
+        """Stop speaking and drop whatever is still waiting."""
+        with self._cond:
+            self._closed = True
+            dropped = list(self._pending)
+            self._pending.clear()
+            if self._current is not None:
+                self._interrupted = True
+                self.backend.cancel()
+            self._cond.notify()
+        for item in dropped:
+            self._cancelled(item)
+        self._thread.join()
@@ -0,0 +1,317 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+
+"""Streaming statistics over phrase logs.
+
+Text logs (one phrase per line, or TSV with the phrase first, as written
+by ``generate``, ``corpus`` and ``swap``) and binary logs are cut into
+chunks: text at line boundaries every CHUNK_BYTES, binary logs every
+CHUNK_ENTRIES using the index. Each chunk is read on its own, tokenized
+with numpy and counted into a LogStats, and the partial counts from all
+chunks and files are merged, so memory stays bounded by the chunk size
+and chunks can be spread over worker processes.
+"""
+
+import collections
+import concurrent.futures
+import mmap
+import os
+
+import numpy as np
+
+from abugida.binlog import ENTRY, MAGIC, BinaryLogReader, index_path
+from abugida.core import BOUNDARY, GLYPHS, GROUP, SHAPE_NAMES, VOW
+
+CHUNK_BYTES = 1 << 24
+CHUNK_ENTRIES = 1 << 18
+
+N_CODES = 2 * GROUP
+VOWEL_NAMES = tuple(VOW)
+
+# tokens besides the syllable codes; BOUNDARY separates words
+_SKIP = 253
+_NEWLINE = 254
+
+# UTF-16 code unit -> token
+_TEXT_CODES = np.full(1 << 16, _SKIP, np.uint8)
+_TEXT_CODES[[ord(c) for c in GLYPHS]] = np.arange(N_CODES)
+_TEXT_CODES[ord(' ')] = BOUNDARY
+_TEXT_CODES[ord('\n')] = _NEWLINE
+
+# flags bit 0 * 16 + nibble -> code
+_NIBBLE_CODES = np.array(
+    list(range(GROUP)) + [_SKIP] * 3 + [BOUNDARY] +
+    list(range(GROUP, N_CODES)) + [_SKIP] * 3 + [BOUNDARY], np.uint8)
+
+
+class LogStats:
+    """Mergeable frequency counts over phrases.
+
+    Syllables are counted by code (their position in GLYPHS), bigrams as
+    (code, code) pairs of neighbouring syllables within a word, and words
+    and lines by length in syllables and words.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.phrases = 0
+        self.syllables = collections.Counter()
+        self.bigrams = collections.Counter()
+        self.word_lengths = collections.Counter()
+        self.line_lengths = collections.Counter()
+
+    def update(self, other):
+        self.files += other.files
+        self.bytes += other.bytes
+        self.phrases += other.phrases
+        self.syllables.update(other.syllables)
+        self.bigrams.update(other.bigrams)
+        self.word_lengths.update(other.word_lengths)
+        self.line_lengths.update(other.line_lengths)
+        return self
+
+    __iadd__ = update
+
+    def __add__(self, other):
+        return LogStats().update(self).update(other)
+
+    @property
+    def words(self):
+        return sum(self.line_lengths[n] * n for n in self.line_lengths)
+
+    @property
+    def shapes(self):
+        counts = collections.Counter()
+        for code, n in self.syllables.items():
+            counts[SHAPE_NAMES[code // 4]] += n
+        return counts
+
+    @property
+    def vowels(self):
+        counts = collections.Counter()
+        for code, n in self.syllables.items():
+            counts[VOWEL_NAMES[code % 4]] += n
+        return counts
+
+    def as_dict(self):
+        """JSON-ready counts, keyed by glyph and name."""
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'phrases': self.phrases,
+            'words': self.words,
+            'syllables': sum(self.syllables.values()),
+            'shapes': {name: self.shapes[name] for name in SHAPE_NAMES},
+            'vowels': {name: self.vowels[name] for name in VOWEL_NAMES},
+            'glyphs': {GLYPHS[c]: self.syllables[c]
+                       for c in range(N_CODES)},
+            'word_lengths': {str(n): self.word_lengths[n]
+                             for n in sorted(self.word_lengths)},
+            'line_lengths': {str(n): self.line_lengths[n]
+                             for n in sorted(self.line_lengths)},
+            'bigrams': {GLYPHS[a] + GLYPHS[b]: n
+                        for (a, b), n in self.bigrams.most_common()},
+        }
+
+    def report(self, top=20):
+        """Plain-text tables of the counts, with `top` bigrams."""
+        total = sum(self.syllables.values())
+        lines = ['{} files, {:.1f} MB: {} phrases, {} words, {} syllables'
+                 .format(self.files, self.bytes / 1e6, self.phrases,
+                         self.words, total)]
+
+        def table(title, rows, of):
+            lines.append('')
+            lines.append(title)
+            for label, n in rows:
+                lines.append('  {:<10} {:>14} {:>7.2%}'.format(
+                    label, n, n / of if of else 0))
+
+        table('shape', [(name, self.shapes[name])
+                        for name in SHAPE_NAMES], total)
+        table('vowel', [(name, self.vowels[name])
+                        for name in VOWEL_NAMES], total)
+        table('syllable', [('{} {}.{}'.format(
+            GLYPHS[c], SHAPE_NAMES[c // 4], VOWEL_NAMES[c % 4]),
+            self.syllables[c]) for c in range(N_CODES)], total)
+        table('syllables per word',
+              sorted(self.word_lengths.items()),
+              sum(self.word_lengths.values()))
+        table('words per phrase', sorted(self.line_lengths.items()),
+              self.phrases)
+        table('bigram', [(GLYPHS[a] + GLYPHS[b], n) for (a, b), n in
+                         self.bigrams.most_common(top)],
+              sum(self.bigrams.values()))
+        return '\n'.join(lines)
+
+
+def _counter(counts, keys=None):
+    nonzero = np.flatnonzero(counts)
+    if keys is None:
+        keys = nonzero.tolist()
+    else:
+        keys = [keys[i] for i in nonzero]
+    return collections.Counter(dict(zip(keys, counts[nonzero].tolist())))
+
+
+_PAIRS = [(a, b) for a in range(N_CODES) for b in range(N_CODES)]
+
+
+def count_tokens(tokens):
+    """Count a uint8 token array: codes, BOUNDARY between words and
+    _NEWLINE between phrases. Empty words and phrases are ignored.
+    """
+    stats = LogStats()
+    if not len(tokens):
+        return stats
+    # every neighbouring pair at once: left << 8 | right
+    pairs = np.bincount(tokens[:-1].astype(np.uint16) << 8 | tokens[1:],
+                        minlength=1 << 16).reshape(256, 256)
+    counts = pairs.sum(axis=1)
+    counts[tokens[-1]] += 1
+    stats.syllables = _counter(counts[:N_CODES])
+    stats.bigrams = _counter(pairs[:N_CODES, :N_CODES].ravel(), _PAIRS)
+
+    # word i lies between separators i - 1 and i
+    seps = np.flatnonzero(tokens >= _NEWLINE)
+    bounds = np.concatenate(([-1], seps, [len(tokens)]))
+    lengths = np.diff(bounds) - 1
+    line_of = np.concatenate(([0], np.cumsum(tokens[seps] == _NEWLINE)))
+    words = lengths > 0
+    stats.word_lengths = _counter(np.bincount(lengths[words]))
+    per_line = np.bincount(line_of[words])
+    per_line = per_line[per_line > 0]
+    stats.line_lengths = _counter(np.bincount(per_line))
+    stats.phrases = len(per_line)
+    return stats
+
+
+def text_tokens(buf):
+    """Tokens of UTF-8 text, keeping only the first TSV column."""
+    # UTF-16 gives one code unit per syllabic, for a single table lookup
+    units = np.frombuffer(buf.decode('utf-8', 'replace').encode(
+        'utf-16-le'), '<u2')
+    if b'\t' in buf:
+        # drop from each tab to the end of its line
+        tabs = np.cumsum(units == 0x09, dtype=np.int32)
+        at_newline = np.maximum.accumulate(
+            np.where(units == 0x0A, tabs, 0))
+        units = units[tabs == at_newline]
+    tokens = _TEXT_CODES[units]
+    return tokens[tokens != _SKIP]
+
+
+def binary_tokens(offsets, data):
+    """Tokens of raw binary log entries, as from BinaryLogReader.raw()."""
+    starts = np.frombuffer(offsets, '<u8').astype(np.intp)
+    if not len(starts):
+        return np.empty(0, np.uint8)
+    starts -= starts[0]
+    data = np.frombuffer(data, np.uint8)
+    n = data[starts + 16].astype(np.intp) | data[starts + 17].astype(
+        np.intp) << 8
+    group = (data[starts + 9] & 1) << 4
+    size = (n + 1) // 2
+    entry = np.repeat(np.arange(len(starts)), size)
+    first = np.cumsum(size) - size
+    packed = data[np.arange(len(entry)) +
+                  np.repeat(starts + ENTRY.size - first, size)]
+    group = np.repeat(group, size)
+    # each entry's tokens are followed by a _NEWLINE; an odd entry's
+    # padding nibble is a boundary, which only makes an empty word
+    tokens = np.full(2 * len(packed) + len(starts), _NEWLINE, np.uint8)
+    at = 2 * np.arange(len(packed)) + entry
+    tokens[at] = _NIBBLE_CODES[group | packed >> 4]
+    tokens[at + 1] = _NIBBLE_CODES[group | packed & 15]
+    return tokens[tokens != _SKIP]
+
+
+def is_binary(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def plan(path, chunk_bytes=CHUNK_BYTES, chunk_entries=CHUNK_ENTRIES):
+    """Split one log into jobs for count_job()."""
+    path = str(path)
+    if is_binary(path):
+        with BinaryLogReader(path) as log:
+            n = len(log)
+        return [('binary', path, start, min(start + chunk_entries, n))
+                for start in range(0, n, chunk_entries)]
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    jobs = []
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n', min(start + chunk_bytes, size) - 1)
+            end = size if end < 0 else end + 1
+            jobs.append(('text', path, start, end))
+            start = end
+    return jobs
+
+
+def count_job(job):
+    """Count one chunk from plan()."""
+    kind, path, start, stop = job
+    if kind == 'binary':
+        with BinaryLogReader(path) as log:
+            offsets, data = log.raw(start, stop)
+        stats = count_tokens(binary_tokens(offsets, data))
+        stats.bytes = len(data)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(stop - start)
+        stats = count_tokens(text_tokens(data))
+        stats.bytes = len(data)
+    return stats
+
+
+def log_paths(paths):
+    """Paths without the index files of binary logs also listed."""
+    paths = [str(p) for p in paths]
+    indexes = {index_path(p) for p in paths}
+    return [p for p in paths if p not in indexes]
+
+
+def analyze(paths, workers=None, chunk_bytes=CHUNK_BYTES,
+            chunk_entries=CHUNK_ENTRIES):
+    """Count phrases in text and binary logs into one LogStats.
+
+    Chunks are counted in `workers` processes (default: CPU count), or
+    in this process with workers=1.
+    """
+    paths = log_paths(paths)
+    jobs = [job for path in paths
+            for job in plan(path, chunk_bytes, chunk_entries)]
+    stats = LogStats()
+    stats.files = len(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            stats.update(count_job(job))
+        return stats
+    with concurrent.futures.ProcessPoolExecutor(
+            min(workers, len(jobs))) as pool:
+        for partial in pool.map(count_job, jobs):
+            stats.update(partial)
+    return stats
@@ -0,0 +1,205 @@
+# Copyright (C) 2022 David E. Lambert
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see
+# <https://www.gnu.org/licenses/>.
+
+"""Drift-free timing of automatic generate/speak cycles.
+
+A Scheduler fires a callback on a repeating pattern of steps, each a
+duration in beats and the actions to take (``g`` generate, ``s``
+speak, ``-`` rest). Beat n is due at a fixed offset from the start on a
+monotonic clock, rather than one interval after the previous callback,
+so callback time and timer slop never accumulate into drift.
+
+When a callback overruns (e.g. speech outlasts the beat) and the next
+beat is already due, the overrun policy decides what happens:
+
+``skip``
+    jump to the latest beat that is due and drop the ones before it
+``catchup``
+    fire every missed beat, back to back, until on time again
+``shift``
+    move the whole grid later, so the pattern resumes from now; the
+    beat that overran is still counted as late by how much it missed
+
+The clock and sleep functions can be replaced, e.g. with FakeClock to
+run a schedule instantly in tests.
+"""
+
+import collections
+import threading
+import time
+
+from abugida.metrics import Histogram
+
+ACTIONS = 'gs-'
+POLICIES = ('skip', 'catchup', 'shift')
+
+Step = collections.namedtuple('Step', 'seconds actions')
+Beat = collections.namedtuple('Beat', 'index step due late actions')
+
+
+def parse_pattern(text='1', bpm=None, interval=None, actions='g'):
+    """Return the Steps of a pattern like ``'1:gs 0.5:g 0.5:-'``.
+
+    Each step is a duration in beats of `bpm` (or in units of
+    `interval` seconds), with optional actions after a colon that
+    default to `actions`.
+    """
+    if bpm is not None:
+        if bpm <= 0:
+            raise ValueError('bpm must be positive')
+        unit = 60.0 / bpm
+    elif interval is not None:
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        unit = float(interval)
+    else:
+        unit = 1.0
+    steps = []
+    for token in text.split():
+        beats, _, acts = token.partition(':')
+        acts = acts or actions
+        try:
+            beats = float(beats)
+        except ValueError:
+            raise ValueError('bad step {!r}, expected BEATS[:ACTIONS]'
+                             .format(token)) from None
+        if beats <= 0:
+            raise ValueError('step {!r} must last more than 0 beats'
+                             .format(token))
+        if any(a not in ACTIONS for a in acts):
+            raise ValueError('step {!r}: actions are g (generate), s '
+                             '(speak) and - (rest)'.format(token))
+        steps.append(Step(beats * unit, acts.replace('-', '')))
+    if not steps:
+        raise ValueError('empty pattern')
+    return steps
+
+
+class FakeClock:
+    """A monotonic clock that only moves when slept on or advanced."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+    advance = sleep
+
+
+class Scheduler:
+    """Calls `callback(beat)` on the steps of `pattern`.
+
+    ``run()`` blocks until ``stop()`` or `beats` callbacks; ``start()``
+    runs it on a thread. ``jitter`` holds how late each beat fired, in
+    seconds, and ``counters`` the fired, skipped, caught-up and shifted
+    beats.
+    """
+
+    def __init__(self, pattern, callback, policy='skip',
+                 clock=time.monotonic, sleep=None, window=1000):
+        if policy not in POLICIES:
+            raise ValueError('unknown policy {!r}, choose from: {}'.format(
+                policy, ', '.join(POLICIES)))
+        self.pattern = list(pattern)
+        self.callback = callback
+        self.policy = policy
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self.period = sum(step.seconds for step in self.pattern)
+        self.offsets = []
+        total = 0.0
+        for step in self.pattern:
+            self.offsets.append(total)
+            total += step.seconds
+        self.origin = None
+        self.jitter = Histogram(window)
+        self.max_late = 0.0
+        self.counters = collections.Counter(fired=0, skipped=0,
+                                            caught_up=0, shifted=0)
+        self._thread = None
+
+    def due(self, index):
+        """Monotonic time at which beat `index` is due."""
+        cycle, step = divmod(index, len(self.pattern))
+        return self.origin + cycle * self.period + self.offsets[step]
+
+    def run(self, beats=None):
+        self.origin = self.clock()
+        index = 0
+        fired = 0
+        while not self._stop.is_set() and (beats is None or fired < beats):
+            due = self.due(index)
+            now = self.clock()
+            if now < due:
+                self.sleep(due - now)
+                if self._stop.is_set():
+                    break
+                now = self.clock()
+            late = now - due
+            if self.due(index + 1) <= now:  # overrun: next beat due too
+                if self.policy == 'skip':
+                    latest = index + 1
+                    while self.due(latest + 1) <= now:
+                        latest += 1
+                    self.counters['skipped'] += latest - index
+                    index = latest
+                    due = self.due(index)
+                    late = now - due
+                elif self.policy == 'shift':
+                    # the beat was still `late`; the grid moves after it
+                    self.origin += late
+                    self.counters['shifted'] += 1
+                    due = now
+                else:
+                    self.counters['caught_up'] += 1
+            self.jitter.add(late)
+            self.max_late = max(self.max_late, late)
+            step = index % len(self.pattern)
+            self.callback(Beat(index, step, due, late,
+                               self.pattern[step].actions))
+            self.counters['fired'] += 1
+            fired += 1
+            index += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def stopped(self):
+        return self._stop.is_set()
+
+    def summary(self):
+        if not self.jitter.count:
+            return 'no beats'
+        return ('{fired} beats, {skipped} skipped, {caught_up} caught up, '
+                '{shifted} shifted; '.format(**self.counters) +
+                'late p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms'.format(
+                    self.jitter.percentile(0.5) * 1000,
+                    self.jitter.percentile(0.95) * 1000,
+                    self.max_late * 1000))
@@ -16,156 +16,61 @@
 
 __version__ = '1.0b2'
 
-import sys
-import random
-import subprocess
-import shlex
-from pathlib import Path
-
-from PyQt5.QtCore import (Qt,
-                          QRunnable,
-                          QThreadPool,
-                          pyqtSlot)
-from PyQt5.QtGui import (QIcon,
+import time
+STARTED = time.perf_counter()  # before the Qt imports, for --profile-startup
+
+import sys  # noqa: E402
+import argparse  # noqa: E402
+import threading  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+from PyQt5.QtCore import (Qt,  # noqa: E402
+                          QObject,
+                          QTimer,
+                          pyqtSignal)
+from PyQt5.QtGui import (QIcon,  # noqa: E402
                          QPixmap,
                          QKeySequence,
                          QFontDatabase,
                          QFont)
-from PyQt5.QtWidgets import *
+from PyQt5.QtWidgets import *  # noqa: E402
+
+from abugida.core import CON, VOICES, Phrase, Session  # noqa: E402
+from abugida import core  # noqa: E402
+from abugida import speech  # noqa: E402
+from abugida.speech import Voice  # noqa: E402
+from abugida.atlas import GlyphLabel  # noqa: E402
+from abugida.broadcast import Publisher  # noqa: E402
+from abugida.cache import AudioCache  # noqa: E402
+from abugida.chorus import Chorus  # noqa: E402
+from abugida.speechqueue import POLICIES, SpeechQueue  # noqa: E402
+from abugida.lookahead import Lookahead  # noqa: E402
+from abugida.logger import SYNC_POLICIES, PhraseLogger  # noqa: E402
+from abugida.metrics import Metrics, MetricsServer, PhaseTimer  # noqa: E402
+from abugida.models import load_model  # noqa: E402
+from abugida import tempo  # noqa: E402
 
 HERE = Path(__file__).parent.resolve()
 
-# ROTATIONALS: up, down, left, right
-DELTA = (u'\u1403', u'\u1405', u'\u1401', u'\u140A')
-CHEVRON = (u'\u1431', u'\u1433', u'\u142F', u'\u1438')
-ARCH = (u'\u144E', u'\u1450', u'\u144C', u'\u1455')
-# REFLECTIONALS: upper left, upper right, lower right, lower left
-LOOP = (u'\u146D', u'\u146B', u'\u146F', u'\u1472')
-HOOK = (u'\u148B', u'\u1489', u'\u148D', u'\u1490')
-BAR = (u'\u14A5', u'\u14A3', u'\u14A7', u'\u14AA')
-
-# IPA-XSAMPA DICTIONARIES
-LABIAL = {'p': 'p', 'b': 'b', 'f': 'f', 'v': 'v', }
-DENTAL = {'θ': 'T', 'ð': 'D', }
-ALVEOLAR = {'t': 't', 'd': 'd', 's': 's', 'z': 'z', }
-POSTALVEOLAR = {'tʃ': 'tS', 'dʒ': 'dZ', 'ʃ': 'S', 'ʒ': 'Z', }
-VELAR_GLOTTAL = {'k': 'k', 'g': 'g', 'h': 'h', }
-NASAL = {'m': 'm', 'n': 'n', }
-APPROXIMANT = {'l': 'l', 'r': 'r', 'j': 'j', 'w': 'w', }
-CON = (LABIAL | DENTAL | ALVEOLAR | POSTALVEOLAR |
-       VELAR_GLOTTAL | NASAL | APPROXIMANT)
-VOW = {'i': 'i', 'o': 'o', 'e': 'e', 'a': 'a', }
-IXDICT = CON | VOW
-
-VOICES = ["Andrea", "Annie", "Antonio", "Auntie", "Belinda", "Boris", "Denis",
-          "Diogo", "Ed", "Gene", "Gene2", "Henrique", "Hugo", "Iven", "Iven2",
-          "Iven3", "Jacky", "John", "Kaukovalta", "Mario", "Max", "Michael",
-          "Michel", "Miguel", "Mr_Serious", "Nguyen", "Pablo", "Pablo2",
-          "Paul", "Pedro", "Quincy", "RicishayMax", "RicishayMax2",
-          "RicishayMax3", "Rob", "Robert", "Robosoft3", "Robosoft4",
-          "Robosoft5", "Robosoft6", "Robosoft7", "Robosoft8", "Steph",
-          "Steph2", "Steph3", "Storm", "Tweaky", "Zac", "anika", "anikaRobot",
-          "fast_test", "f2", "f3", "f4", "f5", "female_whisper", "grandpa",
-          "klatt", "klatt2", "klatt3", "klatt4", "m2", "m3", "m4", "m5", "m6",
-          "m7", "norbert", "shelby", "travis", "victor", "whisper",
-          "m8", "f1", "croak", "m1", "grandma"]
-
-
-def rlookup(val, d):
-    keys = [k for k, v in d.items() if v == val]
-    if keys:
-        return keys[0]
-    return None
-
-
-def syl(reflectionals=False):
-    if reflectionals:
-        shapes = LOOP + HOOK + BAR
-    else:
-        shapes = DELTA + CHEVRON + ARCH
-    return random.choice(shapes)
-
-
-def word(reflectionals=False):
-    if reflectionals:
-        shapes = [LOOP, HOOK, BAR]
-    else:
-        shapes = [DELTA, CHEVRON, ARCH]
-
-    n_char = random.randint(2, 6)
-    text = ''
-    i = 0
-    while i < n_char:
-        con = random.choice([0, 1, 2])
-        vow = random.choice([0, 1, 2, 3])
-        text += shapes[con][vow]
-        i += 1
-
-    return text
-
-
-def line(reflectionals=False):
-    n_words = random.randint(2, 5)
-    text = ''
-    i = 0
-    while i < n_words - 1:
-        text = text + word(reflectionals) + ' '
-        i += 1
-    text += word(reflectionals)  # no space after last word
-    i += 1
-
-    return text
-
-
-def random_prosody(s):
-    vowels = ['a', 'e', 'i', 'o']
-    in_words = s.split()
-    out_words = []
-    for w in in_words:
-        syllabized = ''
-        for char in w:
-            if char in vowels:
-                if random.choice([True, False]):  # random vowel lengthening
-                    syllabized = syllabized + char + ': '
-                else:
-                    syllabized = syllabized + char + ' '
-            else:
-                syllabized = syllabized + char
-
-        syl = syllabized.split()
-        if len(syl) == 1:
-            if random.choice([True, False]):
-                syl[0] = "'" + syl[0]
-        elif len(syl) > 3:
-            stress = random.sample(range(len(syl)), k=2)
-            syl[stress[0]] = "'" + syl[stress[0]]
-            syl[stress[1]] = "," + syl[stress[1]]
-        else:
-            stress = random.choice(range(len(syl)))
-            syl[stress] = "'" + syl[stress]
-        out_words.append(''.join(syl))
+_font_family = None
 
-    return ' '.join(out_words)
 
+def font_family():
+    # register the bundled font with Qt only once, on first use
+    global _font_family
+    if _font_family is None:
+        font_id = QFontDatabase.addApplicationFont(
+            str(HERE/'fonts/FreeSans.ttf'))
+        _font_family = QFontDatabase.applicationFontFamilies(font_id)[0]
+    return _font_family
 
-class SpeechRunner(QRunnable):
-    def __init__(self, voice, pitch, speed, gap, amplitude, text):
-        super().__init__()
-        self.voice = voice
-        self.pitch = pitch
-        self.speed = speed
-        self.gap = gap,
-        self.amplitude = amplitude
-        self.text = "[[" + text + "]]"
 
-    @pyqtSlot()
-    def run(self):
-        cmd_split = shlex.split(
-            "espeak-ng -ven+{} -p {} -s {} -g {} -a {} \"{}\""
-            .format(self.voice, self.pitch, self.speed, self.gap,
-                    self.amplitude, self.text, ))
+class SpeechSignals(QObject):
+    finished = pyqtSignal(object)
+
 
-        subprocess.run(cmd_split)
+class TempoSignals(QObject):
+    beat = pyqtSignal(object)
 
 
 class ShapeCB(QCheckBox):
@@ -175,7 +80,7 @@ class ShapeCB(QCheckBox):
 
 
 class DisplayWindow(QWidget):
-    def __init__(self, text=''):
+    def __init__(self, text='', glyph_atlas=False):
         super().__init__()
         self.setWindowTitle("Abugida 7")
         self.setMinimumSize(1184, 666)  # 16:9 @ 666px height
@@ -184,17 +89,18 @@ class DisplayWindow(QWidget):
         layout = QVBoxLayout()
         self.setLayout(layout)
 
-        font_id = QFontDatabase.addApplicationFont(
-            str(HERE/'fonts/FreeSans.ttf'))
-        font_fam = QFontDatabase.applicationFontFamilies(font_id)[0]
-        font = QFont(font_fam)
+        font = QFont(font_family())
         font.setPointSize(84)
         font.setWordSpacing(30)
         self.setFont(font)
 
-        self.label = QLabel(text)
-        self.label.setAlignment(Qt.AlignCenter)
-        self.label.setWordWrap(True)
+        if glyph_atlas:
+            # pre-rendered glyphs, for fast updates on slower machines
+            self.label = GlyphLabel(text)
+        else:
+            self.label = QLabel(text)
+            self.label.setAlignment(Qt.AlignCenter)
+            self.label.setWordWrap(True)
         layout.addWidget(self.label)
 
         if QDesktopWidget().screenCount() > 1:
@@ -203,8 +109,13 @@ class DisplayWindow(QWidget):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, seed=None, metrics_file=None, metrics_port=None,
+                 publisher=None, glyph_atlas=False, profile=None,
+                 model=None, rhythm='1:gs', overrun='skip',
+                 speech_policy='interrupt', speech_depth=4,
+                 log_options=None):
         super().__init__()
+        self.profile = profile or PhaseTimer()
         self.setWindowTitle("Abugida 7")
         self.setWindowIcon(QIcon(str(HERE/'img/abugida_icon.svg')))
         self.setMinimumSize(1184, 666)  # 16:9 @ 666px height
@@ -216,21 +127,78 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(container)
         self.setStatusBar(QStatusBar(self))
 
+        # independent streams, so e.g. speaking does not change which
+        # phrases a seed generates
+        self.session = Session(seed)
+        self.phrase_session = self.session.child('phrases')
+        self.prosody_session = self.session.child('prosody')
+        self.consonant_session = self.session.child('consonants')
+        self.voice_session = self.session.child('voice')
+        self.model = model  # None: the built-in uniform generator
+        seed_lab = QLabel('Seed: {}'.format(self.session.seed))
+        seed_lab.setStatusTip('Start with --seed to replay this session')
+        self.statusBar().addPermanentWidget(seed_lab)
+
+        # phrases are also sent to remote displays, if any
+        self.publisher = publisher
+
+        # LATENCY METRICS ===================
+        self.metrics = Metrics()
+        self.traces = {}  # action -> Trace started by its shortcut
+        self.latency_lab = QLabel()
+        self.latency_lab.setStatusTip(
+            'Latency from shortcut to display/sound, last 1000 presses')
+        self.statusBar().addPermanentWidget(self.latency_lab)
+        self.metrics_file = metrics_file
+        if metrics_file:
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.timeout.connect(self.write_metrics)
+            self.metrics_timer.start(2000)
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, metrics_port)
+
         self.log_on = False
+        self.lookahead = None
+        self.lookahead_runs = 0  # each run draws from its own stream
+        self.prepared = None
         self.log_file = None
-        self.cas = ''
+        self.logger = None
+        self.log_options = log_options or {}  # PhraseLogger keywords
+        self.phrase = Phrase()  # rendered to syllabics only for display
         self.ipa = ''
         self.xsampa = ''
-        self.threadpool = QThreadPool()
+        # starting the speech worker waits on a subprocess, so it runs
+        # alongside the rest of startup; see the speech property. Phrases
+        # are spoken through a queue, one at a time
+        self._speech = None
+        self._speech_queue = None
+        self.speech_policy = speech_policy
+        self.speech_depth = speech_depth
+        self.speech_signals = SpeechSignals()
+        self.speech_signals.finished.connect(
+            lambda done: self.show_speech_timing(*done))
+        self._speech_opener = threading.Thread(target=self._open_speech,
+                                               daemon=True)
+        self._speech_opener.start()
+        # automatic generate/speak: the scheduler thread hands each beat
+        # to the GUI thread and, on speak beats, waits for the speech to
+        # end so that long phrases count as overruns
+        self.rhythm = rhythm
+        self.overrun = overrun
+        self.scheduler = None
+        self.spoken = threading.Event()
+        self.tempo_signals = TempoSignals()
+        self.tempo_signals.beat.connect(self.on_beat)
+        self.chorus = None  # more than one voice at once, see set_chorus
+        self.profile.mark('window: state')
 
         # DESIGN CONSTANTS ================
         BW = 120    # button width
         BH = 40     # button height
 
         # TYPOGRAPHY =====================
-        font_id = QFontDatabase.addApplicationFont(
-            str(HERE/'fonts/FreeSans.ttf'))
-        font_fam = QFontDatabase.applicationFontFamilies(font_id)[0]
+        font_fam = font_family()
 
         font = QFont(font_fam)
         container.setFont(font)
@@ -243,8 +211,12 @@ class MainWindow(QMainWindow):
         ipa_font.setPointSize(14)
         ipa_font.setWordSpacing(20)
 
+        self.profile.mark('window: font')
+
         # DISPLAY ===========================
-        self.disp_window = DisplayWindow()
+        # the external window is built when first shown, see disp_window
+        self.glyph_atlas = glyph_atlas
+        self._disp_window = None
 
         self.disp_cas = QLabel()
         self.disp_cas.setFont(disp_font)
@@ -309,7 +281,7 @@ class MainWindow(QMainWindow):
         delta_icon = QPixmap(str(HERE/'img/delta.svg'))
         delta_lab = QLabel()
         delta_lab.setPixmap(delta_icon)
-        self.con_delta = random.choice(list(CON))
+        self.con_delta = self.consonant_session.rng.choice(list(CON))
         self.delta_sel = QComboBox()
         self.delta_sel.addItems(list(CON))
         self.delta_sel.setStatusTip('Set consonant for this shape')
@@ -322,7 +294,7 @@ class MainWindow(QMainWindow):
         chevron_icon = QPixmap(str(HERE/'img/chevron.svg'))
         chevron_lab = QLabel()
         chevron_lab.setPixmap(chevron_icon)
-        self.con_chevron = random.choice(list(CON))
+        self.con_chevron = self.consonant_session.rng.choice(list(CON))
         self.chevron_sel = QComboBox()
         self.chevron_sel.addItems(list(CON))
         self.chevron_sel.setStatusTip('Set consonant for this shape')
@@ -335,7 +307,7 @@ class MainWindow(QMainWindow):
         arch_icon = QPixmap(str(HERE/'img/arch.svg'))
         arch_lab = QLabel()
         arch_lab.setPixmap(arch_icon)
-        self.con_arch = random.choice(list(CON))
+        self.con_arch = self.consonant_session.rng.choice(list(CON))
         self.arch_sel = QComboBox()
         self.arch_sel.addItems(list(CON))
         self.arch_sel.setStatusTip('Set consonant for this shape')
@@ -408,9 +380,14 @@ class MainWindow(QMainWindow):
         self.rotref_grp.addButton(self.radio_ref, id=1)  # ref_switch = True
         self.rotref_grp.buttonClicked.connect(self.set_ref_switch)
 
+        self.con_sels = (self.delta_sel, self.chevron_sel, self.arch_sel,
+                         self.loop_sel, self.hook_sel, self.bar_sel)
+        self.profile.mark('window: shapes')
+
         # initial consonants and line
         self.random_consonants()
         self.generate()
+        self.profile.mark('window: first phrase')
 
         # TEXT CONTROLS =============================
         text_row = QHBoxLayout()
@@ -457,6 +434,14 @@ class MainWindow(QMainWindow):
         self.btn_log.setFixedSize(BW, BH)
         text_row.addWidget(self.btn_log)
 
+        self.btn_ahead = QPushButton('Lookahead: OFF')
+        self.btn_ahead.setStatusTip(
+            'Prepare upcoming phrases and speech in the background')
+        self.btn_ahead.setCheckable(True)
+        self.btn_ahead.clicked.connect(self.toggle_lookahead)
+        self.btn_ahead.setFixedSize(BW, BH)
+        text_row.addWidget(self.btn_ahead)
+
         # VOICE CONTROLS ===========================
         voice_row = QGridLayout()
         voice_row.setAlignment(Qt.AlignCenter)
@@ -464,7 +449,8 @@ class MainWindow(QMainWindow):
         voice_row.setVerticalSpacing(5)
         ctl_grp.addLayout(voice_row)
 
-        self.voice = random.choice(VOICES)
+        voice, pitch, speed, gap = self.voice_session.random_voice()
+        self.voice = voice
         self.ctl_voice = QComboBox()
         self.ctl_voice.addItems(sorted(VOICES, key=lambda x: x.lower()))
         self.ctl_voice.setStatusTip('Speech synthesizer voice model')
@@ -476,7 +462,26 @@ class MainWindow(QMainWindow):
         voice_row.addWidget(lab_voice, 0, 0, alignment=Qt.AlignBottom)
         voice_row.addWidget(self.ctl_voice, 1, 0)
 
-        self.pitch = random.randint(0, 99)
+        self.ctl_chorus = QSpinBox()
+        self.ctl_chorus.setRange(1, 8)
+        self.ctl_chorus.setSuffix(' voice(s)')
+        self.ctl_chorus.setStatusTip(
+            'Speak in this many voices at once, led by the voice above')
+        self.ctl_chorus.setFixedWidth(BW)
+        self.ctl_chorus.valueChanged.connect(self.set_chorus)
+        if not speech.player_available():
+            # the mixed parts are played as WAV data through aplay
+            self.ctl_chorus.setEnabled(False)
+            self.ctl_chorus.setStatusTip('Chorus needs aplay to play the '
+                                         'mixed voices')
+            self.ctl_chorus.setToolTip(self.ctl_chorus.statusTip())
+        lab_chorus = QLabel('Chorus')
+        lab_chorus.setStatusTip(self.ctl_chorus.statusTip())
+        lab_chorus.setToolTip(self.ctl_chorus.toolTip())
+        voice_row.addWidget(lab_chorus, 2, 0, alignment=Qt.AlignBottom)
+        voice_row.addWidget(self.ctl_chorus, 3, 0)
+
+        self.pitch = pitch
         self.ctl_pitch = QSlider()
         self.ctl_pitch.setRange(0, 99)
         self.ctl_pitch.setStatusTip(
@@ -490,7 +495,7 @@ class MainWindow(QMainWindow):
         voice_row.addWidget(lab_pitch, 0, 1, alignment=Qt.AlignBottom)
         voice_row.addWidget(self.ctl_pitch, 1, 1)
 
-        self.speed = random.randint(25, 250)
+        self.speed = speed
         self.ctl_speed = QSlider()
         self.ctl_speed.setRange(25, 250)
         self.ctl_speed.setStatusTip('Speed in words per minute, 25-250')
@@ -503,7 +508,7 @@ class MainWindow(QMainWindow):
         voice_row.addWidget(lab_speed, 0, 2, alignment=Qt.AlignBottom)
         voice_row.addWidget(self.ctl_speed, 1, 2)
 
-        self.gap = random.randint(1, 40)
+        self.gap = gap
         self.ctl_gap = QSlider()
         self.ctl_gap.setRange(1, 40)
         self.ctl_gap.setStatusTip('Word gap. Has little effect.')
@@ -529,10 +534,26 @@ class MainWindow(QMainWindow):
         voice_row.addWidget(lab_amplitude, 0, 4, alignment=Qt.AlignBottom)
         voice_row.addWidget(self.ctl_amplitude, 1, 4)
 
+        self.ctl_bpm = QSpinBox()
+        self.ctl_bpm.setRange(10, 600)
+        self.ctl_bpm.setValue(60)
+        self.ctl_bpm.setSuffix(' BPM')
+        self.ctl_bpm.setStatusTip(
+            'Beats per minute for the rhythm given with --rhythm')
+        self.ctl_bpm.setFixedWidth(BW)
+        self.ctl_bpm.valueChanged.connect(self.set_bpm)
+        self.chk_tempo = QCheckBox('Tempo')
+        self.chk_tempo.setStatusTip(
+            '(T) Generate and speak automatically, in time')
+        self.chk_tempo.toggled.connect(self.toggle_tempo)
+        voice_row.addWidget(self.chk_tempo, 0, 5, alignment=Qt.AlignBottom)
+        voice_row.addWidget(self.ctl_bpm, 1, 5)
+
         ctl_box = QGroupBox()
         ctl_box.setLayout(ctl_grp)
         ctl_box.setFixedWidth(1000)
         layout.addWidget(ctl_box, alignment=Qt.AlignCenter)
+        self.profile.mark('window: controls')
 
         # KEYBOARD SHORCUTS =============
         sc_syl = QShortcut(QKeySequence('S'), self)
@@ -551,6 +572,8 @@ class MainWindow(QMainWindow):
         sc_speak.activated.connect(self.click_speak)
         sc_swap = QShortcut(QKeySequence('X'), self)
         sc_swap.activated.connect(self.click_swap)  # not a real "click"
+        sc_tempo = QShortcut(QKeySequence('T'), self)
+        sc_tempo.activated.connect(self.chk_tempo.toggle)
 
         # MENU =============
         menu_bar = self.menuBar()
@@ -565,6 +588,7 @@ class MainWindow(QMainWindow):
         help_sc.setShortcut('Ctrl+k')
         help_sc.triggered.connect(self.sc_win)
         help_menu.addAction(help_sc)
+        self.profile.mark('window: shortcuts, menu')
 
         # ======= END __init__() =======
 
@@ -572,46 +596,69 @@ class MainWindow(QMainWindow):
         self.con_delta = s
         self.translate()
         self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
 
     def set_chevron(self, s):
         self.con_chevron = s
         self.translate()
         self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
 
     def set_arch(self, s):
         self.con_arch = s
         self.translate()
         self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
 
     def set_loop(self, s):
         self.con_loop = s
         self.translate()
         self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
 
     def set_hook(self, s):
         self.con_hook = s
         self.translate()
         self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
 
     def set_bar(self, s):
         self.con_bar = s
         self.translate()
         self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
 
     def set_voice(self, s):
         self.voice = s
+        self.update_lookahead()
+
+    def set_chorus(self, n):
+        if self.chorus:
+            self.chorus.close()
+        self.chorus = None
+        if n > 1:
+            self.chorus = Chorus(n, rng=self.voice_session.child('chorus').rng)
 
     def set_pitch(self, n):
         self.pitch = n
+        self.update_lookahead()
 
     def set_speed(self, n):
         self.speed = n
+        self.update_lookahead()
 
     def set_gap(self, n):
         self.gap = n
+        self.update_lookahead()
 
     def set_amplitude(self, n):
         self.amplitude = n
+        self.update_lookahead()
+
+    def set_bpm(self, n):
+        if self.scheduler:  # restart on the new grid
+            self.toggle_tempo(False)
+            self.toggle_tempo(True)
 
     def set_mode(self):
         if self.mode_grp.checkedId() == 1:
@@ -620,16 +667,18 @@ class MainWindow(QMainWindow):
             self.mode = 'word'
         else:
             self.mode = 'line'
+        self.update_lookahead()
 
     def set_ref_switch(self):
         if self.rotref_grp.checkedId():
-            if self.cas[0] in DELTA + CHEVRON + ARCH:
+            if self.phrase and not self.phrase.reflectionals:
                 self.swap()
             self.ref_switch = True
         else:
-            if self.cas[0] in LOOP + HOOK + BAR:
+            if self.phrase.reflectionals:
                 self.swap()
             self.ref_switch = False
+        self.update_lookahead()
 
     def click_syl(self):
         self.radio_syl.animateClick()
@@ -641,107 +690,193 @@ class MainWindow(QMainWindow):
         self.radio_line.animateClick()
 
     def click_gen(self):
+        self.begin_trace('generate')
         self.btn_gen.animateClick()
 
     def click_randcon(self):
+        self.begin_trace('consonants')
         self.btn_randcon.animateClick()
 
     def click_randvoice(self):
         self.btn_randvoice.animateClick()
 
     def click_speak(self):
+        self.begin_trace('speak')
         self.btn_speak.animateClick()
 
     def click_swap(self):
+        self.begin_trace('swap')
         if self.rotref_grp.checkedId():  # True if reflectionals checked
             self.radio_rot.animateClick()
         else:
             self.radio_ref.animateClick()
 
+    def begin_trace(self, action):
+        self.traces[action] = self.metrics.begin(action)
+
+    def take_trace(self, action):
+        # started at the shortcut if there was one, else at the click
+        trace = self.traces.pop(action, None) or self.metrics.begin(action)
+        trace.mark('click')
+        return trace
+
+    def finish_trace(self, trace):
+        self.metrics.finish(trace)
+        parts = []
+        for key, name in (('G', 'generate.settext'),
+                          ('X', 'swap.settext'),
+                          ('C', 'consonants.settext'),
+                          ('Space', 'speak.first_sound'),
+                          ('T', 'tempo.late')):
+            hist = self.metrics.get(name)
+            if hist:
+                parts.append('{} {:.0f}/{:.0f}'.format(
+                    key, hist.percentile(0.5) * 1000,
+                    hist.percentile(0.95) * 1000))
+        self.latency_lab.setText('p50/p95 ms: ' + '  '.join(parts))
+
+    def write_metrics(self):
+        try:
+            self.metrics.write_json(self.metrics_file)
+        except OSError as e:
+            self.statusBar().showMessage(
+                'Could not write metrics: {}'.format(e), 5000)
+
     def random_consonants(self):
-        sample = random.sample(list(CON), k=6)
-        self.delta_sel.setCurrentText(sample[0])
-        self.chevron_sel.setCurrentText(sample[1])
-        self.arch_sel.setCurrentText(sample[2])
-        self.loop_sel.setCurrentText(sample[3])
-        self.hook_sel.setCurrentText(sample[4])
-        self.bar_sel.setCurrentText(sample[5])
+        trace = self.take_trace('consonants')
+        sample = self.consonant_session.random_consonants()
+        # set all six combos quietly, then translate once rather than
+        # once per combo through the set_* slots
+        for sel, con in zip(self.con_sels, sample):
+            sel.blockSignals(True)
+            sel.setCurrentText(con)
+            sel.blockSignals(False)
+        (self.con_delta, self.con_chevron, self.con_arch,
+         self.con_loop, self.con_hook, self.con_bar) = sample
+        self.translate()
+        self.disp_ipa.setText(self.ipa)
+        self.update_lookahead()
+        trace.mark('settext')
+        self.finish_trace(trace)
 
     def generate(self):
-        if self.mode == 'syl':
-            self.cas = syl(self.ref_switch)
-        elif self.mode == 'word':
-            self.cas = word(self.ref_switch)
+        trace = self.take_trace('generate')
+        if self.lookahead:
+            self.prepared = self.lookahead.next()
+            self.phrase = self.prepared.phrase
+            self.ipa = self.prepared.ipa
+            self.xsampa = self.prepared.xsampa
         else:
-            self.cas = line(self.ref_switch)
-        self.translate()
-        self.disp_cas.setText(self.cas)
+            self.phrase = self.phrase_session.phrase(self.mode,
+                                                     self.ref_switch,
+                                                     self.model)
+            self.translate()
+        trace.mark('translate')
+        cas = self.cas
+        self.disp_cas.setText(cas)
         self.disp_ipa.setText(self.ipa)
-        self.disp_window.label.setText(self.cas)
+        if self._disp_window:
+            self._disp_window.label.setText(cas)
+        trace.mark('settext')
+        if self.publisher:
+            self.publisher.publish(cas, self.ipa, trace.action)
+            trace.mark('publish')
         if self.log_on:
-            with open(self.log_file, 'a') as f:
-                f.write(self.cas + '\n')
+            self.log_phrase()
+        self.finish_trace(trace)
+
+    def consonants(self):
+        return (self.con_delta, self.con_chevron, self.con_arch,
+                self.con_loop, self.con_hook, self.con_bar)
+
+    @property
+    def cas(self):
+        return self.phrase.text
 
     def translate(self):
-        ipa = ''
-        for char in self.cas:
-            if char in DELTA:
-                con = self.con_delta
-                vow = list(VOW)[DELTA.index(char)]
-                ipa = ipa + con + vow
-            elif char in CHEVRON:
-                con = self.con_chevron
-                vow = list(VOW)[CHEVRON.index(char)]
-                ipa = ipa + con + vow
-            elif char in ARCH:
-                con = self.con_arch
-                vow = list(VOW)[ARCH.index(char)]
-                ipa = ipa + con + vow
-            elif char in LOOP:
-                con = self.con_loop
-                vow = list(VOW)[LOOP.index(char)]
-                ipa = ipa + con + vow
-            elif char in HOOK:
-                con = self.con_hook
-                vow = list(VOW)[HOOK.index(char)]
-                ipa = ipa + con + vow
-            elif char in BAR:
-                con = self.con_bar
-                vow = list(VOW)[BAR.index(char)]
-                ipa = ipa + con + vow
-            else:
-                ipa = ipa + ' '
-        self.ipa = ipa
-        self.xsampa = ''.join(
-            [IXDICT[char] if char in IXDICT else ' ' for char in ipa])
+        self.ipa, self.xsampa = core.translate(self.phrase,
+                                               self.consonants())
 
     def swap(self):
-        d = dict(zip(DELTA + CHEVRON + ARCH, LOOP + HOOK + BAR))
-        output = ''
-        if self.cas[0] in DELTA + CHEVRON + ARCH:
-            for char in self.cas:
-                output += d[char] if char != ' ' else ' '
-        else:
-            for char in self.cas:
-                output += rlookup(char, d) if char != ' ' else ' '
-        self.cas = output
+        trace = self.take_trace('swap')
+        self.phrase = self.phrase.swapped()
         self.translate()
-        self.disp_cas.setText(self.cas)
+        trace.mark('translate')
+        cas = self.cas
+        self.disp_cas.setText(cas)
         self.disp_ipa.setText(self.ipa)
-        self.disp_window.label.setText(self.cas)
+        if self._disp_window:
+            self._disp_window.label.setText(cas)
+        trace.mark('settext')
+        if self.publisher:
+            self.publisher.publish(cas, self.ipa, trace.action)
+            trace.mark('publish')
         if self.log_on:
-            with open(self.log_file, 'a') as f:
-                f.write(self.cas + '\n')
+            self.log_phrase()
+        self.finish_trace(trace)
 
     def toggle_log(self, checked):
         if not self.log_file:
             self.log_file = QFileDialog.getSaveFileName(
                 self, directory=str(Path.home()))[0]
+        if checked and not self.log_file:  # dialog cancelled
+            self.btn_log.setChecked(False)
+            return
         self.log_on = checked
         if checked:
+            try:
+                self.logger = PhraseLogger(
+                    self.log_file, binary=self.log_file.endswith('.abl'),
+                    **self.log_options)
+            except OSError as e:
+                self.log_failed(e)
+                return
             self.btn_log.setText('Text Log: ON')
         else:
+            logger, self.logger = self.logger, None
             self.btn_log.setText('Text Log: OFF')
+            try:
+                logger.close()
+            except OSError as e:
+                self.log_failed(e)
+
+    def log_phrase(self):
+        try:
+            self.logger.write(self.phrase, self.mode, self.consonants())
+        except OSError as e:
+            self.log_failed(e)
+
+    def log_failed(self, error):
+        # stop logging rather than drop phrases silently
+        self.statusBar().showMessage('Text log failed: {}'.format(error),
+                                     10000)
+        if self.log_on:
+            self.btn_log.setChecked(False)
+            self.toggle_log(False)
+
+    @property
+    def disp_window(self):
+        if self._disp_window is None:
+            self._disp_window = DisplayWindow(self.cas, self.glyph_atlas)
+        return self._disp_window
+
+    def _open_speech(self):
+        start = time.perf_counter()
+        self._speech = speech.open_backend(cache=AudioCache())
+        self._speech_queue = SpeechQueue(self._speech, self.speech_policy,
+                                         self.speech_depth, self.metrics)
+        self.profile.background('speech backend',
+                                time.perf_counter() - start)
+
+    @property
+    def speech(self):
+        self._speech_opener.join()
+        return self._speech
+
+    @property
+    def speech_queue(self):
+        self._speech_opener.join()
+        return self._speech_queue
 
     def toggle_disp(self, checked):
         if checked:
@@ -754,26 +889,151 @@ class MainWindow(QMainWindow):
                 self.disp_window.hide()
 
     def random_voice(self):
-        self.voice = random.choice(VOICES)
+        (self.voice, self.pitch, self.speed,
+         self.gap) = self.voice_session.random_voice()
         self.ctl_voice.setCurrentText(self.voice)
-        self.pitch = random.randint(0, 99)
         self.ctl_pitch.setValue(self.pitch)
-        self.speed = random.randint(25, 250)
         self.ctl_speed.setValue(self.speed)
-        self.gap = random.randint(1, 40)
         self.ctl_gap.setValue(self.gap)
 
+    def current_voice(self):
+        return Voice(self.voice, self.pitch, self.speed, self.gap,
+                     self.amplitude)
+
+    def update_lookahead(self):
+        if self.lookahead:
+            self.lookahead.configure(self.mode, self.ref_switch,
+                                     self.consonants(), self.current_voice())
+
+    def toggle_lookahead(self, checked):
+        if checked:
+            self.btn_ahead.setText('Lookahead: ON')
+            # pre-rendered audio needs a player; without one, lookahead
+            # still prepares the text and speech renders as usual. Renders
+            # go through the speech backend, so they use the warm worker
+            # and fill the audio cache
+            self.lookahead = Lookahead(
+                synthesize=(self.speech.synthesize
+                            if speech.player_available() else None),
+                session=self.session.child('lookahead').child(
+                    self.lookahead_runs),
+                model=self.model)
+            self.lookahead_runs += 1
+            self.update_lookahead()
+        else:
+            self.btn_ahead.setText('Lookahead: OFF')
+            if self.lookahead:
+                self.lookahead.close()
+            self.lookahead = None
+            self.prepared = None
+
     def speak(self):
-        stressed = random_prosody(self.xsampa)
-        self.runner = SpeechRunner(
-            voice=self.voice,
-            pitch=self.pitch,
-            speed=self.speed,
-            gap=self.gap,
-            amplitude=self.amplitude,
-            text=stressed
-        )
-        self.threadpool.start(self.runner)
+        trace = self.take_trace('speak')
+        # a prepared phrase is only good for the text and voice it was
+        # rendered with, and only once
+        prepared, self.prepared = self.prepared, None
+        if (prepared and prepared.xsampa == self.xsampa and
+                prepared.voice == self.current_voice()):
+            stressed = prepared.stressed
+            # prepared audio is a single voice
+            audio = None if self.chorus else prepared.audio
+        else:
+            stressed = self.prosody_session.phrase_prosody(
+                self.phrase, core.translator(self.consonants()))
+            audio = None
+        trace.mark('prosody')
+        self.speech_queue.submit(
+            self.current_voice(), stressed, audio,
+            synthesize=self.chorus.synthesize if self.chorus else None,
+            on_done=lambda timing: self.speech_signals.finished.emit(
+                (timing, trace)))
+
+    def toggle_tempo(self, checked):
+        if checked:
+            self.scheduler = tempo.Scheduler(
+                tempo.parse_pattern(self.rhythm, self.ctl_bpm.value()),
+                self.tempo_beat, self.overrun)
+            self.scheduler.start()
+        elif self.scheduler:
+            self.scheduler.stop()
+            self.statusBar().showMessage(
+                'Tempo: ' + self.scheduler.summary(), 5000)
+            self.scheduler = None
+
+    def tempo_beat(self, beat):
+        # on the scheduler thread
+        scheduler = self.scheduler
+        speaking = 's' in beat.actions
+        if speaking:
+            self.spoken.clear()
+        self.tempo_signals.beat.emit(beat)
+        if speaking:
+            while not self.spoken.wait(0.05):
+                if scheduler.stopped():
+                    return
+
+    def on_beat(self, beat):
+        self.metrics.observe('tempo.late', beat.late)
+        if 'g' in beat.actions:
+            self.generate()
+        if 's' in beat.actions:
+            self.speak()
+
+    def show_speech_timing(self, timing, trace=None):
+        self.spoken.set()
+        if timing.cancelled:  # interrupted or dropped by the queue
+            return
+        if trace:
+            trace.mark('synth_start', timing.started)
+            if timing.first_sound is not None:
+                trace.mark('first_sound', timing.first_sound)
+            trace.mark('exit', timing.finished)
+            self.finish_trace(trace)
+        if timing.error:
+            self.statusBar().showMessage(
+                'Speech failed: {}'.format(timing.error), 5000)
+            return
+        msg = []
+        summary = self.speech.ttfs_summary()
+        if summary:
+            msg.append('First sound: {:.0f} ms (avg {:.0f} ms)'
+                       .format(summary[0] * 1000, summary[1] * 1000))
+        queue = self.speech_queue
+        if queue.counters['interrupted'] or queue.counters['dropped']:
+            msg.append('Queue: ' + queue.summary())
+        if isinstance(self.speech, speech.CachedSpeech):
+            stats = self.speech.cache.stats()
+            msg.append('Audio cache: {} hits, {} misses, {} evictions'
+                       .format(stats['memory_hits'] + stats['disk_hits'],
+                               stats['misses'],
+                               stats['memory_evictions'] +
+                               stats['disk_evictions']))
+        if msg:
+            self.statusBar().showMessage('   '.join(msg), 5000)
+
+    def closeEvent(self, event):
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.lookahead:
+            self.lookahead.close()
+        if self.logger:
+            try:
+                self.logger.close()
+            except OSError:
+                pass  # closing anyway
+        self.speech_queue.close()
+        self.speech.close()
+        if self.chorus:
+            self.chorus.close()
+        if self._disp_window:
+            self._disp_window.close()
+        if self.metrics_file:
+            self.write_metrics()
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.publisher:
+            self.publisher.close()
+        super().closeEvent(event)
 
     def sc_win(self):
         pass
@@ -782,7 +1042,118 @@ class MainWindow(QMainWindow):
         pass
 
 
-app = QApplication(sys.argv)
-window = MainWindow()
-window.show()
-app.exec_()
+def main():
+    parser = argparse.ArgumentParser(prog='abugida_7.py')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='replay the session started with this seed')
+    parser.add_argument('--metrics-file', default=None,
+                        help='write latency histograms to this JSON file')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve latency histograms on this local port')
+    parser.add_argument('--atlas', action='store_true',
+                        help='draw the display window from pre-rendered '
+                             'glyphs instead of laying out text')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print how long each startup phase took')
+    parser.add_argument('--model', default=None, metavar='FILE',
+                        help='JSON generation model: uniform, weighted or '
+                             'markov (default: uniform)')
+    parser.add_argument('--rhythm', default='1:gs', metavar='PATTERN',
+                        help='steps for Tempo, as BEATS[:ACTIONS] with '
+                             'actions g (generate), s (speak) or - (rest), '
+                             'e.g. "1:g 1:s" (default: 1:gs)')
+    parser.add_argument('--overrun', choices=list(tempo.POLICIES),
+                        default='skip',
+                        help='when Tempo misses a beat: skip to the next '
+                             'due, catchup on every missed beat, or shift '
+                             'the rhythm later (default: skip)')
+    parser.add_argument('--speech-policy', choices=list(POLICIES),
+                        default='interrupt',
+                        help='when Speak is pressed during speech: '
+                             'interrupt it, coalesce to the latest phrase '
+                             'after it, or queue with drop-oldest '
+                             '(default: interrupt)')
+    parser.add_argument('--speech-depth', type=int, default=4,
+                        help='phrases waiting to be spoken with '
+                             'drop-oldest (default: 4)')
+    parser.add_argument('--log-sync', choices=list(SYNC_POLICIES),
+                        default='interval',
+                        help='when the text log is flushed to disk: none '
+                             '(on close), every --log-sync-interval '
+                             'seconds, or every --log-sync-every phrases '
+                             '(default: interval)')
+    parser.add_argument('--log-sync-interval', type=float, default=1.0,
+                        metavar='SECONDS',
+                        help='seconds between log syncs (default: 1)')
+    parser.add_argument('--log-sync-every', type=int, default=100,
+                        metavar='N',
+                        help='phrases between log syncs (default: 100)')
+    parser.add_argument('--log-max-bytes', type=int, default=0,
+                        metavar='BYTES',
+                        help='rotate the log when it reaches this size '
+                             '(default: 0, never)')
+    parser.add_argument('--log-backups', type=int, default=5, metavar='N',
+                        help='rotated logs to keep as LOG.1 ... LOG.N '
+                             '(default: 5)')
+    parser.add_argument('--publish', action='append', default=[],
+                        metavar='URL',
+                        help='send each phrase to remote displays at '
+                             'udp://group:port or tcp://host:port '
+                             '(repeatable)')
+    args, qt_args = parser.parse_known_args()
+    profile = PhaseTimer(STARTED)
+    profile.mark('imports')
+    model = None
+    if args.model:
+        try:
+            model = load_model(args.model)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    try:
+        tempo.parse_pattern(args.rhythm)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.speech_depth < 1:
+        parser.error('--speech-depth must be at least 1')
+    if args.log_sync_interval <= 0 or args.log_sync_every < 1:
+        parser.error('--log-sync-interval and --log-sync-every must be '
+                     'positive')
+    if args.log_max_bytes < 0 or args.log_backups < 0:
+        parser.error('--log-max-bytes and --log-backups cannot be '
+                     'negative')
+    publisher = None
+    if args.publish:
+        try:
+            publisher = Publisher(args.publish)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    profile.mark('application')
+    window = MainWindow(seed=args.seed, metrics_file=args.metrics_file,
+                        metrics_port=args.metrics_port, publisher=publisher,
+                        glyph_atlas=args.atlas, profile=profile,
+                        model=model, rhythm=args.rhythm,
+                        overrun=args.overrun,
+                        speech_policy=args.speech_policy,
+                        speech_depth=args.speech_depth,
+                        log_options=dict(
+                            sync=args.log_sync,
+                            sync_interval=args.log_sync_interval,
+                            sync_every=args.log_sync_every,
+                            max_bytes=args.log_max_bytes,
+                            backup_count=args.log_backups))
+    window.show()
+    profile.mark('show')
+    if args.profile_startup:
+        def report():
+            # runs once the event loop has painted the first frame
+            profile.mark('first paint')
+            window.speech  # wait for the background phases to finish
+            sys.stderr.write(profile.report())
+        QTimer.singleShot(0, report)
+    return app.exec_()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import pytest
+
+from abugida.binlog import (BinaryLogReader, BinaryLogWriter, decode_entry,
+                            encode_entry, index_path)
+from abugida.core import Session
+
+
+def test_encode_decode():
+    for reflectionals in (False, True):
+        session = Session(1)
+        for mode in ('syl', 'word', 'line'):
+            phrase = session.phrase(mode, reflectionals)
+            data = encode_entry(phrase, mode, 'ptkmnl', timestamp=12.5)
+            entry, end = decode_entry(data)
+            assert end == len(data)
+            assert entry.cas == phrase.text
+            assert entry.mode == mode
+            assert entry.reflectionals == reflectionals
+            assert entry.consonants == tuple('ptkmnl')
+            assert entry.time == 12.5
+            assert encode_entry(phrase.text, mode, 'ptkmnl', 12.5) == data
+
+
+def test_encode_rejects_mixed_and_long_phrases():
+    with pytest.raises(ValueError):
+        encode_entry('ᐃᑭ')
+    with pytest.raises(ValueError):
+        encode_entry('ᐃ' * 0x10000)
+
+
+def test_reader_and_stale_index(tmp_path):
+    path = str(tmp_path/'log.abl')
+    session = Session(2)
+    phrases = [session.phrase('line') for _ in range(30)]
+    writer = BinaryLogWriter(path)
+    for phrase in phrases[:20]:
+        writer.write(phrase, 'line')
+    writer.close()
+    with open(index_path(path), 'r+b') as index:
+        index.truncate(8 * 5)
+    writer = BinaryLogWriter(path)
+    for phrase in phrases[20:]:
+        writer.write(phrase, 'line')
+    writer.close()
+    with BinaryLogReader(path) as log:
+        assert len(log) == 30
+        assert list(log.iter_text()) == [p.text for p in phrases]
+        assert log[-1].cas == phrases[-1].text
@@ -0,0 +1,76 @@
+import socket
+
+from abugida import broadcast
+from abugida.broadcast import Message, Publisher, Stats, Subscriber
+
+
+def tcp_url(pub):
+    return 'tcp://127.0.0.1:{}'.format(pub.senders[0].address[1])
+
+
+def test_tcp_messages_arrive_in_order():
+    pub = Publisher(['tcp://127.0.0.1:0'])
+    with Subscriber(tcp_url(pub), timeout=5) as sub:
+        pub.publish('ᐃ', 'pi')  # sent on joining, or as the first message
+        assert sub.recv().seq == 1
+        for n in range(50):
+            pub.publish('ᐅ' * n, 'pu')
+        assert [sub.recv().seq for _ in range(50)] == list(range(2, 52))
+    pub.close()
+
+
+def test_late_joiner_gets_current_phrase():
+    pub = Publisher(['tcp://127.0.0.1:0'])
+    pub.publish('ᐃ', 'pi')
+    pub.publish('ᐊ', 'pa')
+    with Subscriber(tcp_url(pub), timeout=5) as sub:
+        first = sub.recv()
+        assert (first.seq, first.cas) == (2, 'ᐊ')
+        pub.publish('ᐅ', 'pu')
+        assert sub.recv().seq == 3
+    pub.close()
+
+
+def test_slow_subscriber_is_dropped():
+    pub = Publisher(['tcp://127.0.0.1:0'])
+    server = pub.senders[0]
+    stalled = socket.socket()
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.connect(('127.0.0.1', server.address[1]))
+    with Subscriber(tcp_url(pub), timeout=5) as sub:
+        pub.publish('ᐃ', 'pi')
+        sub.recv()
+        assert len(server.clients) == 2
+        for _ in range(10000):
+            seq = pub.publish('ᐃ' * 1000, 'pi')
+            assert sub.recv().seq == seq  # the reader keeps up
+            if len(server.clients) == 1:
+                break
+        assert len(server.clients) == 1
+        pub.publish('ᐊ', 'pa')
+        assert sub.recv().cas == 'ᐊ'
+    stalled.close()
+    pub.close()
+
+
+def test_undecodable_datagrams_count_as_dropped():
+    with Subscriber('udp://127.0.0.1:0', timeout=5) as sub:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for junk in (b'not json\n', b'{"seq": 1}\n', b'\xff\xfe'):
+            sock.sendto(junk, sub.address)
+        sock.sendto(broadcast.encode(Message(7, 0.0, 'generate', 'ᐃ', 'pi')),
+                    sub.address)
+        assert sub.recv().seq == 7
+        assert sub.dropped == 3
+        sock.close()
+
+
+def test_stats_counts_gaps_and_bounds_latencies():
+    stats = Stats(window=10)
+    for seq in (1, 2, 5, 6):
+        stats.add(Message(seq, 0.0, 'generate', '', ''), now=0.001)
+    assert (stats.received, stats.missed) == (4, 2)
+    for seq in range(7, 107):
+        stats.add(Message(seq, 0.0, 'generate', '', ''), now=0.002)
+    assert len(stats.latencies) == 10
+    assert stats.summary().startswith('104 received, 2 missed, 0 dropped')
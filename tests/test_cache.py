@@ -0,0 +1,75 @@
+import os
+
+from abugida.cache import AudioCache, cache_key
+from abugida.speech import Voice
+
+VOICE = Voice('m3', 50, 175, 10, 50)
+
+
+def key(n):
+    return cache_key(VOICE, 'pa{}'.format(n))
+
+
+def test_hits_and_misses(tmp_path):
+    cache = AudioCache(tmp_path)
+    assert cache.get(key(1)) is None
+    cache.put(key(1), b'one')
+    assert cache.get(key(1)) == b'one'
+    # a new cache over the same directory finds it on disk
+    reopened = AudioCache(tmp_path)
+    assert reopened.get(key(1)) == b'one'
+    assert reopened.get(key(1)) == b'one'
+    assert cache.counters['misses'] == 1
+    assert cache.counters['memory_hits'] == 1
+    assert reopened.counters['disk_hits'] == 1
+    assert reopened.counters['memory_hits'] == 1
+
+
+def test_memory_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(tmp_path, memory_limit=30)
+    for n in range(3):
+        cache.put(key(n), bytes(10))
+    cache.get(key(0))  # now 1 is the oldest
+    cache.put(key(3), bytes(10))
+    stats = cache.stats()
+    assert stats['memory_entries'] == 3
+    assert stats['memory_bytes'] == 30
+    assert cache.counters['memory_evictions'] == 1
+    assert key(1) not in cache._memory and key(0) in cache._memory
+    # still on disk
+    assert cache.get(key(1)) == bytes(10)
+    assert cache.counters['disk_hits'] == 1
+
+
+def test_disk_evicts_least_recently_used(tmp_path):
+    cache = AudioCache(tmp_path, memory_limit=0, disk_limit=25)
+    for n in range(3):
+        cache.put(key(n), bytes(10))
+    stats = cache.stats()
+    assert stats['disk_entries'] == 2 and stats['disk_bytes'] == 20
+    assert cache.counters['disk_evictions'] == 1
+    assert len(list(tmp_path.glob('*.wav'))) == 2
+    assert cache.get(key(0)) is None
+    assert cache.get(key(2)) == bytes(10)
+
+
+def test_disk_recency_survives_reopening(tmp_path):
+    cache = AudioCache(tmp_path)
+    for n in range(3):
+        cache.put(key(n), bytes(10))
+        path = tmp_path/cache._filename(key(n))
+        os.utime(path, (1000 + n, 1000 + n))
+    os.utime(tmp_path/cache._filename(key(0)), (2000, 2000))
+    # opening with a smaller limit drops the oldest file, key 1
+    smaller = AudioCache(tmp_path, disk_limit=20)
+    assert smaller.counters['disk_evictions'] == 1
+    assert smaller.get(key(1)) is None
+    assert smaller.get(key(0)) == bytes(10)
+
+
+def test_clear(tmp_path):
+    cache = AudioCache(tmp_path)
+    cache.put(key(1), b'one')
+    cache.clear()
+    assert cache.get(key(1)) is None
+    assert list(tmp_path.glob('*.wav')) == []
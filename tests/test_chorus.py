@@ -0,0 +1,93 @@
+import array
+import io
+import sys
+
+import pytest
+
+from abugida import chorus
+from abugida.core import Session
+from abugida.render import WavFormat, WavSink, parse_wav
+from abugida.speech import Voice
+
+FORMAT = WavFormat(22050, 1, 2)
+VOICE = Voice('m3', 50, 175, 10, 50)
+
+MIXERS = [chorus._mix_python]
+try:
+    import numpy
+except ImportError:
+    pass
+else:
+    MIXERS.append(lambda pcms: chorus._mix_numpy(numpy, pcms))
+
+
+def wav(samples, fmt=FORMAT):
+    pcm = array.array('h', samples)
+    if sys.byteorder == 'big':
+        pcm.byteswap()
+    out = io.BytesIO()
+    sink = WavSink(out, fmt)
+    sink.write(pcm.tobytes())
+    sink.close()
+    return out.getvalue()
+
+
+def samples(data):
+    fmt, pcm = parse_wav(data)
+    assert fmt == FORMAT
+    return chorus._samples(pcm).tolist()
+
+
+@pytest.mark.parametrize('mixer', MIXERS)
+def test_quiet_parts_are_summed(mixer):
+    pcms = [parse_wav(wav(s))[1] for s in ([100, -200, 300], [1, 2, 3])]
+    out = chorus._samples(mixer(pcms))
+    assert out.tolist() == [101, -198, 303]
+
+
+@pytest.mark.parametrize('mixer', MIXERS)
+def test_clipping_mix_is_scaled_to_full_scale(mixer, monkeypatch):
+    monkeypatch.setattr(chorus, '_mixer', lambda: mixer)
+    loud = [30000, -30000, 15000, 0]
+    out = samples(chorus.mix([wav(loud), wav(loud)]))
+    # the peak of 60000 is brought down to 32767, the rest in proportion
+    assert max(map(abs, out)) == chorus.MAX_SAMPLE
+    assert out[:3] == pytest.approx(
+        [chorus.MAX_SAMPLE, -chorus.MAX_SAMPLE, chorus.MAX_SAMPLE / 2],
+        abs=1)
+    assert out[3] == 0
+
+
+@pytest.mark.parametrize('mixer', MIXERS)
+def test_mix_lasts_as_long_as_the_longest_part(mixer, monkeypatch):
+    monkeypatch.setattr(chorus, '_mixer', lambda: mixer)
+    out = samples(chorus.mix([wav([1] * 10), wav([2] * 25), wav([])]))
+    assert len(out) == 25
+    assert out == [3] * 10 + [2] * 15
+
+
+def test_mix_rejects_mismatched_formats():
+    with pytest.raises(ValueError):
+        chorus.mix([wav([0]), wav([0], WavFormat(44100, 1, 2))])
+    with pytest.raises(ValueError):
+        chorus.mix([])
+
+
+def test_chorus_mixes_every_voice():
+    rendered = []
+
+    def synthesize(voice, text):
+        rendered.append(voice)
+        return wav([100] * (len(rendered) * 10))
+
+    choir = chorus.Chorus(3, workers=2, synthesize=synthesize,
+                          rng=Session(1).rng)
+    try:
+        out = samples(choir.synthesize(VOICE, 'pa'))
+    finally:
+        choir.close()
+    assert len(rendered) == 3
+    assert sorted(rendered) == sorted(choir.voices(VOICE))
+    assert choir.voices(VOICE)[0] == VOICE
+    assert len(out) == 30
+    assert out[:10] == [300] * 10
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from abugida import core
+from abugida.core import Phrase, Session
+
+CONSONANTS = ('p', 't', 'k', 'm', 'n', 'l')
+MODES = ('syl', 'word', 'line')
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_same_seed_same_phrases(mode):
+    a, b = Session(42), Session(42)
+    assert ([a.generate(mode) for _ in range(50)] ==
+            [b.generate(mode) for _ in range(50)])
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('reflectionals', (False, True))
+def test_phrase_draws_like_text(mode, reflectionals):
+    a, b = Session(7), Session(7)
+    for _ in range(50):
+        assert (a.phrase(mode, reflectionals).text ==
+                b.generate(mode, reflectionals))
+
+
+def test_child_streams_are_independent():
+    session = Session(3)
+    first = session.child('phrases').line()
+    session.child('prosody').line()
+    assert Session(3).child('phrases').line() == first
+    assert Session(3).child(1).line() != Session(3).child(2).line()
+
+
+def test_string_and_phrase_generators_match():
+    for name, gen in core.GENERATORS.items():
+        r1, r2 = random.Random(5), random.Random(5)
+        assert ([gen(False, r1) for _ in range(20)] ==
+                [core.PHRASE_GENERATORS[name](False, r2).text
+                 for _ in range(20)])
+
+
+def test_phrase_round_trip():
+    session = Session(11)
+    for _ in range(50):
+        text = session.line(reflectionals=True)
+        phrase = Phrase.from_text(text)
+        assert phrase.text == text
+        assert phrase.reflectionals
+        assert Phrase(phrase.codes) == phrase
+
+
+def test_phrase_rejects_other_text():
+    with pytest.raises(ValueError):
+        Phrase.from_text('abc')
+
+
+def test_translate():
+    assert core.translate('ᐃᐅ ᑎ', CONSONANTS) == ('pipo ki', 'pipo ki')
+    tr = core.translator(CONSONANTS)
+    phrase = Phrase.from_text('ᐃᐅ ᑎ')
+    assert tr.translate(phrase) == tr.translate(phrase.text)
+
+
+def test_swap_round_trip():
+    session = Session(13)
+    for _ in range(50):
+        text = session.line()
+        swapped = core.swap(text)
+        assert swapped != text
+        assert core.swap(swapped) == text
+        assert Phrase.from_text(text).swapped().text == swapped
+        assert core.swap_text(swapped, False) == text
+        assert core.swap_text(text, True) == swapped
+
+
+def test_prosody_batch_matches_per_call():
+    session = Session(5)
+    lines = [core.translate(session.line(), 'ptkmnl')[1] for _ in range(200)]
+    one, many, it = random.Random(1), random.Random(1), random.Random(1)
+    expected = [core.PROSODY.apply(line, one) for line in lines]
+    assert core.PROSODY.apply_many(lines, many) == expected
+    assert list(core.PROSODY.iter_apply(lines, it)) == expected
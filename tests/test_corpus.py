@@ -0,0 +1,42 @@
+import io
+import json
+
+import pytest
+
+from abugida.core import Session
+from abugida.corpus import generate_corpus, shard_counts, write_phrases
+
+CONSONANTS = ('p', 't', 'k', 'm', 'n', 'l')
+
+
+def test_shard_counts():
+    assert shard_counts(10, 3) == [4, 3, 3]
+    assert shard_counts(2, 4) == [1, 1, 0, 0]
+    assert shard_counts(0, 2) == [0, 0]
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'count': -1},
+    {'count': 5, 'shards': 0},
+    {'count': 5, 'shards': -2},
+    {'count': 5, 'workers': 0},
+])
+def test_bad_counts_are_rejected(tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        generate_corpus(tmp_path/'out', **kwargs)
+    assert not (tmp_path/'out').exists()
+
+
+def test_shards_can_be_regenerated(tmp_path):
+    manifest = generate_corpus(tmp_path, 7, 'word', shards=2, seed=9,
+                               consonants=CONSONANTS, workers=1)
+    assert manifest['count'] == 7
+    assert [s['count'] for s in manifest['shards']] == [4, 3]
+    assert json.loads((tmp_path/'manifest.json').read_text()) == manifest
+    for i, shard in enumerate(manifest['shards']):
+        again = io.StringIO()
+        write_phrases(again, Session(9, shard['stream']), 'word',
+                      shard['count'], CONSONANTS)
+        text = (tmp_path/shard['file']).read_text(encoding='utf-8')
+        assert text == again.getvalue()
+        assert len(text.splitlines()) == shard['count']
@@ -0,0 +1,35 @@
+import pytest
+
+from abugida.core import Session
+from abugida.index import PhraseSpace, Permutation, Walk
+
+
+@pytest.mark.parametrize('mode', ('syl', 'word', 'line'))
+def test_rank_unrank(mode):
+    space = PhraseSpace.for_mode(mode)
+    session = Session(4)
+    for _ in range(100):
+        cas = session.generate(mode)
+        assert space.unrank(space.rank(cas)) == cas
+    for n in (0, 1, space.size // 3, space.size - 1):
+        assert space.rank(space.unrank(n)) == n
+    with pytest.raises(IndexError):
+        space.unrank(space.size)
+
+
+def test_permutation_is_a_bijection():
+    perm = Permutation(1000, b'key')
+    values = [perm[i] for i in range(1000)]
+    assert sorted(values) == list(range(1000))
+    assert all(perm.index(v) == i for i, v in enumerate(values))
+
+
+def test_walk_resumes():
+    walk = Walk('word', seed=9)
+    first = [next(walk) for _ in range(10)]
+    resumed = Walk.from_state(walk.state())
+    rest = [next(resumed) for _ in range(10)]
+    fresh = Walk('word', seed=9)
+    assert first + rest == [next(fresh) for _ in range(20)]
+    assert len(set(first + rest)) == 20
+    assert Walk('word', seed=9).position_of(rest[0]) == 10
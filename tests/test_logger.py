@@ -0,0 +1,153 @@
+import os
+import time
+
+import pytest
+
+from abugida import logger as logger_module
+from abugida.binlog import BinaryLogReader, index_path
+from abugida.core import Session
+from abugida.logger import PhraseLogger
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    real = os.fsync
+
+    def fsync(fd):
+        calls.append(fd)
+        real(fd)
+    monkeypatch.setattr(os, 'fsync', fsync)
+    return calls
+
+
+def test_close_drains_the_queue(tmp_path):
+    path = tmp_path/'log.txt'
+    log = PhraseLogger(path, sync='none', batch_size=7)
+    lines = ['phrase {}'.format(i) for i in range(2000)]
+    for line in lines:
+        log.write(line)
+    log.close()
+    log.close()
+    assert read_lines(path) == lines
+    with pytest.raises(ValueError):
+        log.write('late')
+
+
+def test_sync_none(tmp_path, fsyncs):
+    path = tmp_path/'log.txt'
+    log = PhraseLogger(path, sync='none')
+    log.write('a')
+    log.write('b')
+    log.close()
+    assert read_lines(path) == ['a', 'b']
+    assert fsyncs == []
+
+
+def test_sync_interval(tmp_path, fsyncs):
+    path = tmp_path/'log.txt'
+    log = PhraseLogger(path, sync='interval', sync_interval=0.05)
+    log.write('a')
+    # flushed by the timer, without another write or close
+    wait_for(lambda: read_lines(path) == ['a'])
+    assert fsyncs
+    log.close()
+
+
+def test_sync_every(tmp_path, fsyncs):
+    path = tmp_path/'log.txt'
+    log = PhraseLogger(path, sync='every', sync_every=3, batch_size=1)
+    log.write('a')
+    log.write('b')
+    time.sleep(0.1)
+    assert fsyncs == []
+    log.write('c')
+    wait_for(lambda: read_lines(path) == ['a', 'b', 'c'])
+    assert fsyncs
+    log.close()
+
+
+def test_text_rotation(tmp_path):
+    path = str(tmp_path/'log.txt')
+    log = PhraseLogger(path, sync='none', max_bytes=20, backup_count=2,
+                       batch_size=1)
+    lines = ['{:09d}'.format(i) for i in range(10)]
+    for line in lines:
+        log.write(line)
+    log.close()
+    # two lines per file, only the newest files kept
+    assert read_lines(path + '.2') == lines[6:8]
+    assert read_lines(path + '.1') == lines[8:10]
+    assert read_lines(path) == []
+    assert not os.path.exists(path + '.3')
+
+
+def test_binary_rotation_moves_the_index(tmp_path):
+    path = str(tmp_path/'log.abl')
+    session = Session(3)
+    phrases = [session.phrase('word') for _ in range(40)]
+    log = PhraseLogger(path, sync='none', max_bytes=200, backup_count=50,
+                       batch_size=1, binary=True)
+    for phrase in phrases:
+        log.write(phrase, 'word', 'ptkmnl')
+    log.close()
+    files = [path + '.{}'.format(i) for i in range(50, 0, -1)]
+    files = [f for f in files if os.path.exists(f)] + [path]
+    assert len(files) > 2
+    logged = []
+    for f in files:
+        assert os.path.getsize(index_path(f)) > 0 or f == path
+        with BinaryLogReader(f) as reader:
+            assert reader._n_indexed == len(reader)
+            logged += [entry.cas for entry in reader]
+    assert logged == [phrase.text for phrase in phrases]
+
+
+def test_bad_phrase_is_reported_and_skipped(tmp_path):
+    path = str(tmp_path/'log.abl')
+    log = PhraseLogger(path, sync='none', binary=True)
+    log.write('ᐃ')
+    log.write('ᐃᑭ')
+    log.write('ᐅ')
+    with pytest.raises(ValueError):
+        log.close()
+    with BinaryLogReader(path) as reader:
+        assert [entry.cas for entry in reader] == ['ᐃ', 'ᐅ']
+        assert reader._n_indexed == 2
+
+
+def test_failed_rotation_is_reported_and_logging_goes_on(tmp_path,
+                                                         monkeypatch):
+    path = str(tmp_path/'log.txt')
+    real = os.replace
+    failures = []
+
+    def replace(src, dst):
+        if not failures:
+            failures.append(src)
+            raise OSError('disk on fire')
+        real(src, dst)
+    monkeypatch.setattr(logger_module.os, 'replace', replace)
+    log = PhraseLogger(path, sync='none', max_bytes=5, backup_count=1,
+                       batch_size=1)
+    log.write('first')
+    wait_for(lambda: log.error is not None)
+    with pytest.raises(OSError):
+        log.write('second')
+    log.write('third')
+    log.close()
+    # the failed rotation left 'first' in place, the next one moved it
+    assert read_lines(path + '.1') == ['first', 'third']
+    assert read_lines(path) == []
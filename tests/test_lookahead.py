@@ -0,0 +1,92 @@
+import threading
+import time
+
+from abugida.core import Session
+from abugida.lookahead import Lookahead
+from abugida.speech import Voice
+
+CONSONANTS = ('p', 't', 'k', 'm', 'n', 'l')
+LOW = Voice('m3', 20, 175, 10, 50)
+HIGH = Voice('m3', 80, 175, 10, 50)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_prepares_and_renders_ahead():
+    rendered = []
+
+    def synthesize(voice, text):
+        rendered.append(text)
+        return b'wav ' + text.encode()
+
+    ahead = Lookahead(depth=3, synthesize=synthesize, session=Session(1))
+    try:
+        ahead.configure('word', False, CONSONANTS, LOW)
+        wait_for(lambda: len(ahead._queue) == 3)
+        item = ahead.next()
+        assert item.audio == b'wav ' + item.stressed.encode()
+        assert item.voice == LOW and len(item.phrase.words()) == 1
+        assert ahead.counters['hits'] == 1
+    finally:
+        ahead.close()
+
+
+def test_configure_invalidates_queued_items():
+    ahead = Lookahead(depth=3, session=Session(2))
+    try:
+        ahead.configure('syl', False, CONSONANTS, LOW)
+        wait_for(lambda: len(ahead._queue) == 3)
+        ahead.configure('syl', False, CONSONANTS, LOW)  # unchanged
+        assert ahead.counters['invalidations'] == 0
+        ahead.configure('line', True, CONSONANTS, HIGH)
+        assert ahead.counters['invalidations'] == 1
+        wait_for(lambda: len(ahead._queue) == 3)
+        for _ in range(3):
+            item = ahead.next()
+            assert item.voice == HIGH and item.phrase.reflectionals
+            assert len(item.phrase.words()) >= 2
+    finally:
+        ahead.close()
+
+
+def test_items_from_an_old_generation_are_dropped():
+    started, release = threading.Event(), threading.Event()
+    voices = []
+
+    def synthesize(voice, text):
+        voices.append(voice)
+        if voice == LOW:
+            started.set()
+            release.wait(5)  # still rendering when the config changes
+        return b'wav'
+
+    ahead = Lookahead(depth=2, synthesize=synthesize, session=Session(3))
+    try:
+        ahead.configure('word', False, CONSONANTS, LOW)
+        assert started.wait(5)
+        ahead.configure('word', False, CONSONANTS, HIGH)
+        release.set()
+        wait_for(lambda: len(ahead._queue) == 2)
+        assert [item.voice for item in ahead._queue] == [HIGH, HIGH]
+        assert voices[0] == LOW
+    finally:
+        release.set()
+        ahead.close()
+
+
+def test_same_phrases_whatever_the_timing():
+    def phrases(prefill):
+        ahead = Lookahead(depth=2, session=Session(4))
+        try:
+            ahead.configure('line', False, CONSONANTS, LOW)
+            if prefill:
+                wait_for(lambda: len(ahead._queue) == 2)
+            return [ahead.next().phrase for _ in range(6)]
+        finally:
+            ahead.close()
+    assert phrases(True) == phrases(False)
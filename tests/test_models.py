@@ -0,0 +1,60 @@
+import collections
+import random
+
+import pytest
+
+from abugida.core import Session
+from abugida.models import AliasTable, load_model, model_from_config
+
+
+def test_alias_table_distribution():
+    weights = [1, 0, 3, 6]
+    table = AliasTable(weights, 'abcd')
+    rng = random.Random(0)
+    n = 100000
+    counts = collections.Counter(table.sample(rng) for _ in range(n))
+    assert counts['b'] == 0
+    for value, weight in zip('abcd', weights):
+        assert abs(counts[value] / n - weight / 10) < 0.01
+
+
+def test_alias_table_rejects_bad_weights():
+    for weights in ([], [0, 0], [1, -1]):
+        with pytest.raises(ValueError):
+            AliasTable(weights)
+
+
+def test_models_are_seeded():
+    model = model_from_config({
+        'model': 'markov', 'order': 1,
+        'vowels': {'a': 3, 'e': 1},
+        'transitions': {'delta-a': {'chevron-i': 1}}})
+    a, b = Session(5), Session(5)
+    assert ([a.generate('line', model=model) for _ in range(20)] ==
+            [b.generate('line', model=model) for _ in range(20)])
+    phrase = Session(6).phrase('word', model=model)
+    assert set(phrase.vowels()) <= {0, 2, 3}  # no o, given no weight
+
+
+@pytest.mark.parametrize('config, key', [
+    (['weighted'], 'JSON object'),
+    ({'model': 'weighted', 'vowels': {'a': 'lots'}}, "'a'"),
+    ({'model': 'weighted', 'vowels': [1, 2]}, 'vowels'),
+    ({'model': 'weighted', 'syllables': {'delta-i': None}}, "'delta-i'"),
+    ({'word_lengths': {'two': 1}}, "'two'"),
+    ({'line_lengths': {'3': '1'}}, "'3'"),
+    ({'model': 'markov', 'transitions': {'delta-a': {'arch-o': []}}},
+     "'arch-o'"),
+    ({'model': 'markov', 'transitions': {'delta-a': 1}}, "'delta-a'"),
+    ({'model': 'markov', 'order': '2'}, 'order'),
+])
+def test_bad_configs_name_the_key(config, key):
+    with pytest.raises(ValueError, match=key):
+        model_from_config(config)
+
+
+def test_load_model_names_the_file(tmp_path):
+    path = tmp_path / 'model.json'
+    path.write_text('{"model": "weighted", "shapes": {"arch": "x"}}')
+    with pytest.raises(ValueError, match="model.json: .*'arch'"):
+        load_model(path)
@@ -0,0 +1,120 @@
+import io
+import struct
+
+import pytest
+
+from abugida import render
+from abugida.render import DEFAULT_VOICE, MAX_TRACKS, Cue
+
+
+def cues(n, frames=22050):
+    return [Cue(i + 1, i * frames, frames, 'pa', DEFAULT_VOICE, 'ᐸ')
+            for i in range(n)]
+
+
+def test_timestamp_counts_cd_frames():
+    assert render._timestamp(0, 22050) == '00:00:00'
+    assert render._timestamp(22050 * 61 + 22050 // 75 * 3, 22050) == \
+        '01:01:03'
+
+
+def test_short_set_fits_one_sheet():
+    assert render.cue_sheets('set.cue', cues(MAX_TRACKS)) == \
+        [('set.cue', cues(MAX_TRACKS))]
+
+
+def test_long_set_is_split_into_sheets():
+    sheets = render.cue_sheets('out/set.cue', cues(2 * MAX_TRACKS + 1))
+    assert [path for path, _ in sheets] == \
+        ['out/set.cue', 'out/set-2.cue', 'out/set-3.cue']
+    assert [len(part) for _, part in sheets] == [MAX_TRACKS, MAX_TRACKS, 1]
+    f = io.StringIO()
+    render.write_cues(f, sheets[1][1], 22050, 'set.wav')
+    text = f.getvalue()
+    assert text.startswith('FILE "set.wav" WAVE\n  TRACK 01 AUDIO\n')
+    assert 'TRACK 99 AUDIO' in text and 'TRACK 100' not in text
+    assert 'REM PHRASE 100\n' in text
+    assert 'REM SAMPLE_START {}\n'.format(99 * 22050) in text
+
+
+def test_write_cues_rejects_too_many_tracks():
+    with pytest.raises(ValueError):
+        render.write_cues(io.StringIO(), cues(MAX_TRACKS + 1), 22050,
+                          'set.wav')
+
+
+RATE = 22050
+
+
+def wav(samples, streaming=False, rate=RATE):
+    """16-bit mono WAV; `streaming` writes espeak-ng's pipe header."""
+    pcm = b''.join(s.to_bytes(2, 'little', signed=True) for s in samples)
+    if streaming:
+        # sizes unknown when writing to a pipe; a torn last sample too
+        size = 0x7ffff000
+        pcm += b'\x01'
+    else:
+        size = len(pcm)
+    return (b'RIFF' + (size + 36).to_bytes(4, 'little') + b'WAVE' +
+            struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, 1, rate,
+                        rate * 2, 2, 16) +
+            b'data' + size.to_bytes(4, 'little') + pcm)
+
+
+def test_parse_wav_streaming_header():
+    fmt, pcm = render.parse_wav(wav([1, 2, 3], streaming=True))
+    assert fmt == render.WavFormat(RATE, 1, 2)
+    assert bytes(pcm) == wav([1, 2, 3])[44:]
+    with pytest.raises(ValueError):
+        render.parse_wav(b'RIFF\0\0\0\0AVI ')
+
+
+def test_renderer_stitches_phrases_and_cues():
+    # phrase i is i * 1000 frames of the sample value i
+    def synthesize(voice, text):
+        i = int(text)
+        return wav([i] * (i * 1000), streaming=i == 2)
+
+    entries = [render.Entry('1'), render.Entry('2', pause=0.5),
+               render.Entry('3')]
+    out = io.BytesIO()
+    renderer = render.Renderer(lambda fmt: render.WavSink(out, fmt),
+                               gap=0.25, workers=2, synthesize=synthesize,
+                               window=1)
+    result = renderer.render(entries)
+
+    gap, pause = RATE // 4, RATE // 2
+    starts = [0, 1000 + gap, 1000 + gap + 2000 + pause]
+    assert [(c.number, c.start, c.frames) for c in result] == \
+        [(1, starts[0], 1000), (2, starts[1], 2000), (3, starts[2], 3000)]
+    assert renderer.frames == starts[2] + 3000
+
+    data = out.getvalue()
+    fmt, pcm = render.parse_wav(data)
+    # the header was rewritten with the real sizes
+    assert int.from_bytes(data[40:44], 'little') == len(pcm)
+    assert len(pcm) == len(data) - 44
+    samples = [int.from_bytes(pcm[j:j + 2], 'little', signed=True)
+               for j in range(0, len(pcm), 2)]
+    assert len(samples) == renderer.frames
+    expected = ([1] * 1000 + [0] * gap + [2] * 2000 + [0] * pause +
+                [3] * 3000)
+    assert samples == expected
+
+    f = io.StringIO()
+    render.write_cues(f, result, RATE, 'set.wav')
+    indexes = [line.split()[-1] for line in f.getvalue().splitlines()
+               if line.strip().startswith('INDEX 01')]
+    assert indexes == [render._timestamp(s, RATE) for s in starts]
+    # 6512 and 19537 samples, in 1/75 s
+    assert indexes[1:] == ['00:00:22', '00:00:66']
+
+
+def test_renderer_rejects_a_format_change():
+    def synthesize(voice, text):
+        return wav([0] * 10, rate=RATE if text == 'a' else 16000)
+
+    renderer = render.Renderer(lambda fmt: render.WavSink(io.BytesIO(), fmt),
+                               workers=1, synthesize=synthesize)
+    with pytest.raises(ValueError):
+        renderer.render([render.Entry('a'), render.Entry('b')])
@@ -0,0 +1,193 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from abugida.cache import AudioCache, cache_key
+from abugida.speech import CachedSpeech, SpeechTiming, SpeechWorker, Voice
+
+ROOT = Path(__file__).resolve().parent.parent
+VOICE = Voice('m3', 50, 175, 10, 50)
+
+# worker_main with an engine that says "hang" until it is cancelled
+FAKE_ENGINE = '''
+import sys, threading
+sys.path.insert(0, {root!r})
+from abugida import speech
+
+class Engine:
+    def __init__(self):
+        self.aborted = False
+        self.stop = threading.Event()
+    def arm(self):
+        self.aborted = False
+        self.stop.clear()
+    def cancel(self):
+        self.aborted = True
+        self.stop.set()
+    def speak(self, voice, text, on_first_sound=None):
+        on_first_sound()
+        if text == 'hang':
+            self.stop.wait(30)
+    def render(self, voice, text):
+        if text == 'bad':
+            raise OSError('no such phoneme')
+        return ('RIFF ' + voice.voice + ' ' + text).encode()
+
+speech.EspeakLibrary = Engine
+sys.exit(speech.worker_main())
+'''.format(root=str(ROOT))
+
+# a player that swallows its input
+PLAYER = (sys.executable, '-c', 'import sys; sys.stdin.buffer.read()')
+
+# answers ready, then never answers anything
+STUCK = '''
+import json, sys, time
+print(json.dumps({"event": "ready"}), flush=True)
+sys.stdin.readline()
+time.sleep(30)
+'''
+
+
+def speak_in_background(backend, text):
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.setdefault(
+            'timing', backend.speak(VOICE, text)))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not backend._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return thread, result
+
+
+def test_cancel_stops_the_phrase_without_killing_the_worker():
+    backend = SpeechWorker([sys.executable, '-c', FAKE_ENGINE],
+                           player=None, cancel_timeout=5)
+    backend.start()
+    proc = backend._proc
+    try:
+        thread, result = speak_in_background(backend, 'hang')
+        time.sleep(0.2)
+        backend.cancel()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert result['timing'].cancelled
+        assert backend._proc is proc and proc.poll() is None
+
+        backend.reset()
+        timing = backend.speak(VOICE, 'pa')
+        assert timing.error is None and not timing.cancelled
+        assert backend._proc is proc
+    finally:
+        backend.close()
+
+
+def test_worker_that_ignores_cancel_is_killed():
+    backend = SpeechWorker([sys.executable, '-c', STUCK], player=None,
+                           cancel_timeout=0.2)
+    backend.start()
+    proc = backend._proc
+    try:
+        thread, result = speak_in_background(backend, 'pa')
+        backend.cancel()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert result['timing'].error == 'speech worker exited'
+        assert proc.wait(5) is not None
+        assert backend._proc is None and not backend.failed
+    finally:
+        backend.close()
+
+
+def test_worker_renders_without_playing():
+    backend = SpeechWorker([sys.executable, '-c', FAKE_ENGINE],
+                           player=None)
+    backend.start()
+    proc = backend._proc
+    try:
+        assert backend.synthesize(VOICE, "'pa") == b"RIFF m3 'pa"
+        with pytest.raises(OSError, match='no such phoneme'):
+            backend.synthesize(VOICE, 'bad')
+        # a cancel for speech leaves renders alone
+        backend.cancel()
+        assert backend.synthesize(VOICE, 'ti') == b'RIFF m3 ti'
+        assert backend._proc is proc
+    finally:
+        backend.close()
+
+
+class FakeBackend:
+    """Renders instantly and records what it was asked for."""
+
+    def __init__(self):
+        self.rendered = []
+        self.spoken = []
+
+    def synthesize(self, voice, text):
+        self.rendered.append(text)
+        if text == 'bad':
+            raise OSError('espeak-ng failed')
+        return b'wav ' + text.encode()
+
+    def speak(self, voice, text):
+        self.spoken.append(text)
+        timing = SpeechTiming()
+        timing.finish()
+        return timing
+
+    def cancel(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingSpeech(CachedSpeech):
+    def play(self, data, timing=None):
+        self.played.append(data)
+        return super().play(data, timing)
+
+
+def cached_speech(tmp_path):
+    inner = FakeBackend()
+    backend = RecordingSpeech(inner, AudioCache(tmp_path), PLAYER)
+    backend.played = []
+    return inner, backend
+
+
+def test_cache_miss_renders_once_through_inner(tmp_path):
+    inner, backend = cached_speech(tmp_path)
+    first = backend.speak(VOICE, 'pa')
+    second = backend.speak(VOICE, 'pa')
+    assert first.error is None and second.error is None
+    assert first.first_sound is not None
+    assert inner.rendered == ['pa'] and inner.spoken == []
+    assert backend.played == [b'wav pa', b'wav pa']
+    assert backend.cache.counters['misses'] == 1
+    assert backend.cache.counters['memory_hits'] == 1
+
+
+def test_failed_render_is_an_error_and_not_cached(tmp_path):
+    inner, backend = cached_speech(tmp_path)
+    timing = backend.speak(VOICE, 'bad')
+    assert timing.error == 'espeak-ng failed'
+    assert not timing.cancelled
+    assert backend.played == []
+    assert backend.cache.get(cache_key(VOICE, 'bad')) is None
+
+
+def test_cancelled_render_is_not_played(tmp_path):
+    inner, backend = cached_speech(tmp_path)
+    backend.cancel()
+    timing = backend.speak(VOICE, 'pa')
+    assert timing.cancelled and backend.played == []
+    backend.reset()
+    assert backend.synthesize(VOICE, 'pa') == b'wav pa'
+    assert inner.rendered == ['pa']  # cached by the cancelled speak
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import pytest
+
+from abugida.metrics import Metrics
+from abugida.speech import SpeechTiming, Voice
+from abugida.speechqueue import SpeechQueue
+
+VOICE = Voice('m3', 50, 175, 10, 50)
+
+
+class GatedBackend:
+    """Speaks until `gate` opens or it is cancelled, logging each call.
+
+    A cancelled phrase returns only once `after_cancel` is set, so a
+    test can submit more while the queue is still busy with it.
+    """
+
+    def __init__(self):
+        self.log = []
+        self.gate = threading.Event()
+        self.after_cancel = threading.Event()
+        self.after_cancel.set()
+        self.speaking = threading.Event()
+        self._cancelled = threading.Event()
+
+    def reset(self):
+        self.log.append('reset')
+        self._cancelled.clear()
+
+    def cancel(self):
+        self.log.append('cancel')
+        self._cancelled.set()
+
+    def speak(self, voice, text):
+        self.log.append(text)
+        timing = SpeechTiming()
+        self.speaking.set()
+        while not self.gate.wait(0.005):
+            if self._cancelled.is_set():
+                self.after_cancel.wait(5)
+                timing.cancel()
+                return timing
+        timing.finish()
+        return timing
+
+    def play(self, data):
+        return self.speak(VOICE, data.decode())
+
+
+class Results:
+    def __init__(self):
+        self.done = {}
+        self._cond = threading.Condition()
+
+    def callback(self, text):
+        def on_done(timing):
+            with self._cond:
+                self.done[text] = ('cancelled' if timing.cancelled else
+                                   timing.error or 'spoken')
+                self._cond.notify_all()
+        return on_done
+
+    def wait(self, n):
+        with self._cond:
+            assert self._cond.wait_for(lambda: len(self.done) >= n, 5)
+        return self.done
+
+
+def start(policy, depth=4, metrics=None):
+    backend = GatedBackend()
+    queue = SpeechQueue(backend, policy, depth, metrics)
+    return backend, queue, Results()
+
+
+def submit(queue, results, text, **kwargs):
+    queue.submit(VOICE, text, on_done=results.callback(text), **kwargs)
+
+
+def hold_first(backend, queue, results):
+    # A is being spoken when this returns
+    submit(queue, results, 'A')
+    assert backend.speaking.wait(5)
+
+
+def test_interrupt_cuts_short_and_drops_waiting():
+    backend, queue, results = start('interrupt')
+    try:
+        hold_first(backend, queue, results)
+        backend.after_cancel.clear()  # A stays busy being cancelled
+        submit(queue, results, 'B')
+        submit(queue, results, 'C')
+        backend.gate.set()
+        backend.after_cancel.set()
+        assert results.wait(3) == {'A': 'cancelled', 'B': 'cancelled',
+                                   'C': 'spoken'}
+        assert backend.log == ['reset', 'A', 'cancel', 'cancel',
+                               'reset', 'C']
+        assert queue.counters == {'submitted': 3, 'spoken': 1,
+                                  'interrupted': 1, 'dropped': 1}
+    finally:
+        queue.close()
+
+
+def test_coalesce_finishes_current_then_speaks_latest():
+    backend, queue, results = start('coalesce')
+    try:
+        hold_first(backend, queue, results)
+        for text in 'BCD':
+            submit(queue, results, text)
+        assert results.wait(2) == {'B': 'cancelled', 'C': 'cancelled'}
+        backend.gate.set()
+        assert results.wait(4) == {'A': 'spoken', 'B': 'cancelled',
+                                   'C': 'cancelled', 'D': 'spoken'}
+        assert backend.log == ['reset', 'A', 'reset', 'D']
+        assert queue.counters['dropped'] == 2
+        assert queue.counters['interrupted'] == 0
+    finally:
+        queue.close()
+
+
+def test_drop_oldest_keeps_depth_waiting():
+    backend, queue, results = start('drop-oldest', depth=2)
+    try:
+        hold_first(backend, queue, results)
+        for text in 'BCDE':
+            submit(queue, results, text)
+        assert queue.waiting() == 2
+        assert results.wait(2) == {'B': 'cancelled', 'C': 'cancelled'}
+        backend.gate.set()
+        results.wait(5)
+        assert backend.log == ['reset', 'A', 'reset', 'D', 'reset', 'E']
+        assert [results.done[t] for t in 'ADE'] == ['spoken'] * 3
+        assert queue.counters['dropped'] == 2
+    finally:
+        queue.close()
+
+
+def test_queue_wait_is_recorded():
+    metrics = Metrics()
+    backend, queue, results = start('drop-oldest', metrics=metrics)
+    try:
+        hold_first(backend, queue, results)
+        submit(queue, results, 'B')
+        time.sleep(0.1)
+        backend.gate.set()
+        results.wait(2)
+        hist = metrics.get('speech.queue_wait')
+        assert hist.count == 2
+        assert max(hist.recent) >= 0.1  # B waited for A
+        assert 'waited p50' in queue.summary()
+    finally:
+        queue.close()
+
+
+def test_audio_and_synthesize_paths():
+    backend, queue, results = start('drop-oldest')
+    backend.gate.set()
+
+    def synthesize(voice, text):
+        if text == 'bad':
+            raise OSError('render failed')
+        return b'mixed ' + text.encode()
+
+    try:
+        submit(queue, results, 'ready', audio=b'played')
+        submit(queue, results, 'chorus', synthesize=synthesize)
+        submit(queue, results, 'bad', synthesize=synthesize)
+        assert results.wait(3) == {'ready': 'spoken', 'chorus': 'spoken',
+                                   'bad': 'render failed'}
+        assert [e for e in backend.log if e != 'reset'] == \
+            ['played', 'mixed chorus']
+    finally:
+        queue.close()
+
+
+def test_close_cancels_current_and_rejects_new():
+    backend, queue, results = start('coalesce')
+    hold_first(backend, queue, results)
+    submit(queue, results, 'B')
+    queue.close()
+    assert results.wait(2) == {'A': 'cancelled', 'B': 'cancelled'}
+    with pytest.raises(ValueError):
+        submit(queue, results, 'C')
+
+
+def test_bad_policy_and_depth():
+    with pytest.raises(ValueError):
+        SpeechQueue(GatedBackend(), 'shout')
+    with pytest.raises(ValueError):
+        SpeechQueue(GatedBackend(), depth=0)
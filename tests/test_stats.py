@@ -0,0 +1,68 @@
+import collections
+
+from abugida import stats
+from abugida.binlog import BinaryLogWriter
+from abugida.core import Session
+
+
+def naive(phrases):
+    result = stats.LogStats()
+    for phrase in phrases:
+        words = phrase.words()
+        result.phrases += 1
+        result.line_lengths[len(words)] += 1
+        for word in words:
+            result.word_lengths[len(word)] += 1
+            result.syllables.update(word)
+            result.bigrams.update(zip(word, word[1:]))
+    return result
+
+
+def same_counts(a, b):
+    return all(getattr(a, f) == getattr(b, f) for f in
+               ('phrases', 'syllables', 'bigrams', 'word_lengths',
+                'line_lengths'))
+
+
+def make_logs(tmp_path):
+    session = Session(8)
+    text = [session.phrase('line') for _ in range(300)]
+    binary = [session.phrase(('syl', 'word', 'line')[i % 3], i % 2 == 0)
+              for i in range(300)]
+    (tmp_path/'log.tsv').write_text(
+        ''.join('{}\tipa\n'.format(p.text) for p in text), 'utf-8')
+    writer = BinaryLogWriter(tmp_path/'log.abl')
+    for phrase in binary:
+        writer.write(phrase)
+    writer.close()
+    paths = [tmp_path/'log.tsv', tmp_path/'log.abl',
+             tmp_path/'log.abl.idx']
+    return paths, text + binary
+
+
+def test_counts_match_naive(tmp_path):
+    paths, phrases = make_logs(tmp_path)
+    expected = naive(phrases)
+    for chunks in ({}, {'chunk_bytes': 500, 'chunk_entries': 7}):
+        result = stats.analyze(paths, workers=1, **chunks)
+        assert result.files == 2
+        assert same_counts(result, expected)
+
+
+def test_merge():
+    session = Session(9)
+    phrases = [session.phrase('line') for _ in range(200)]
+    a, b = naive(phrases[:50]), naive(phrases[50:])
+    assert same_counts(a + b, naive(phrases))
+    a += b
+    assert same_counts(a, naive(phrases))
+    assert sum(a.shapes.values()) == sum(a.syllables.values())
+
+
+def test_token_counting():
+    result = stats.count_tokens(stats.text_tokens(
+        'ᐃᐅ ᐊ\n\nᑎ\tᐃᐃ ᐃ\n'.encode()))
+    assert result.phrases == 2
+    assert result.word_lengths == collections.Counter({2: 1, 1: 2})
+    assert result.line_lengths == collections.Counter({2: 1, 1: 1})
+    assert result.bigrams == collections.Counter({(0, 1): 1})
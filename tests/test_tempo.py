@@ -0,0 +1,74 @@
+import pytest
+
+from abugida.tempo import FakeClock, Scheduler, Step, parse_pattern
+
+
+def run(pattern, policy='skip', beats=8, work=None):
+    """Run a schedule on a FakeClock; `work` maps beat index to seconds
+    the callback takes (the default is none).
+    """
+    clock = FakeClock(100.0)
+    fired = []
+
+    def callback(beat):
+        fired.append(beat)
+        clock.advance((work or {}).get(beat.index, 0.0))
+
+    scheduler = Scheduler(pattern, callback, policy, clock=clock.monotonic,
+                          sleep=clock.sleep)
+    scheduler.run(beats)
+    return scheduler, fired
+
+
+def test_due_times_do_not_drift():
+    pattern = parse_pattern('1:g 0.5:s 0.5:-', bpm=90)
+    # every callback takes most of a step; none of it carries over
+    work = {n: 0.3 for n in range(3000)}
+    scheduler, fired = run(pattern, beats=3000, work=work)
+    period = 2 * 60 / 90
+    last = fired[-1]
+    assert last.index == 2999
+    assert last.due == pytest.approx(100.0 + 999 * period + 1.5 * 60 / 90)
+    assert all(beat.late == 0 for beat in fired)
+    assert scheduler.counters['skipped'] == 0
+
+
+def test_late_beat_without_overrun_just_fires_late():
+    for policy in ('skip', 'catchup', 'shift'):
+        scheduler, fired = run([Step(0.5, 'g')], policy, beats=3,
+                               work={0: 0.7})
+        assert [b.index for b in fired] == [0, 1, 2]
+        assert fired[1].late == pytest.approx(0.2)
+        assert fired[2].late == 0
+        assert scheduler.counters['fired'] == 3
+
+
+def test_skip_drops_missed_beats():
+    scheduler, fired = run([Step(0.5, 'g')], 'skip', beats=3,
+                           work={0: 1.2})
+    assert [b.index for b in fired] == [0, 2, 3]
+    assert fired[1].late == pytest.approx(0.2)
+    assert fired[2].due == pytest.approx(101.5)
+    assert scheduler.counters['skipped'] == 1
+
+
+def test_catchup_fires_missed_beats_back_to_back():
+    scheduler, fired = run([Step(0.5, 'g')], 'catchup', beats=4,
+                           work={0: 1.2})
+    assert [b.index for b in fired] == [0, 1, 2, 3]
+    assert [b.late for b in fired] == pytest.approx([0, 0.7, 0.2, 0])
+    assert scheduler.counters['caught_up'] == 1
+
+
+def test_shift_records_lateness_then_moves_the_grid():
+    scheduler, fired = run([Step(0.5, 'g')], 'shift', beats=3,
+                           work={0: 1.2})
+    assert [b.index for b in fired] == [0, 1, 2]
+    assert fired[1].late == pytest.approx(0.7)
+    assert scheduler.max_late == pytest.approx(0.7)
+    assert scheduler.jitter.percentile(1.0) == pytest.approx(0.7)
+    # the rest of the rhythm follows from the beat that overran
+    assert fired[1].due == pytest.approx(101.2)
+    assert fired[2].due == pytest.approx(101.7)
+    assert fired[2].late == 0
+    assert scheduler.counters['shifted'] == 1